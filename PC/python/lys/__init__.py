@@ -1,7 +1,37 @@
-import dbg
-import lcli
-import lys
-import maker
-import rtt
+"""The submodules are imported the first time they are accessed as attributes
+of the package (e.g. lys.lcli) so that users of the codec alone don't load
+the J-Link bindings or any other dependencies.
 
-__all__ = ["dbg", "lcli", "lys", "maker", "rtt"]
+"""
+import sys
+import types
+import importlib
+
+__all__ = ["capture", "checkpoint", "dbg", "framescan", "lcli", "logreader",
+    "logstore", "lys", "lysd", "maker", "metrics", "reprfile", "rtt", "stats",
+    "strtab", "sweep", "telemetry", "tracer"]
+
+
+class _LazyPackage(types.ModuleType):
+    """Stands in for this package in sys.modules and imports submodules on
+    first access.
+
+    """
+
+    def __getattr__(self, name):
+        if (name in __all__):
+            module = importlib.import_module('.' + name, self.__name__)
+            setattr(self, name, module)
+            return module
+        raise AttributeError("'module' object has no attribute '%s'" % name)
+
+    def __dir__(self):
+        return sorted(set(self.__dict__.keys() + __all__))
+
+
+_package = _LazyPackage(__name__, __doc__)
+_package.__dict__.update(globals())
+# The original module is kept alive because Python 2 clears the globals of a
+# module when it is deallocated.
+_package._module = sys.modules[__name__]
+sys.modules[__name__] = _package
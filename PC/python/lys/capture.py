@@ -0,0 +1,246 @@
+"""Records the raw bytes that pass through an RTT socket and plays them back
+later without a board. A capture file starts with a header:
+
+    [MAGIC (4)][VERSION (1)][SN (4)]
+
+and is followed by one record per chunk that was read from or written to the
+socket:
+
+    [DIRECTION (1)][TIMESTAMP_S (8)][LEN (4)][DATA (LEN)]
+
+where DIRECTION is CAPTURE_RX, CAPTURE_TX, or CAPTURE_BULK_RX (data that
+was read from a separate bulk RTT channel) and TIMESTAMP_S is a double that
+holds the number of seconds since the capture was started. All values are
+little-endian.
+
+"""
+import time
+import struct
+import threading
+import Queue
+
+import rtt
+
+
+CAPTURE_MAGIC = 'LYSC'
+CAPTURE_VERSION = 1
+
+CAPTURE_RX = 0
+CAPTURE_TX = 1
+CAPTURE_BULK_RX = 2
+
+_HEADER = struct.Struct('<4sBI')
+_RECORD = struct.Struct('<BdI')
+
+
+class CaptureError(Exception):
+    """Subclass for reporting errors."""
+    pass
+
+
+class CaptureWriter(object):
+    """Appends RX and TX chunks to a capture file. Safe to use from the RTT
+    thread while other threads close it.
+
+    """
+
+    def __init__(self, path, sn):
+        """Creates the capture file and writes its header."""
+        try:
+            self._file = open(path, 'wb')
+        except IOError as err:
+            raise CaptureError("Could not open capture file: %s" %
+                err.strerror)
+        self._file.write(_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION, sn))
+        self._lock = threading.Lock()
+        self._t0 = time.time()
+        self.closed = False
+
+    def write_rx(self, data_str):
+        """Records a chunk that was read from the socket."""
+        self._write(CAPTURE_RX, data_str)
+
+    def write_tx(self, data_str):
+        """Records a chunk that was written to the socket."""
+        self._write(CAPTURE_TX, data_str)
+
+    def write_bulk_rx(self, data_str):
+        """Records a chunk that was read from the bulk channel."""
+        self._write(CAPTURE_BULK_RX, data_str)
+
+    def close(self):
+        """Closes the file. Chunks that arrive afterward are dropped."""
+        with self._lock:
+            if (not self.closed):
+                self.closed = True
+                self._file.close()
+
+    def _write(self, direction, data_str):
+        """"""
+        t = (time.time() - self._t0)
+        with self._lock:
+            if (self.closed):
+                return
+            self._file.write(_RECORD.pack(direction, t, len(data_str)))
+            self._file.write(data_str)
+
+
+class CaptureReader(object):
+    """Reads a capture file. Iterating over the object yields
+    (direction, timestamp_s, data_str) tuples in the order they were recorded.
+
+    """
+
+    def __init__(self, path):
+        """Opens the file and reads its header."""
+        try:
+            with open(path, 'rb') as f:
+                self._data = f.read()
+        except IOError as err:
+            raise CaptureError("Could not open capture file: %s" %
+                err.strerror)
+
+        if (len(self._data) < _HEADER.size):
+            raise CaptureError("Capture file is too short.")
+
+        magic, version, self.sn = _HEADER.unpack_from(self._data, 0)
+        if (CAPTURE_MAGIC != magic):
+            raise CaptureError("Not a Lys capture file.")
+        if (CAPTURE_VERSION != version):
+            raise CaptureError("Unsupported capture version: %d" % version)
+
+    def __iter__(self):
+        offset = _HEADER.size
+        end = len(self._data)
+        while (offset < end):
+            if ((end - offset) < _RECORD.size):
+                raise CaptureError("Truncated record header.")
+            direction, t, length = _RECORD.unpack_from(self._data, offset)
+            offset += _RECORD.size
+            if ((end - offset) < length):
+                raise CaptureError("Truncated record data.")
+            yield (direction, t, self._data[offset:offset + length])
+            offset += length
+
+    def rx_chunks(self):
+        """Yields (timestamp_s, data_str) tuples for the RX records only."""
+        for direction, t, data_str in self:
+            if (CAPTURE_RX == direction):
+                yield (t, data_str)
+
+
+def replay(path, parse_func, realtime=False, skip_banner=True):
+    """Feeds every RX chunk from a capture file to parse_func (e.g.
+    Lys.parse). If realtime is True then the original timing between chunks is
+    reproduced, otherwise the chunks are delivered as fast as possible. The
+    J-Link's banner is skipped (up to and including the chunk that holds
+    'Process: ') unless skip_banner is False; a CaptureError is raised if
+    the banner doesn't end. Returns the number of chunks that were delivered.
+
+    """
+    count = 0
+    start = time.time()
+    in_banner = skip_banner
+    for t, data_str in CaptureReader(path).rx_chunks():
+        if (in_banner):
+            in_banner = ('Process: ' not in data_str)
+            continue
+        if (realtime):
+            delay = (t - (time.time() - start))
+            if (delay > 0):
+                time.sleep(delay)
+        parse_func(data_str)
+        count += 1
+    if (in_banner):
+        raise CaptureError("The J-Link's banner doesn't end in: %s" % path)
+    return count
+
+
+class ReplayRTT(rtt.RTT):
+    """Stands in for an rtt.RTT object by reading events from a capture file
+    instead of a socket. Anything that is written is discarded.
+
+    """
+
+    # Replays would count the recorded board's traffic and sessions again.
+    METRICS = False
+
+    def __init__(self, path, debug_log=None, tracer=None, realtime=False):
+        """Opens the capture file and starts a replay thread."""
+        reader = CaptureReader(path)
+        self._init_state(reader.sn, debug_log, tracer)
+
+        self._thread = ReplayThread(reader,
+            self.rxQueue,
+            self.txQueue,
+            realtime,
+            self.bulkQueue)
+        self._thread.start()
+
+
+class ReplayThread(threading.Thread):
+    """Puts the RX chunks from a capture file into an RTT rxQueue and the bulk
+    RX chunks into a bulkQueue. When the capture runs out an RTT_EVENT_IDLE
+    event is followed by an RTT_EVENT_ERROR event so that a consumer that has
+    not finished will stop.
+
+    """
+
+    def __init__(self,
+                    reader,
+                    rx_queue,
+                    tx_queue,
+                    realtime=False,
+                    bulk_queue=None):
+        """Creates a new object but does not start the thread."""
+        super(ReplayThread, self).__init__()
+        self.daemon = True
+
+        self.rxQueue = rx_queue
+        self.txQueue = tx_queue
+        self.bulkQueue = bulk_queue
+
+        self._reader = reader
+        self._realtime = realtime
+        self._stop = threading.Event()
+
+    def run(self):
+        """Delivers the capture until it runs out or the semaphore is set."""
+        try:
+            start = time.time()
+            for direction, t, data_str in self._reader:
+                if (self._stop.is_set()):
+                    return
+                if (CAPTURE_TX == direction):
+                    continue
+                if (self._realtime):
+                    delay = (t - (time.time() - start))
+                    if (delay > 0):
+                        self._stop.wait(delay)
+                event = rtt.RTTEvent(rtt.RTT_EVENT_RX, data_str)
+                if (CAPTURE_BULK_RX == direction):
+                    if (self.bulkQueue is not None):
+                        self.bulkQueue.put(event)
+                else:
+                    self.rxQueue.put(event)
+                self._drain_tx()
+        except CaptureError as err:
+            event = rtt.RTTEvent(rtt.RTT_EVENT_ERROR, err_str=err.message)
+            self.rxQueue.put(event)
+            return
+
+        self.rxQueue.put(rtt.IDLE_EVENT)
+        event = rtt.RTTEvent(rtt.RTT_EVENT_ERROR, err_str='End of capture.')
+        self.rxQueue.put(event)
+
+    def close(self):
+        """Sets the semaphore to instruct the thread to close."""
+        self._stop.set()
+
+    def _drain_tx(self):
+        """Discards anything that has been written."""
+        try:
+            while (True):
+                self.txQueue.get_nowait()
+        except Queue.Empty:
+            pass
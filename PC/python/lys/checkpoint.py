@@ -0,0 +1,116 @@
+"""An append-only journal that records the outcome of every sweep point so
+that a sweep that dies can be resumed without running its completed points
+again. Each line is the repr of a dictionary:
+
+    {'status': 'done', 'init_params': [...], 'attempts': 1,
+        'result': {...}, 'time': 1476000000.0}
+
+where the status is 'done' if the last attempt succeeded or 'failed' if the
+retries ran out. Lines are flushed and synced as they are written so at most
+the final line can be lost (or cut short) by a crash; an unfinished final
+line is removed when the journal is opened again. An outcome that can't be
+written (or read back) is left out, so the point is run again when the sweep
+is resumed, instead of ending the sweep.
+
+"""
+import os
+import time
+
+import reprfile
+
+
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+class CheckpointError(Exception):
+    """Subclass for reporting errors."""
+    pass
+
+
+class Journal(object):
+    """Reads any existing entries from the file at path and appends new
+    ones to it.
+
+    """
+
+    def __init__(self, path):
+        """Opens (or creates) the journal."""
+        self.path = path
+        self.entries = {}
+
+        data = ''
+        if (os.path.exists(path)):
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except IOError as err:
+                raise CheckpointError("Could not read journal: %s" %
+                    err.strerror)
+
+        # Every line ends with a newline so anything after the last one was
+        # cut short by a crash and is dropped.
+        data = data[:data.rfind('\n') + 1]
+        for i, line in enumerate(data.split('\n')):
+            if (not line.strip()):
+                continue
+            try:
+                entry = reprfile.literal_eval(line)
+            except (SyntaxError, ValueError):
+                raise CheckpointError("Malformed journal line: %d" % (i + 1))
+            self.entries[repr(entry['init_params'])] = entry
+
+        try:
+            self._file = open(path, 'ab')
+        except IOError as err:
+            raise CheckpointError("Could not open journal: %s" % err.strerror)
+        self._file.truncate(len(data))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def is_done(self, init_params):
+        """Returns True if the point has completed successfully."""
+        entry = self.entries.get(repr(init_params))
+        return ((entry is not None) and (STATUS_DONE == entry['status']))
+
+    def result(self, init_params):
+        """Returns the journaled result_dict of the point or None."""
+        entry = self.entries.get(repr(init_params))
+        if (entry is None):
+            return None
+        return entry['result']
+
+    def append(self, init_params, status, result_dict, attempts):
+        """Records the outcome of a point. Returns False if it couldn't be
+        journaled (see above).
+
+        """
+        entry = {'status': status,
+            'init_params': init_params,
+            'attempts': attempts,
+            'result': result_dict,
+            'time': time.time()}
+        line = repr(entry)
+        try:
+            reprfile.literal_eval(line)
+        except (SyntaxError, ValueError):
+            return False
+        size = os.fstat(self._file.fileno()).st_size
+        try:
+            self._file.write(line + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except (IOError, OSError):
+            # Part of the line may have been written before the error.
+            try:
+                self._file.truncate(size)
+            except (IOError, OSError):
+                pass
+            return False
+        self.entries[repr(init_params)] = entry
+        return True
+
+    def close(self):
+        """Closes the file."""
+        self._file.close()
@@ -1,57 +1,242 @@
-from pynrfjprog import MultiAPI
+import time
+import atexit
+import threading
 
 
 DEFAULT_FAMILY = 'NRF52'
 
+# How long the result of enum_jlinks is reused before the USB bus is checked
+# again.
+ENUM_TTL_S = 2.0
 
-# This module only uses one pynrfjprog.API.API object at any given time.
-_api = None
+# pynrfjprog loads the J-Link DLL bindings so it is imported on first use.
+MultiAPI = None
 
 
-def enum_jlinks():
-	"""Returns a list of attached J-Link debuggers or None."""
-	result = None
-	if (_api is None):
-		api = MultiAPI.MultiAPI(DEFAULT_FAMILY)
-		api.open()
-		result = api.enum_emu_snr()
-		api.close()
-	else:
-		result = api.enum_emu_snr()
-	return result
+class DebuggerError(Exception):
+	"""Subclass for reporting errors."""
+	pass
+
+
+def _multi_api(family):
+	"""Returns a new, unopened pynrfjprog.MultiAPI object."""
+	global MultiAPI
+	if (MultiAPI is None):
+		from pynrfjprog import MultiAPI
+	return MultiAPI.MultiAPI(family)
+
+
+class Debugger(object):
+	"""Owns the pynrfjprog.MultiAPI object for a single J-Link. Any number of
+	these can be attached at the same time (e.g. by lysd) and each one stays
+	attached until it is closed.
+
+	"""
+
+	def __init__(self, serial_number, family=DEFAULT_FAMILY):
+		"""Opens the API and connects to the J-Link with the given serial
+		number. The target is not reset.
+
+		"""
+		if (isinstance(serial_number, str)):
+			serial_number = int(serial_number)
+		self.sn = serial_number
+
+		# Serializes access to _api so that RTT channels can be read from
+		# another thread.
+		self._lock = threading.Lock()
+		self._rttStarted = False
+		self._api = _multi_api(family)
+		self._api.open()
+		self._api.connect_to_emu_with_snr(serial_number)
+
+	def enum_jlinks(self):
+		"""Returns a list of attached J-Link debuggers or None."""
+		self._check_open()
+		with self._lock:
+			return self._api.enum_emu_snr()
+
+	def reset(self):
+		"""Resets the target. RTT must be started again afterward."""
+		self._check_open()
+		with self._lock:
+			if (self._rttStarted):
+				self._api.rtt_stop()
+				self._rttStarted = False
+			self._api.sys_reset()
+
+	def go(self):
+		""""""
+		self._check_open()
+		with self._lock:
+			self._api.go()
+
+	def rtt_start(self):
+		"""Starts pynrfjprog's RTT functionality so that channels can be read
+		and written without the J-Link's RTT socket.
+
+		"""
+		self._check_open()
+		with self._lock:
+			self._api.rtt_start()
+			self._rttStarted = True
+
+	def rtt_read(self, channel, length):
+		"""Returns up to length bytes from the given RTT up channel. Returns an
+		empty str if the firmware's RTT control block hasn't been found yet.
+
+		"""
+		self._check_rtt()
+		with self._lock:
+			if (not self._api.rtt_is_control_block_found()):
+				return ''
+			return self._api.rtt_read(channel, length)
+
+	def rtt_write(self, channel, data_str):
+		"""Writes data_str to the given RTT down channel. Returns the number
+		of bytes that were written, which is zero if the firmware's RTT control
+		block hasn't been found yet.
+
+		"""
+		self._check_rtt()
+		with self._lock:
+			if (not self._api.rtt_is_control_block_found()):
+				return 0
+			return self._api.rtt_write(channel, data_str)
+
+	def close(self):
+		""""""
+		self._check_open()
+
+		# For some reason the J-Link driver is happier if rtt_stop is called
+		# (even though rtt_start is not used). If it's not called then
+		# "*** J-Link V5.12 Internal Error ***" strings are printed to stderr
+		# with "NET_WriteRead(): USB communication not locked" and
+		# "PID0000129E (python2.7): Lock count error (decrement)" errors.
+		with self._lock:
+			self._api.rtt_stop()
+
+			self._api.close()
+			self._api = None
+			self._rttStarted = False
+
+	def _check_open(self):
+		""""""
+		if (self._api is None):
+			raise DebuggerError("The debugger has been closed.")
+
+	def _check_rtt(self):
+		""""""
+		self._check_open()
+		if (not self._rttStarted):
+			raise DebuggerError("Can not use RTT without first calling " +
+				"rtt_start.")
+
+
+# The module-level functions only use one Debugger object at any given time.
+_debugger = None
+
+# Enumeration results are cached and the MultiAPI object that is used for
+# enumerating (when no debugger is attached) is kept open between calls.
+_enumLock = threading.Lock()
+_enumApi = None
+_jlinks = None
+_jlinksTime = 0
+
+
+def enum_jlinks(refresh=False, ttl_s=ENUM_TTL_S):
+	"""Returns a list of attached J-Link debuggers or None. The previous result
+	is returned if it is less than ttl_s seconds old unless refresh is True.
+
+	"""
+	global _enumApi, _jlinks, _jlinksTime
+	with _enumLock:
+		if ((not refresh) and
+				(_jlinksTime > 0) and
+				((time.time() - _jlinksTime) < ttl_s)):
+			return _copy(_jlinks)
+
+		if (_debugger is not None):
+			result = _debugger.enum_jlinks()
+		else:
+			if (_enumApi is None):
+				_enumApi = _multi_api(DEFAULT_FAMILY)
+				_enumApi.open()
+			result = _enumApi.enum_emu_snr()
+
+		_jlinks = _copy(result)
+		_jlinksTime = time.time()
+		return result
+
+
+def has_jlink(serial_number):
+	"""Returns True if the J-Link with the given serial number is attached.
+	The cached enumeration is used when it contains the serial number and is
+	refreshed otherwise in case the debugger was just plugged in.
+
+	"""
+	if (isinstance(serial_number, str)):
+		serial_number = int(serial_number)
+	jlinks = enum_jlinks()
+	if (jlinks and (serial_number in jlinks)):
+		return True
+	jlinks = enum_jlinks(refresh=True)
+	return bool(jlinks and (serial_number in jlinks))
+
+
+def _copy(jlinks):
+	""""""
+	if (jlinks is None):
+		return None
+	return list(jlinks)
+
+
+def _close_enum_api():
+	"""Closes the enumeration MultiAPI object and clears the cache."""
+	global _enumApi, _jlinks, _jlinksTime
+	with _enumLock:
+		if (_enumApi is not None):
+			_enumApi.close()
+			_enumApi = None
+		_jlinks = None
+		_jlinksTime = 0
+
+atexit.register(_close_enum_api)
 
 
 def attach_and_reset(serial_number, family=DEFAULT_FAMILY):
 	""""""
-	global _api
-	if (_api is not None):
+	global _debugger
+	if (_debugger is not None):
 		raise Exception("Only one debugger can be connected at a time.")
-	if (isinstance(serial_number, str)):
-		serial_number = int(serial_number)
-	_api = MultiAPI.MultiAPI(family)
-	_api.open()
-	_api.connect_to_emu_with_snr(serial_number)
-	_api.sys_reset()
+	_debugger = Debugger(serial_number, family)
+	_debugger.reset()
 
 
 def go():
 	""""""
-	if (_api is None):
+	if (_debugger is None):
 		raise Exception("Can not go without first attaching and resetting.")
-	_api.go()
+	_debugger.go()
 
 
-def close():
-	global _api
-	if (_api is None):
-		raise Exception("Close called without first attaching.")
+def rtt_start():
+	"""See Debugger.rtt_start."""
+	if (_debugger is None):
+		raise Exception("Can not start RTT without first attaching.")
+	_debugger.rtt_start()
+
 
-	# For some reason the J-Link driver is happier if rtt_stop is called
-	# (even though rtt_start is not used). If it's not called then
-	# "*** J-Link V5.12 Internal Error ***" strings are printed to stderr with
-	# "NET_WriteRead(): USB communication not locked" and
-	# "PID0000129E (python2.7): Lock count error (decrement)" errors.
-	_api.rtt_stop()
+def rtt_read(channel, length):
+	"""See Debugger.rtt_read."""
+	if (_debugger is None):
+		raise Exception("Can not read RTT without first attaching.")
+	return _debugger.rtt_read(channel, length)
 
-	_api.close()
-	_api = None
+
+def close():
+	global _debugger
+	if (_debugger is None):
+		raise Exception("Close called without first attaching.")
+	_debugger.close()
+	_debugger = None
@@ -0,0 +1,403 @@
+"""Decodes a whole buffer of Lys messages at once for offline analysis (e.g.
+of a day of captured telemetry). The buffer is scanned for message boundaries
+in a single pass and the payloads are then decoded with NumPy, one param type
+at a time, instead of creating Python objects for every message:
+
+    frames = framescan.from_capture('session.lysc', bulk=True)
+    temps = frames.telemetry()['LYS_PARAM_TYPE_INT32'].values
+    results = frames.params()
+
+Every decoded group of messages is a Group whose values are a flat array with
+counts[i] values for the message frames[i] (an index into the Frames arrays).
+Strings (and BYTES) aren't copied out of the buffer; their groups have starts
+and counts that locate each string in Frames.data instead. The params packed
+into LYS_OP_PARAMS messages are grouped with the LYS_OP_PARAM messages, so a
+frame index can appear more than once in a group. Compressed arrays are
+decoded into the same dtypes as plain arrays but are grouped separately under
+'LYS_PARAM_TYPE_DELTA_ARRAY:' + the item type.
+
+NumPy is only required by this module.
+
+"""
+import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import lys
+import capture
+import telemetry
+
+
+# The header of a LYS_OP_TELEMETRY message.
+TELEMETRY_HEADER_DTYPE = [('len', 'u1'), ('op', 'u1'), ('param_type', 'u1'),
+    ('seq', '<u2'), ('timestamp', '<u4')]
+
+
+class FrameScanError(Exception):
+    """Subclass for reporting errors."""
+    pass
+
+
+class Group(object):
+    """The decoded payloads of the messages that share an op and a param
+    type. The seq and timestamp arrays are only set for telemetry and the
+    starts array is only set for strings, whose values are None.
+
+    """
+
+    def __init__(self, frames, counts, values, starts=None):
+        self.frames = frames
+        self.counts = counts
+        self.values = values
+        self.starts = starts
+        self.seq = None
+        self.timestamp = None
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def offsets(self):
+        """The index in values of the first value of every message."""
+        return (numpy.cumsum(self.counts) - self.counts)
+
+    def split(self):
+        """Returns a list with one array of values per message."""
+        return numpy.split(self.values, numpy.cumsum(self.counts)[:-1])
+
+
+class Frames(object):
+    """The messages in a buffer. The offsets, lengths, and ops arrays have one
+    entry per complete message. Scanning stops at the end of the buffer or at
+    a length that can't be valid, in which case end is less than len(data).
+
+    """
+
+    def __init__(self, data_str):
+        """Scans data_str for messages."""
+        if (numpy is None):
+            raise FrameScanError("NumPy is required for frame scanning.")
+        self.data = numpy.frombuffer(data_str, dtype='u1')
+        offsets, self.end = _scan(bytearray(data_str))
+        self.offsets = numpy.frombuffer(offsets, dtype=numpy.int_).astype(
+            numpy.int64)
+        self.lengths = self.data[self.offsets].astype(numpy.int64)
+        self.ops = self.data[self.offsets + 1]
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def counts(self):
+        """Returns a dictionary of message counts keyed by op."""
+        ops, counts = numpy.unique(self.ops, return_counts=True)
+        return dict((lys.LysOp.OP_TYPES.get(op, op), n)
+            for op, n in zip(ops.tolist(), counts.tolist()))
+
+    def params(self, op=lys.LYS_OP_PARAM):
+        """Returns a dictionary of Groups keyed by param type str for the
+        LYS_OP_PARAM (or LYS_OP_LOG) messages. Arrays are grouped by the type
+        of their items under 'LYS_PARAM_TYPE_ARRAY:' (or
+        'LYS_PARAM_TYPE_DELTA_ARRAY:') + the item type.
+
+        """
+        op = lys.LysOp.find_op(op)
+        if (op not in (lys.LYS_OP_PARAM, lys.LYS_OP_LOG)):
+            raise FrameScanError("Only PARAM and LOG messages have params.")
+
+        frames = numpy.flatnonzero(self.ops == op)
+        offsets = self.offsets[frames]
+        lengths = self.lengths[frames]
+        if (lys.LYS_OP_PARAM == op):
+            frames, offsets, lengths = self._add_packed(frames,
+                offsets,
+                lengths)
+        valid = (lengths >= 3)
+        frames = frames[valid]
+        offsets = offsets[valid]
+        lengths = lengths[valid]
+
+        param_types = self.data[offsets + 2]
+        groups = {}
+        for param_type in numpy.unique(param_types).tolist():
+            mask = (param_types == param_type)
+            spans = (offsets[mask], lengths[mask])
+            name = lys.LysData.PARAM_TYPES.get(param_type)
+            if (lys.LYS_PARAM_TYPE_ARRAY == param_type):
+                self._add_arrays(groups, frames[mask], spans)
+            elif (lys.LYS_PARAM_TYPE_DELTA_ARRAY == param_type):
+                self._add_delta_arrays(groups, frames[mask], spans)
+            elif (param_type in (lys.LYS_PARAM_TYPE_STRING,
+                    lys.LYS_PARAM_TYPE_BYTES)):
+                groups[name] = self._strings(frames[mask], 3, spans)
+            elif (telemetry.DTYPES.has_key(name)):
+                groups[name] = self._values(frames[mask],
+                    3,
+                    telemetry.DTYPES[name],
+                    spans)
+        return groups
+
+    def telemetry(self):
+        """Returns a dictionary of Groups keyed by param type str for the
+        LYS_OP_TELEMETRY messages.
+
+        """
+        header_len = lys.LYS_TELEMETRY_HEADER_LEN
+        frames = numpy.flatnonzero(self.ops == lys.LYS_OP_TELEMETRY)
+        frames = frames[self.lengths[frames] >= header_len]
+        headers = self._gather(frames, 0, header_len).view(
+            TELEMETRY_HEADER_DTYPE).ravel()
+        groups = {}
+        for param_type in numpy.unique(headers['param_type']).tolist():
+            mask = (headers['param_type'] == param_type)
+            name = lys.LysData.PARAM_TYPES.get(param_type)
+            if (not telemetry.DTYPES.has_key(name)):
+                continue
+            group = self._values(frames[mask],
+                header_len,
+                telemetry.DTYPES[name])
+            group.seq = headers['seq'][mask]
+            group.timestamp = headers['timestamp'][mask]
+            groups[name] = group
+        return groups
+
+    def log_fmt(self):
+        """Returns a Group for the LYS_OP_LOG_FMT messages whose values are
+        the args and whose starts are the format string IDs.
+
+        """
+        frames = numpy.flatnonzero(self.ops == lys.LYS_OP_LOG_FMT)
+        frames = frames[self.lengths[frames] >= 4]
+        group = self._values(frames, 4, '<u4')
+        group.starts = self._gather(frames, 2, 2).view('<u2').ravel()
+        return group
+
+    def string(self, group, i):
+        """Returns the i-th str of a string Group."""
+        start = group.starts[i]
+        return self.data[start:(start + group.counts[i])].tostring()
+
+    def _spans(self, frames, spans):
+        """Returns the (offsets, lengths) of the messages, which are given by
+        spans for the params that were packed into LYS_OP_PARAMS messages.
+
+        """
+        if (spans is None):
+            return (self.offsets[frames], self.lengths[frames])
+        return spans
+
+    def _gather(self, frames, skip, count, spans=None):
+        """Returns a (len(frames), count) array of the bytes that start skip
+        bytes into each message.
+
+        """
+        offsets = self._spans(frames, spans)[0]
+        index = ((offsets + skip)[:, None] +
+            numpy.arange(count, dtype=numpy.int64))
+        return self.data[index]
+
+    def _values(self, frames, skip, dtype, spans=None):
+        """Decodes the items of the given dtype that follow skip bytes of
+        header in each message.
+
+        """
+        offsets, lengths = self._spans(frames, spans)
+        dtype = numpy.dtype(dtype)
+        counts = ((lengths - skip) // dtype.itemsize)
+        nbytes = (counts * dtype.itemsize)
+        if (not len(frames)):
+            return Group(frames, counts, numpy.empty(0, dtype=dtype))
+
+        if (numpy.all(counts == counts[0])):
+            # The usual case: every message holds the same number of items.
+            values = self._gather(frames,
+                skip,
+                int(nbytes[0]),
+                (offsets, lengths)).ravel()
+        else:
+            starts = (offsets + skip)
+            index = (numpy.repeat(starts - (numpy.cumsum(nbytes) - nbytes),
+                    nbytes) +
+                numpy.arange(nbytes.sum(), dtype=numpy.int64))
+            values = self.data[index]
+        return Group(frames, counts, values.view(dtype))
+
+    def _strings(self, frames, skip, spans=None):
+        """Locates the strs that follow skip bytes of header in each
+        message.
+
+        """
+        offsets, lengths = self._spans(frames, spans)
+        return Group(frames, (lengths - skip), None, (offsets + skip))
+
+    def _add_arrays(self, groups, frames, spans=None):
+        """Adds a Group for each item type of LYS_PARAM_TYPE_ARRAY
+        messages.
+
+        """
+        offsets, lengths = self._spans(frames, spans)
+        valid = (lengths >= 4)
+        frames = frames[valid]
+        offsets = offsets[valid]
+        lengths = lengths[valid]
+        item_types = self.data[offsets + 3]
+        for item_type in numpy.unique(item_types).tolist():
+            name = lys.LysData.PARAM_TYPES.get(item_type)
+            if (not telemetry.DTYPES.has_key(name)):
+                continue
+            mask = (item_types == item_type)
+            groups['LYS_PARAM_TYPE_ARRAY:' + name] = self._values(frames[mask],
+                4,
+                telemetry.DTYPES[name],
+                (offsets[mask], lengths[mask]))
+
+    def _add_delta_arrays(self, groups, frames, spans):
+        """Adds a Group for each item type of LYS_PARAM_TYPE_DELTA_ARRAY
+        messages. The varints of every message are decoded at once; a varint
+        that is cut short by the end of its message is ended there.
+
+        """
+        offsets, lengths = spans
+        valid = (lengths >= 5)
+        frames = frames[valid]
+        offsets = offsets[valid]
+        lengths = lengths[valid]
+        item_types = self.data[offsets + 3]
+        for item_type in numpy.unique(item_types).tolist():
+            name = lys.LysData.PARAM_TYPES.get(item_type)
+            if (name not in lys.LysData.DELTA_TYPES):
+                continue
+            mask = (item_types == item_type)
+            groups['LYS_PARAM_TYPE_DELTA_ARRAY:' + name] = self._deltas(
+                frames[mask],
+                offsets[mask],
+                lengths[mask],
+                telemetry.DTYPES[name])
+
+    def _deltas(self, frames, offsets, lengths, dtype):
+        """Decodes the varints that follow the four byte header of each
+        LYS_PARAM_TYPE_DELTA_ARRAY message.
+
+        """
+        nbytes = (lengths - 4)
+        total = int(nbytes.sum())
+        positions = numpy.arange(total, dtype=numpy.int64)
+        byte_starts = (numpy.cumsum(nbytes) - nbytes)
+        b = self.data[numpy.repeat((offsets + 4) - byte_starts, nbytes) +
+            positions].astype(numpy.uint64)
+
+        # Every varint ends at a byte without the high bit set.
+        ends = ((b & numpy.uint64(0x80)) == 0)
+        ends[(byte_starts + nbytes) - 1] = True
+        firsts = numpy.empty(total, dtype=bool)
+        firsts[0] = True
+        firsts[1:] = ends[:-1]
+        first_positions = numpy.flatnonzero(firsts)
+
+        # Each byte holds 7 bits of its varint, least significant first.
+        shifts = (7 * (positions - numpy.maximum.accumulate(
+            numpy.where(firsts, positions, 0))))
+        bits = (b & numpy.uint64(0x7F))
+        bits[shifts >= 64] = 0
+        zigzag = numpy.add.reduceat(bits << numpy.minimum(shifts, 63).astype(
+                numpy.uint64),
+            first_positions)
+
+        one = numpy.uint64(1)
+        deltas = ((zigzag >> one) ^ (~(zigzag & one) + one))
+
+        # Each message's items are the running sum of its deltas.
+        counts = numpy.add.reduceat(ends.astype(numpy.int64), byte_starts)
+        sums = numpy.cumsum(deltas)
+        value_starts = (numpy.cumsum(counts) - counts)
+        bases = numpy.zeros(len(counts), dtype=numpy.uint64)
+        bases[1:] = sums[value_starts[1:] - 1]
+        values = (sums - numpy.repeat(bases, counts))
+
+        dtype = numpy.dtype(dtype)
+        if (numpy.bool_ == dtype.type):
+            values = ((values & numpy.uint64(0xFF)) != 0)
+        else:
+            values = values.astype(dtype.newbyteorder('='))
+        return Group(frames, counts, values)
+
+    def _add_packed(self, frames, offsets, lengths):
+        """Adds the params of the LYS_OP_PARAMS messages to the spans of the
+        LYS_OP_PARAM messages and returns the (frames, offsets, lengths) in
+        message order. Each packed [PLEN][PARAM_TYPE][DATA] is given the span
+        of the LYS_OP_PARAM message that it would otherwise have been, which
+        starts two bytes before its PARAM_TYPE and is (PLEN + 1) bytes long.
+
+        """
+        packed = numpy.flatnonzero(self.ops == lys.LYS_OP_PARAMS)
+        if (not len(packed)):
+            return (frames, offsets, lengths)
+
+        data = self.data
+        extra = ([], [], [])
+        for frame in packed.tolist():
+            offset = int(self.offsets[frame])
+            end = (offset + int(self.lengths[frame]))
+            p = (offset + 2)
+            while (p < end):
+                plen = int(data[p])
+                if ((2 > plen) or ((p + plen) > end)):
+                    break
+                extra[0].append(frame)
+                extra[1].append(p - 1)
+                extra[2].append(plen + 1)
+                p += plen
+
+        frames = numpy.concatenate((frames,
+            numpy.array(extra[0], dtype=frames.dtype)))
+        offsets = numpy.concatenate((offsets,
+            numpy.array(extra[1], dtype=numpy.int64)))
+        lengths = numpy.concatenate((lengths,
+            numpy.array(extra[2], dtype=numpy.int64)))
+        order = numpy.argsort(offsets, kind='mergesort')
+        return (frames[order], offsets[order], lengths[order])
+
+
+def _scan(data):
+    """Returns an array.array of the offset of every complete message in the
+    bytearray and the offset where scanning stopped.
+
+    """
+    offsets = array.array('l')
+    append = offsets.append
+    offset = 0
+    end = len(data)
+    while (offset < end):
+        length = data[offset]
+        if ((2 > length) or (lys.LYS_MAX_MSG_LEN < length) or
+                ((end - offset) < length)):
+            break
+        append(offset)
+        offset += length
+    return (offsets, offset)
+
+
+def from_capture(path, bulk=False):
+    """Returns the Frames in the RX data of a capture file. The control
+    channel data starts with the J-Link's banner, which is skipped; with bulk
+    set the bulk channel is scanned instead.
+
+    """
+    chunks = []
+    started = bulk
+    for direction, t, data_str in capture.CaptureReader(path):
+        if (bulk):
+            if (capture.CAPTURE_BULK_RX == direction):
+                chunks.append(data_str)
+        elif (capture.CAPTURE_RX == direction):
+            if (started):
+                chunks.append(data_str)
+            elif ('Process: ' in data_str):
+                # Everything up to the chunk with the serial number is banner.
+                del chunks[:]
+                started = True
+            else:
+                chunks.append(data_str)
+    return Frames(''.join(chunks))
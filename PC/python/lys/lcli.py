@@ -10,10 +10,14 @@ needs to be done once. The default make target is 'flash_debug'.
 
 For convenience, the LCLI class allows parameters and results to be passed as
 tuples in the form (TYPE, VALUE) where TYPE can be one of the following
-strings: UINT32, INT32, UINT8, INT8, BOOL, STRING. The VALUE will be converted
-to and from the corresponding TYPE. Arrays can be created by supplying an array
-of items of the specified TYPE e.g. ('INT8', [-2, -1, 0, 128]). Results will be
-reported in a simplified format as well.
+strings: UINT32, INT32, UINT16, INT16, UINT8, INT8, UINT64, INT64, FLOAT32,
+BOOL, STRING, BYTES. The VALUE will be converted to and from the corresponding
+TYPE. Arrays can be created by supplying an array of items of the specified
+TYPE e.g. ('INT8', [-2, -1, 0, 128]); STRING and BYTES values are strs and
+can't be array items. Prefixing an integer or BOOL TYPE with DELTA_ (e.g.
+('DELTA_UINT16', [1000, 1002, 1001])) sends the array in the compressed
+LYS_PARAM_TYPE_DELTA_ARRAY form. Results will be reported in a simplified
+format as well.
 
 Use either -h or --help to print the help menu from a command line.
 
@@ -23,12 +27,19 @@ import sys
 import argparse
 import threading
 import datetime
+import time
 import ast
+import Queue
 
 import maker
 import dbg
 import rtt
 import lys
+import tracer
+import capture
+import strtab
+import logstore
+import metrics
 
 
 EXIT_CODES = {
@@ -41,6 +52,18 @@ EXIT_CODES = {
     }
 
 
+# The phases of a session that can be given deadlines:
+#     BANNER - from opening RTT until the J-Link's serial number is confirmed
+#     INIT - from starting the firmware until LYS_OP_INIT is received
+#     ACK - from sending any message until its LYS_OP_ACK is received
+#     RUN - from the firmware's LYS_OP_START ACK until LYS_OP_RESULT
+#     RESULT - from LYS_OP_RESULT until LYS_OP_FINISHED
+DEADLINE_PHASES = ('BANNER', 'INIT', 'ACK', 'RUN', 'RESULT')
+
+# The number of bytes of each received chunk that the debug log shows.
+DEBUG_LOG_DATA_LEN = 16
+
+
 class LCLIError(Exception):
     """Subclass for reporting errors."""
 
@@ -58,22 +81,45 @@ class LCLI(object):
 
     TIMESTAMP_FMT = '%Y-%m-%d %H:%M:%S'
 
+    # How often deadlines are checked when no RTT events arrive.
+    DEADLINE_POLL_S = 0.1
+
     def __init__(self):
         """Creates a new object."""
         self.result = None
         self.error = False
         self.debugLog = []
-        self.lysLog = []
+        self.lysLog = logstore.LogStore()
         self._lys = None
         self._terminal = None
         self._timer = None
+        self._tracer = None
+        self._goFunc = None
+        self._strTable = None
+        self._telemetryCB = None
+        self._resultCB = None
+        self._keepResults = True
+        self._compactLog = False
+        self._deadlines = {}
+        self._phase = None
+        self._phaseStart = None
+        self.deadline = None
 
     def run(self,
                 sn,
                 init_params=None,
                 makefile_dir=None,
                 no_result=False,
-                timeout_s=None):
+                timeout_s=None,
+                trace_file=None,
+                capture_file=None,
+                elf_file=None,
+                telemetry_cb=None,
+                bulk_channel=None,
+                deadlines=None,
+                result_cb=None,
+                keep_results=True,
+                compact_log=False):
         """A serial number is always required. The init_params may or may not
         be required depending on the firmware. If a makefile_dir is specified
         then make will be called in that directory to compile and download the
@@ -81,30 +127,47 @@ class LCLI(object):
         and then the RTT terminal will be closed instead of waiting for it to
         finish. The timeout_s is similar to no_result except it waits the
         specified number of seconds after the firmware is started before
-        closing. Returns a dictionary with the following keys:
+        closing. If a trace_file is given then a timeline of the session is
+        written to it in Chrome trace format. If a capture_file is given then
+        the raw RTT traffic is recorded to it so that it can be passed to
+        replay later. If the firmware uses LYS_LOG_FMT then the elf_file that
+        was produced by the build is required to turn its log messages into
+        text. The telemetry_cb receives every batch of LYS_OP_TELEMETRY samples
+        (see telemetry.TelemetryStream). If the firmware was compiled with a
+        LYS_BULK_RTT_CHANNEL then the same number must be given as the
+        bulk_channel so that its logs and telemetry are read. The deadlines
+        are an optional dictionary that maps names from DEADLINE_PHASES to the
+        number of seconds that each phase may take before the session is
+        abandoned with an error (see DEADLINE_PHASES). The result_cb receives
+        the param_type and value of each result as soon as it arrives; if
+        keep_results is False then the results are not collected and 'RESULT'
+        will be None. If compact_log is True then the 'LOG' is the compact
+        dictionary form that is described in logstore.py instead of a list.
+        Returns a dictionary with the following keys:
             'INIT_PARAMS',
             'LOG',
             'RESULT',
             'TIMESTAMP',
             'ERROR',
-            'TIMEOUT_S' (optional)
+            'TIMEOUT_S' (optional),
+            'DEADLINE' (optional, the phase whose deadline passed)
         If present, the LOG data will be an array of log strings.
         """
-        if (no_result and timeout_s):
-            raise LCLIError('The no_result and timeout_s parameters ' +
-                'are mutually exclusive.',
-                EXIT_CODES['LCLI_EXIT_CODE_INVALID_PARAMS'])
-
-        self._no_result = no_result
-        self._timeout_s = timeout_s
+        self._setup(no_result,
+            timeout_s,
+            trace_file,
+            elf_file,
+            telemetry_cb,
+            deadlines,
+            result_cb,
+            keep_results,
+            compact_log)
 
         # Step 0: Ensure J-Link is attached (otherwise make could fail).
-        jlinks = dbg.enum_jlinks()
-        if (jlinks is None):
-            raise LCLIError('No J-Link debuggers found.',
-                EXIT_CODES['LCLI_EXIT_CODE_JLINK_NOT_FOUND'])
-
-        if (not sn in jlinks):
+        if (not dbg.has_jlink(sn)):
+            if (dbg.enum_jlinks() is None):
+                raise LCLIError('No J-Link debuggers found.',
+                    EXIT_CODES['LCLI_EXIT_CODE_JLINK_NOT_FOUND'])
             raise LCLIError('The specified J-Link was not found (SN=%d).' % sn,
                 EXIT_CODES['LCLI_EXIT_CODE_JLINK_NOT_FOUND'])
 
@@ -119,19 +182,183 @@ class LCLI(object):
 
         # Step 3: Open RTT socket.
         self.debugLog.append("[lcli] Opening RTT.")
-        self._terminal_interact(sn, init_params)
+        capture_writer = None
+        try:
+            if (capture_file):
+                capture_writer = capture.CaptureWriter(capture_file, sn)
+            bulk_read_func = None
+            if (bulk_channel is not None):
+                self.debugLog.append("[lcli] Reading bulk channel %d." %
+                    bulk_channel)
+                dbg.rtt_start()
+                bulk_read_func = lambda n: dbg.rtt_read(bulk_channel, n)
+            self._terminal_interact(rtt.RTT(sn,
+                    self.debugLog,
+                    self._tracer,
+                    capture_writer,
+                    bulk_read_func),
+                init_params,
+                dbg.go)
+        finally:
+            if (capture_writer):
+                capture_writer.close()
+            if (self._tracer):
+                self._tracer.save(trace_file)
+            # Release the debugger even if the session failed.
+            dbg.close()
+
+        return self._result_dict(init_params)
+
+    def replay(self,
+                capture_file,
+                init_params=None,
+                realtime=False,
+                no_result=False,
+                timeout_s=None,
+                trace_file=None,
+                elf_file=None,
+                telemetry_cb=None,
+                deadlines=None,
+                result_cb=None,
+                keep_results=True,
+                compact_log=False):
+        """Runs a session against a file that was recorded by passing
+        capture_file to run instead of a J-Link debugger. The RX traffic is
+        delivered at its original pace if realtime is True or as fast as
+        possible otherwise. The init_params should match the ones that were
+        used when the capture was recorded. Returns the same dictionary as run.
+
+        """
+        self._setup(no_result,
+            timeout_s,
+            trace_file,
+            elf_file,
+            telemetry_cb,
+            deadlines,
+            result_cb,
+            keep_results,
+            compact_log)
+
+        self.debugLog.append("[lcli] Replaying %s." % capture_file)
+        try:
+            self._terminal_interact(capture.ReplayRTT(capture_file,
+                    self.debugLog,
+                    self._tracer,
+                    realtime),
+                init_params)
+        finally:
+            if (self._tracer):
+                self._tracer.save(trace_file)
+
+        return self._result_dict(init_params)
+
+    def run_terminal(self,
+                        terminal,
+                        init_params=None,
+                        go_func=None,
+                        no_result=False,
+                        timeout_s=None,
+                        trace_file=None,
+                        elf_file=None,
+                        telemetry_cb=None,
+                        deadlines=None,
+                        result_cb=None,
+                        keep_results=True,
+                        compact_log=False):
+        """Runs a session on a terminal that has already been opened (e.g. an
+        rtt.PolledRTT that lysd created for a warm debugger). The go_func is
+        called to start the firmware once the terminal is connected. A
+        trace_file only records the LCLI and Lys activity because the terminal
+        was created without the tracer. The other parameters and the returned
+        dictionary are the same as for run.
 
-        dbg.close()
+        """
+        self._setup(no_result,
+            timeout_s,
+            trace_file,
+            elf_file,
+            telemetry_cb,
+            deadlines,
+            result_cb,
+            keep_results,
+            compact_log)
+
+        try:
+            self._terminal_interact(terminal, init_params, go_func)
+        finally:
+            if (self._tracer):
+                self._tracer.save(trace_file)
+
+        return self._result_dict(init_params)
+
+    def _setup(self,
+                no_result,
+                timeout_s,
+                trace_file,
+                elf_file,
+                telemetry_cb,
+                deadlines,
+                result_cb,
+                keep_results,
+                compact_log):
+        """Validates and stores the options that are shared by run and
+        replay.
+
+        """
+        if (no_result and timeout_s):
+            raise LCLIError('The no_result and timeout_s parameters ' +
+                'are mutually exclusive.',
+                EXIT_CODES['LCLI_EXIT_CODE_INVALID_PARAMS'])
+
+        if (deadlines is None):
+            deadlines = {}
+        if (not isinstance(deadlines, dict)):
+            raise LCLIError('Deadlines must be given as a dictionary.',
+                EXIT_CODES['LCLI_EXIT_CODE_INVALID_PARAMS'])
+        for phase, deadline_s in deadlines.items():
+            if (not phase in DEADLINE_PHASES):
+                raise LCLIError('Unknown deadline phase: %s' % phase,
+                    EXIT_CODES['LCLI_EXIT_CODE_INVALID_PARAMS'])
+            if ((deadline_s is not None) and (0 >= deadline_s)):
+                raise LCLIError('Deadlines must be positive.',
+                    EXIT_CODES['LCLI_EXIT_CODE_INVALID_PARAMS'])
+        self._deadlines = dict((str(k), v) for k, v in deadlines.items())
 
+        self._no_result = no_result
+        self._timeout_s = timeout_s
+        self._telemetryCB = telemetry_cb
+        self._resultCB = result_cb
+        self._keepResults = keep_results
+        self._compactLog = compact_log
+
+        if (trace_file):
+            self._tracer = tracer.Tracer()
+            self._tracer.name_thread('LCLI')
+
+        if (elf_file):
+            try:
+                self._strTable = strtab.StringTable.from_elf(elf_file)
+            except strtab.StringTableError as err:
+                raise LCLIError(err.message,
+                    EXIT_CODES['LCLI_EXIT_CODE_INVALID_PARAMS'])
+
+    def _result_dict(self, init_params):
+        """Returns the dictionary that is described by run."""
         result_dict = {}
         result_dict['INIT_PARAMS'] = init_params
-        result_dict['LOG'] = self.lysLog
+        if (self._compactLog):
+            result_dict['LOG'] = self.lysLog.to_dict()
+        else:
+            result_dict['LOG'] = self.lysLog.expand()
         result_dict['RESULT'] = self.result
         result_dict['ERROR'] = self.error
 
         if (self._timer):
             result_dict['TIMEOUT_S'] = self._timer.interval
 
+        if (self.deadline):
+            result_dict['DEADLINE'] = self.deadline
+
         now = datetime.datetime.now()
         result_dict['TIMESTAMP'] = now.strftime(self.TIMESTAMP_FMT)
         return result_dict
@@ -158,8 +385,9 @@ class LCLI(object):
         each param_type is a key in LysData.PARAM_TYPES,
         LysData.PARAM_TYPES_REVERSE, or a shortened form of an entry in
         LysData.PARAM_TYPES_REVERSE (e.g. 'STRING' instead of
-        'LYS_PARAM_TYPE_STRING'). The array can be raw string that is read from
-        a file. Returns the str parsed as a python object.
+        'LYS_PARAM_TYPE_STRING'). A 'DELTA_' prefix on an array's param_type
+        turns its value into a lys.DeltaArray. The array can be raw string that
+        is read from a file. Returns the str parsed as a python object.
 
         """
         # Parse the params if they are given as a str.
@@ -189,6 +417,15 @@ class LCLI(object):
                     EXIT_CODES['LCLI_EXIT_CODE_INVALID_INIT_PARAMS'])
 
             k, v = t
+            if (isinstance(k, str) and k.startswith('DELTA_') and
+                    ('DELTA_ARRAY' != k)):
+                if (not isinstance(v, list)):
+                    raise LCLIError("Only arrays can use %s." % k,
+                        EXIT_CODES['LCLI_EXIT_CODE_INVALID_INIT_PARAMS'])
+                k = k[len('DELTA_'):]
+                v = lys.DeltaArray(v)
+                result[i] = (k, v)
+
             if (isinstance(k, int)):
                 if (not k in lys.LysData.PARAM_TYPES):
                     raise LCLIError("Unknown param_type: %d" % k,
@@ -207,6 +444,27 @@ class LCLI(object):
                     EXIT_CODES['LCLI_EXIT_CODE_INVALID_INIT_PARAMS'])
         return result
 
+    @staticmethod
+    def expand_result_dict(result_dict, short_form=True):
+        """Converts the param_types in the 'RESULT', 'INIT_PARAMS', and 'LOG'
+        entries of a dictionary that was returned by run to their str form
+        (see expand_param_types). The dictionary is modified in place and
+        returned.
+
+        """
+        for key in ('RESULT', 'INIT_PARAMS', 'LOG'):
+            if (not result_dict[key]):
+                continue
+            if (isinstance(result_dict[key], dict)):
+                # The compact form of the 'LOG' only stores each entry once.
+                result_dict[key]['PAYLOADS'] = LCLI.expand_param_types(
+                    result_dict[key]['PAYLOADS'],
+                    short_form)
+            else:
+                result_dict[key] = LCLI.expand_param_types(result_dict[key],
+                    short_form)
+        return result_dict
+
     @staticmethod
     def expand_param_types(params_array, short_form=True):
         """Expects an array of tuples in the form (param_type, value) and
@@ -238,58 +496,170 @@ class LCLI(object):
                     EXIT_CODES['LCLI_EXIT_CODE_INTERNAL_ERROR'])
         return result
 
-    def _terminal_interact(self, sn, init_params):
+    def _terminal_interact(self, terminal, init_params, go_func=None):
         """Uses a queue to pass data between this thread and the thread that is
-        communicating with the RTT socket.
+        communicating with the RTT socket. The go_func is called to start the
+        firmware once the terminal is connected. The session is counted in
+        the metrics module by its outcome unless the terminal is a replay.
 
         """
-        self._terminal = rtt.RTT(sn, self.debugLog)
+        self._terminal = terminal
+        self._goFunc = go_func
+        self._set_phase('BANNER')
+        if (not terminal.METRICS):
+            self._interact(init_params)
+            return
+
+        start = time.time()
+        outcome = 'error'
+        metrics.RUNS_ACTIVE.inc(sn=terminal.sn)
+        try:
+            self._interact(init_params)
+            if (self.deadline):
+                outcome = 'deadline'
+            elif (not self.error):
+                outcome = 'ok'
+        finally:
+            now = time.time()
+            metrics.RUNS_ACTIVE.dec(sn=terminal.sn)
+            metrics.RUN_SECONDS.observe((now - start), sn=terminal.sn)
+            metrics.RUNS.inc(sn=terminal.sn, outcome=outcome)
+            metrics.LAST_RUN_TIME.set(now, sn=terminal.sn)
+
+    def _interact(self, init_params):
+        """Handles the terminal's events until it is closed."""
         while (not self._terminal.closed):
-            rtt_event = self._terminal.read()
-            if (rtt_event.is_type('RTT_EVENT_STARTUP')):
-                self.debugLog.append("[lcli] RTT starting up...")
-            elif (rtt_event.is_type('RTT_EVENT_CONNECTED')):
-                self.debugLog.append("[lcli] Initializing Lys...")
-                self._lys = lys.Lys(self._terminal.write,
-                    self._state_changed,
-                    init_params)
-                dbg.go()
-            elif (rtt_event.is_type('RTT_EVENT_RX')):
-                printable_data = [ord(x) for x in rtt_event.data]
-                if (self._lys is not None):
-                    self.debugLog.append('[lcli] Data received: %r' %
-                        printable_data)
-                    self._lys.parse(rtt_event.data)
-                else:
-                    self.debugLog.append("[lcli] Ignoring stale data: %r" %
-                        printable_data)
-            elif (rtt_event.is_type('RTT_EVENT_IDLE')):
-                if (self._lys):
-                    if (self._lys.is_state('LYS_OP_FINISHED')):
-                        self.debugLog.append('[lcli] Finished, shutting down.')
-                        self.close()
-            elif (rtt_event.is_type('RTT_EVENT_ERROR')):
+            try:
+                rtt_event = self._terminal.read(True, self.DEADLINE_POLL_S)
+            except Queue.Empty:
+                rtt_event = None
+            if (rtt_event is None):
+                pass
+            elif (self._tracer):
+                with self._tracer.span(
+                        rtt.RTTEvent.EVENT_TYPES[rtt_event.event_type],
+                        'lcli'):
+                    self._handle_rtt_event(rtt_event, init_params)
+            else:
+                self._handle_rtt_event(rtt_event, init_params)
+            self._drain_bulk()
+            self._check_deadlines()
+
+    def _set_phase(self, phase):
+        """Starts timing a phase from DEADLINE_PHASES (or stops timing if the
+        phase is None).
+
+        """
+        self._phase = phase
+        self._phaseStart = time.time()
+
+    def _check_deadlines(self):
+        """Closes the session with an error if the current phase or the
+        current wait for an ACK has taken too long.
+
+        """
+        if (self._terminal.closed):
+            return
+        now = time.time()
+        expired = None
+        if (self._phase and self._deadlines.get(self._phase)):
+            if ((now - self._phaseStart) > self._deadlines[self._phase]):
+                expired = self._phase
+        if ((expired is None) and
+                self._deadlines.get('ACK') and
+                (self._lys is not None)):
+            ack_wait_start = self._lys.ack_wait_start()
+            if ((ack_wait_start is not None) and
+                    ((now - ack_wait_start) > self._deadlines['ACK'])):
+                expired = 'ACK'
+        if (expired):
+            self.error = True
+            self.deadline = expired
+            self.debugLog.append("[lcli] Error: %s deadline of %s seconds "
+                "passed." % (expired, self._deadlines[expired]))
+            if (self._terminal.METRICS):
+                metrics.DEADLINES.inc(sn=self._terminal.sn, phase=expired)
+            if (self._tracer):
+                self._tracer.instant('deadline', 'lcli', {'phase': expired})
+            self.close()
+
+    def _drain_bulk(self):
+        """Passes everything that has been read from the bulk channel to Lys.
+        Data that arrives before Lys exists is discarded.
+
+        """
+        bulk_event = self._terminal.read_bulk()
+        while (bulk_event is not None and not self._terminal.closed):
+            if (rtt.RTT_EVENT_ERROR == bulk_event.event_type):
                 self.error = True
-                self.debugLog.append("[lcli] Error: %s" % rtt_event.err_str)
+                self.debugLog.append("[lcli] Error: %s" % bulk_event.err_str)
                 self.close()
+            elif (self._lys is not None):
+                self._lys.parse_bulk(bulk_event.data)
+            bulk_event = self._terminal.read_bulk()
+
+    def _handle_rtt_event(self, rtt_event, init_params):
+        """Processes a single event that was read from the RTT object."""
+        if (rtt.RTT_EVENT_STARTUP == rtt_event.event_type):
+            self.debugLog.append("[lcli] RTT starting up...")
+        elif (rtt.RTT_EVENT_CONNECTED == rtt_event.event_type):
+            self._set_phase('INIT')
+            self.debugLog.append("[lcli] Initializing Lys...")
+            self._lys = lys.Lys(self._terminal.write,
+                self._state_changed,
+                init_params,
+                self._tracer,
+                self._strTable,
+                self._telemetryCB,
+                self._resultCB,
+                self._keepResults,
+                sn=(self._terminal.sn if self._terminal.METRICS else None))
+            if (self._goFunc):
+                self._goFunc()
+        elif (rtt.RTT_EVENT_RX == rtt_event.event_type):
+            # Only the length and start of each chunk are logged so that a
+            # long run doesn't copy every byte it receives into the log.
+            data_desc = ('%d bytes %r' %
+                (len(rtt_event.data), rtt_event.data[:DEBUG_LOG_DATA_LEN]))
+            if (self._lys is not None):
+                self.debugLog.append('[lcli] Data received: ' + data_desc)
+                self._lys.parse(rtt_event.data)
             else:
-                raise LCLIError('Unknown RTTEvent type: %d' %
-                    rtt_event.event_type,
-                    EXIT_CODES['LCLI_EXIT_CODE_INTERNAL_ERROR'])
+                self.debugLog.append("[lcli] Ignoring stale data: " + data_desc)
+        elif (rtt.RTT_EVENT_IDLE == rtt_event.event_type):
+            if (self._lys):
+                if (lys.LYS_OP_FINISHED == self._lys.state):
+                    self.debugLog.append('[lcli] Finished, shutting down.')
+                    self.close()
+        elif (rtt.RTT_EVENT_ERROR == rtt_event.event_type):
+            self.error = True
+            self.debugLog.append("[lcli] Error: %s" % rtt_event.err_str)
+            self.close()
+        else:
+            raise LCLIError('Unknown RTTEvent type: %d' %
+                rtt_event.event_type,
+                EXIT_CODES['LCLI_EXIT_CODE_INTERNAL_ERROR'])
 
     def _state_changed(self, lys_op, data):
             self.debugLog.append('[lcli] State_changed:' +
                 lys.LysOp.OP_TYPES[lys_op] + ": %s" % str(data))
-            if (lys.LysOp.OP_TYPES_REVERSE['LYS_OP_UNKNOWN'] == lys_op):
+            if (lys.LYS_OP_UNKNOWN == lys_op):
                 self.error = True
                 self.debugLog.append('[lcli] Error reported, shutting down.')
                 self.close()
-            elif (lys.LysOp.OP_TYPES_REVERSE['LYS_OP_FINISHED'] == lys_op):
+            elif (lys.LYS_OP_INIT == lys_op):
+                # Only the ACK deadline applies while the params are sent.
+                self._set_phase(None)
+            elif (lys.LYS_OP_RESULT == lys_op):
+                self._set_phase('RESULT')
+            elif (lys.LYS_OP_FINISHED == lys_op):
+                self._set_phase(None)
                 self.debugLog.append("[lcli] Finished, saving result.")
                 self.result = data
-            elif (lys.LysOp.OP_TYPES_REVERSE['LYS_OP_LOG'] == lys_op):
+            elif (lys.LYS_OP_LOG == lys_op):
                 self.lysLog.append(data)
-            elif (lys.LysOp.OP_TYPES_REVERSE['LYS_OP_START'] == lys_op):
+            elif (lys.LYS_OP_START == lys_op):
+                self._set_phase('RUN')
                 if (self._no_result):
                     self.debugLog.append("[lcli] Firmware started, exiting.")
                     self.close()
@@ -307,23 +677,27 @@ def _run(args_obj):
         if (args.init_params):
             args.init_params = LCLI.parse_condensed_params(args.init_params)
 
+        if (args_obj.deadlines):
+            try:
+                args_obj.deadlines = ast.literal_eval(args_obj.deadlines)
+            except (SyntaxError, ValueError):
+                raise LCLIError("Malformed deadlines str.",
+                    EXIT_CODES['LCLI_EXIT_CODE_INVALID_PARAMS'])
+
         result_dict = _lcli.run(args_obj.serial_number,
             args_obj.init_params,
             args_obj.makefile_dir,
             args_obj.no_result,
-            args_obj.timeout_s)
-
-        if (result_dict['RESULT']):
-            expanded = LCLI.expand_param_types(result_dict['RESULT'])
-            result_dict['RESULT'] = expanded
-
-        if (result_dict['INIT_PARAMS']):
-            expanded = LCLI.expand_param_types(result_dict['INIT_PARAMS'])
-            result_dict['INIT_PARAMS'] = expanded
+            args_obj.timeout_s,
+            args_obj.trace_file,
+            args_obj.capture_file,
+            args_obj.elf_file,
+            None,
+            args_obj.bulk_channel,
+            args_obj.deadlines,
+            compact_log=args_obj.compact_log)
 
-        if (result_dict['LOG']):
-            expanded = LCLI.expand_param_types(result_dict['LOG'])
-            result_dict['LOG'] = expanded
+        LCLI.expand_result_dict(result_dict)
 
         if (args_obj.log_file):
             if (args_obj.verbose):
@@ -341,6 +715,12 @@ def _run(args_obj):
     except maker.MakerError as err:
         print os.linesep + 'ERROR: ' + err.message + os.linesep
         return EXIT_CODES['LCLI_EXIT_CODE_MAKE_ERROR']
+    except capture.CaptureError as err:
+        print os.linesep + 'ERROR: ' + err.message + os.linesep
+        return EXIT_CODES['LCLI_EXIT_CODE_INTERNAL_ERROR']
+    except tracer.TracerError as err:
+        print os.linesep + 'ERROR: ' + err.message + os.linesep
+        return EXIT_CODES['LCLI_EXIT_CODE_INTERNAL_ERROR']
 
 
 if __name__ == "__main__":
@@ -376,6 +756,35 @@ if __name__ == "__main__":
         dest='log_file',
         type=str,
         help='a path where a log file can be created (suppresses stdout)')
+    parser.add_argument('--compact_log',
+        dest='compact_log',
+        action='store_true',
+        help='store each distinct log message once with run counts and ' +
+        'times instead of listing every message')
+    parser.add_argument('--trace_file',
+        dest='trace_file',
+        type=str,
+        help='a path where a Chrome trace format timeline of the session ' +
+        'can be written')
+    parser.add_argument('-e',
+        '--elf_file',
+        dest='elf_file',
+        type=str,
+        help='the ELF file that contains the firmware\'s LYS_LOG_FMT strings')
+    parser.add_argument('--capture_file',
+        dest='capture_file',
+        type=str,
+        help='a path where the raw RTT traffic can be recorded for replay')
+    parser.add_argument('-b',
+        '--bulk_channel',
+        dest='bulk_channel',
+        type=int,
+        help='the LYS_BULK_RTT_CHANNEL that the firmware was compiled with')
+    parser.add_argument('--deadlines',
+        dest='deadlines',
+        type=str,
+        help='a python dictionary of seconds allowed for each of the ' +
+        'BANNER, INIT, ACK, RUN, and RESULT phases')
 
     group = parser.add_mutually_exclusive_group()
     group.add_argument('-t',
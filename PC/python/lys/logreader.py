@@ -0,0 +1,395 @@
+"""Reads the log files that lcli.py writes with --log_file, which contain one
+result dictionary per line. The file is memory-mapped and a sidecar index
+(path + '.idx') records the offset, length, TIMESTAMP, ERROR flag, and
+INIT_PARAMS of every line so that later readers can select records without
+parsing the whole file again:
+
+    reader = logreader.LogReader('results.log', processes=8)
+    for i in reader.select(start='2016-07-28', error=False):
+        result_dict = reader[i]
+
+Records are only parsed when they are accessed. Building the index (and
+parsing many records with records()) can be spread across a process pool.
+When the log has grown since the index was written only the new lines are
+indexed. The index is a text file whose first line is a header and whose
+other lines are:
+
+    OFFSET<TAB>LENGTH<TAB>ERROR<TAB>TIMESTAMP<TAB>repr(INIT_PARAMS)
+
+where ERROR is 1, 0, or - if the line could not be parsed.
+
+"""
+import os
+import mmap
+import zlib
+import multiprocessing
+
+import reprfile
+
+
+INDEX_SUFFIX = '.idx'
+INDEX_VERSION = 1
+
+# The number of bytes at the start of the log that are checked to tell if the
+# index belongs to it.
+HEAD_LEN = 4096
+
+# Files smaller than this are always indexed without a process pool.
+MIN_POOL_SIZE = (4 * 1024 * 1024)
+
+
+class LogReaderError(Exception):
+    """Subclass for reporting errors."""
+    pass
+
+
+class LogReader(object):
+    """Provides indexed access to the records of a log file. Each record is
+    the result_dict that is described by LCLI.run.
+
+    """
+
+    def __init__(self, path, index_path=None, processes=None):
+        """Opens the log and reads its index, creating or extending it as
+        needed. The processes are used to index large files and default to the
+        number of CPUs; pass 1 to do everything in this process.
+
+        """
+        self.path = path
+        self.indexPath = index_path
+        if (self.indexPath is None):
+            self.indexPath = (path + INDEX_SUFFIX)
+        self.processes = processes
+        if (self.processes is None):
+            self.processes = multiprocessing.cpu_count()
+
+        # Parallel lists with one entry per line of the log.
+        self._offsets = []
+        self._lengths = []
+        self._errors = []
+        self._timestamps = []
+        self._params = []
+
+        self._file = None
+        self._map = None
+        try:
+            self._file = open(path, 'rb')
+            size = os.fstat(self._file.fileno()).st_size
+            if (size):
+                self._map = mmap.mmap(self._file.fileno(),
+                    size,
+                    access=mmap.ACCESS_READ)
+        except (IOError, OSError) as err:
+            self.close()
+            raise LogReaderError("Could not open log: %s" % err.strerror)
+
+        self._load_index()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, i):
+        """Returns the result_dict of the record at index i."""
+        return _parse_record(self.raw(i))
+
+    def __iter__(self):
+        for i in xrange(0, len(self)):
+            yield self[i]
+
+    def raw(self, i):
+        """Returns the unparsed line of the record at index i."""
+        offset = self._offsets[i]
+        return self._map[offset:(offset + self._lengths[i])]
+
+    def timestamp(self, i):
+        """Returns the TIMESTAMP str of the record at index i."""
+        return self._timestamps[i]
+
+    def error(self, i):
+        """Returns the ERROR flag of the record at index i or None if the
+        line could not be parsed.
+
+        """
+        return self._errors[i]
+
+    def select(self, start=None, end=None, error=None, init_params=None):
+        """Returns the indexes of the records whose TIMESTAMP is at least
+        start and less than end, whose ERROR flag equals error, and whose
+        INIT_PARAMS equal init_params. Arguments that are None are ignored.
+        The start and end are strs in the LCLI.TIMESTAMP_FMT format and can
+        be truncated (e.g. '2016-07' or '2016-07-28 14').
+
+        """
+        if (init_params is not None):
+            init_params = reprfile.params_key(init_params)
+
+        indexes = []
+        for i in xrange(0, len(self)):
+            if (self._errors[i] is None):
+                continue
+            if ((start is not None) and (self._timestamps[i] < start)):
+                continue
+            if ((end is not None) and (self._timestamps[i] >= end)):
+                continue
+            if ((error is not None) and (self._errors[i] != bool(error))):
+                continue
+            if ((init_params is not None) and
+                    (self._params[i] != init_params)):
+                continue
+            indexes.append(i)
+        return indexes
+
+    def records(self, indexes=None, processes=None):
+        """Returns a list of the result_dicts at the given indexes (or every
+        record). The records are parsed by a process pool of the given size,
+        which defaults to this reader's.
+
+        """
+        if (indexes is None):
+            indexes = range(0, len(self))
+        if (processes is None):
+            processes = self.processes
+
+        spans = [(self._offsets[i], self._lengths[i]) for i in indexes]
+        if ((1 >= processes) or (len(spans) < (2 * processes))):
+            return [self[i] for i in indexes]
+
+        chunks = _split(spans, processes)
+        pool = multiprocessing.Pool(processes)
+        try:
+            parsed = pool.map(_parse_spans,
+                [(self.path, chunk) for chunk in chunks])
+        finally:
+            pool.close()
+            pool.join()
+
+        result = []
+        for chunk in parsed:
+            result.extend(chunk)
+        return result
+
+    def close(self):
+        """Closes the log."""
+        if (self._map is not None):
+            self._map.close()
+            self._map = None
+        if (self._file is not None):
+            self._file.close()
+            self._file = None
+
+    def _size(self):
+        """Returns the number of bytes that are mapped."""
+        if (self._map is None):
+            return 0
+        return len(self._map)
+
+    def _head_crc(self):
+        """Returns the CRC of the start of the log."""
+        if (self._map is None):
+            return 0
+        return (zlib.crc32(self._map[:HEAD_LEN]) & 0xFFFFFFFF)
+
+    def _load_index(self):
+        """Reads the index if it belongs to this log and indexes any lines
+        that were added after it was written.
+
+        """
+        indexed = self._read_index()
+        if (indexed == self._size()):
+            return
+
+        entries = self._index_range(indexed, self._size())
+        if (entries):
+            self._add_entries(entries)
+            self._write_index()
+
+    def _read_index(self):
+        """Loads the index file and returns the number of bytes of the log
+        that it covers. Returns zero and loads nothing if the file is missing
+        or was written for a different log.
+
+        """
+        try:
+            with open(self.indexPath, 'rb') as f:
+                lines = f.read().split('\n')
+        except IOError:
+            return 0
+
+        try:
+            header = reprfile.literal_eval(lines[0])
+            if ((INDEX_VERSION != header['version']) or
+                    (header['size'] > self._size()) or
+                    (header['head_len'] > self._size())):
+                return 0
+            if (self._map is not None):
+                crc = (zlib.crc32(self._map[:header['head_len']]) & 0xFFFFFFFF)
+                if (crc != header['head_crc']):
+                    return 0
+
+            entries = []
+            for line in lines[1:]:
+                if (not line):
+                    continue
+                offset, length, error, timestamp, params = line.split('\t', 4)
+                entries.append((int(offset),
+                    int(length),
+                    {'1': True, '0': False, '-': None}[error],
+                    timestamp,
+                    params))
+        except (SyntaxError, ValueError, KeyError, IndexError, TypeError):
+            # A damaged index is rebuilt.
+            return 0
+
+        self._add_entries(entries)
+        return header['size']
+
+    def _write_index(self):
+        """Replaces the index file with the current index."""
+        head_len = min(HEAD_LEN, self._size())
+        header = {'version': INDEX_VERSION,
+            'size': self._indexed_size(),
+            'head_len': head_len,
+            'head_crc': self._head_crc()}
+        tmp_path = (self.indexPath + '.tmp')
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(repr(header) + '\n')
+                for i in xrange(0, len(self)):
+                    error = {True: '1', False: '0', None: '-'}[self._errors[i]]
+                    f.write('%d\t%d\t%s\t%s\t%s\n' % (self._offsets[i],
+                        self._lengths[i],
+                        error,
+                        self._timestamps[i],
+                        self._params[i]))
+            os.rename(tmp_path, self.indexPath)
+        except (IOError, OSError) as err:
+            raise LogReaderError("Could not write index: %s" % err.strerror)
+
+    def _indexed_size(self):
+        """Returns the number of bytes covered by the index, which always
+        ends with a complete line.
+
+        """
+        if (not self._offsets):
+            return 0
+        # Each line's length excludes its '\n'.
+        return (self._offsets[-1] + self._lengths[-1] + 1)
+
+    def _index_range(self, start, end):
+        """Returns the index entries of the complete lines between the
+        offsets start and end.
+
+        """
+        # A final line without a newline is still being written.
+        end = (self._map.rfind('\n', start, end) + 1)
+        if (end <= start):
+            return []
+
+        processes = self.processes
+        if ((1 >= processes) or ((end - start) < MIN_POOL_SIZE)):
+            return _index_lines(self._map, start, end)
+
+        bounds = [start]
+        step = ((end - start) // processes)
+        for i in range(1, processes):
+            cut = (self._map.find('\n', (start + (i * step)), end) + 1)
+            if (cut > bounds[-1]):
+                bounds.append(cut)
+        bounds.append(end)
+        bounds = sorted(set(bounds))
+
+        pool = multiprocessing.Pool(processes)
+        try:
+            chunks = pool.map(_index_file_range,
+                [(self.path, bounds[i], bounds[i + 1])
+                    for i in range(0, (len(bounds) - 1))])
+        finally:
+            pool.close()
+            pool.join()
+
+        entries = []
+        for chunk in chunks:
+            entries.extend(chunk)
+        return entries
+
+    def _add_entries(self, entries):
+        """Appends index entries to the parallel lists."""
+        for offset, length, error, timestamp, params in entries:
+            self._offsets.append(offset)
+            self._lengths.append(length)
+            self._errors.append(error)
+            self._timestamps.append(timestamp)
+            self._params.append(params)
+
+
+def _parse_record(line):
+    """Returns the result_dict on a line of the log."""
+    try:
+        return reprfile.literal_eval(line.rstrip('\r'))
+    except (SyntaxError, ValueError):
+        raise LogReaderError("Malformed log record: %r" % line[:80])
+
+
+def _index_lines(data, start, end):
+    """Returns the index entries of the lines of data between the offsets
+    start and end, which must be at the start of a line.
+
+    """
+    entries = []
+    offset = start
+    while (offset < end):
+        newline = data.find('\n', offset, end)
+        if (-1 == newline):
+            newline = end
+        line = data[offset:newline]
+        if (line.strip()):
+            try:
+                record = reprfile.literal_eval(line.rstrip('\r'))
+                entries.append((offset,
+                    len(line),
+                    bool(record.get('ERROR')),
+                    str(record.get('TIMESTAMP', '')),
+                    reprfile.params_key(record.get('INIT_PARAMS'))))
+            except (SyntaxError, ValueError, AttributeError, TypeError):
+                entries.append((offset, len(line), None, '', repr(None)))
+        offset = (newline + 1)
+    return entries
+
+
+def _split(items, n):
+    """Returns items split into at most n lists of nearly equal length."""
+    size = (((len(items) + n) - 1) // n)
+    return [items[i:(i + size)] for i in range(0, len(items), size)]
+
+
+def _map_file(path):
+    """Returns a read-only mmap of the file at path. The file is closed but
+    the map stays valid.
+
+    """
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _index_file_range(args):
+    """A process pool worker that indexes the lines between two offsets."""
+    path, start, end = args
+    data = _map_file(path)
+    try:
+        return _index_lines(data, start, end)
+    finally:
+        data.close()
+
+
+def _parse_spans(args):
+    """A process pool worker that parses the records at (offset, length)
+    spans.
+
+    """
+    path, spans = args
+    data = _map_file(path)
+    try:
+        return [_parse_record(data[offset:(offset + length)])
+            for offset, length in spans]
+    finally:
+        data.close()
@@ -0,0 +1,145 @@
+"""Stores the (param_type, data) log messages of a session compactly. Firmware
+tends to print the same few messages over and over so each distinct message
+is stored once and consecutive repeats are kept as a single run with a count
+and the times of its first and last messages:
+
+    store = logstore.LogStore()
+    store.append((lys.LYS_PARAM_TYPE_STRING, 'tick'))
+    store.runs()    # [((5, 'tick'), 1, 1476000000.0, 1476000000.0)]
+    store.expand()  # [(5, 'tick')]
+
+The compact form returned by to_dict can be written to a log file in place of
+the full list:
+
+    {'PAYLOADS': [(5, 'tick'), ...], 'RUNS': [(0, 3000, FIRST, LAST), ...]}
+
+where each run is the index of its payload, the number of repeats, and the
+time.time() of the first and last repeats. Use expand on a result_dict's
+'LOG' to get the full list from either form.
+
+"""
+import time
+
+
+class LogStoreError(Exception):
+    """Subclass for reporting errors."""
+    pass
+
+
+class LogStore(object):
+    """Interns log messages and collapses consecutive repeats into runs."""
+
+    def __init__(self):
+        """Creates an empty store."""
+        self._payloads = []
+        self._payloadIds = {}
+        # Each run is a [payload_id, count, first_time, last_time] list.
+        self._runs = []
+        self._count = 0
+
+    def __len__(self):
+        """Returns the number of messages including repeats."""
+        return self._count
+
+    def __iter__(self):
+        for payload_id, count, _, _ in self._runs:
+            payload = self._payloads[payload_id]
+            for _ in xrange(0, count):
+                yield payload
+
+    def append(self, entry, timestamp=None):
+        """Adds a (param_type, data) message that was received at the given
+        time.time() (or now).
+
+        """
+        if (timestamp is None):
+            timestamp = time.time()
+        payload_id = self._intern(entry)
+        if (self._runs and (payload_id == self._runs[-1][0])):
+            run = self._runs[-1]
+            run[1] += 1
+            run[3] = timestamp
+        else:
+            self._runs.append([payload_id, 1, timestamp, timestamp])
+        self._count += 1
+
+    def clear(self):
+        """Removes every message."""
+        self._payloads = []
+        self._payloadIds = {}
+        self._runs = []
+        self._count = 0
+
+    def payloads(self):
+        """Returns a list of the distinct messages in the order that they
+        first arrived.
+
+        """
+        return list(self._payloads)
+
+    def runs(self):
+        """Returns a list of (entry, count, first_time, last_time) tuples."""
+        return [(self._payloads[payload_id], count, first, last)
+            for payload_id, count, first, last in self._runs]
+
+    def expand(self):
+        """Returns every message, including repeats, as a list."""
+        return list(self)
+
+    def to_dict(self):
+        """Returns the compact dictionary form that is described above."""
+        return {'PAYLOADS': list(self._payloads),
+            'RUNS': [tuple(run) for run in self._runs]}
+
+    @classmethod
+    def from_dict(cls, log_dict):
+        """Returns a LogStore that holds the messages of a dictionary that was
+        created by to_dict.
+
+        """
+        store = cls()
+        try:
+            for entry in log_dict['PAYLOADS']:
+                store._intern(entry)
+            if (len(store._payloads) != len(log_dict['PAYLOADS'])):
+                raise LogStoreError("Duplicate log payloads.")
+            for payload_id, count, first, last in log_dict['RUNS']:
+                if ((0 > payload_id) or
+                        (len(store._payloads) <= payload_id) or
+                        (1 > count)):
+                    raise LogStoreError("Invalid log run: %r" %
+                        ((payload_id, count, first, last),))
+                store._runs.append([payload_id, count, first, last])
+                store._count += count
+        except (KeyError, TypeError, ValueError):
+            raise LogStoreError("Malformed compact log.")
+        return store
+
+    def _intern(self, entry):
+        """Returns the ID of the stored copy of entry, storing it first if
+        it's new.
+
+        """
+        # The repr tells apart values that compare equal (e.g. 1 and True)
+        # and works for the unhashable lists of array params.
+        key = repr(entry)
+        payload_id = self._payloadIds.get(key)
+        if (payload_id is None):
+            payload_id = len(self._payloads)
+            self._payloads.append(entry)
+            self._payloadIds[key] = payload_id
+        return payload_id
+
+
+def expand(log):
+    """Returns the list of messages in a result_dict's 'LOG', which can be a
+    list, a LogStore, or the compact dictionary form.
+
+    """
+    if (log is None):
+        return []
+    if (isinstance(log, LogStore)):
+        return log.expand()
+    if (isinstance(log, dict)):
+        return LogStore.from_dict(log).expand()
+    return list(log)
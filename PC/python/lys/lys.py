@@ -26,7 +26,55 @@ Finally, arrays of data can be sent like this:
 
     [LEN][LYS_OP_PARAM][LYS_PARAM_TYPE_ARRAY][PARAM_TYPE][DATA]
 
-Note that nested arrays are not allowed.
+Note that nested arrays are not allowed. Arrays of integers (or BOOLs) can
+also be sent in a compressed form:
+
+    [LEN][LYS_OP_PARAM][LYS_PARAM_TYPE_DELTA_ARRAY][PARAM_TYPE][VARINTS]
+
+where each item is replaced by its difference from the previous item (the
+first item's difference is from zero). Each difference is zigzag-encoded
+(0, -1, 1, -2... become 0, 1, 2, 3...) and sent as a little-endian base-128
+varint whose bytes have the high bit set except for the last one. Slowly
+changing samples then take one or two bytes each. Wrap a list in a DeltaArray
+to send it this way; it's decoded into the same list as a plain array.
+
+Log messages whose text is known at build time can be sent in a compact form
+that contains the ID of a format string and its arguments:
+
+    [LEN][LYS_OP_LOG_FMT][FMT_ID (2)][ARGS (n * 4)]
+
+The ID is resolved to a printf-style format string on the PC (see strtab.py).
+
+Batches of numeric samples are streamed without waiting for an ACK:
+
+    [LEN][LYS_OP_TELEMETRY][PARAM_TYPE][SEQ (2)][TIMESTAMP (4)][DATA]
+
+where SEQ is incremented by the board for every batch so that dropped batches
+can be detected and TIMESTAMP is a board-defined time for the first sample.
+
+Several params can be packed into one message (and one ACK):
+
+    [LEN][LYS_OP_PARAMS][PLEN][PARAM_TYPE][DATA][PLEN][PARAM_TYPE][DATA]...
+
+where each PLEN is the length of one param including PLEN itself and the
+PARAM_TYPE and DATA are the same as in a LYS_OP_PARAM message. The board
+sends its results this way and the PC sends the init params this way if the
+board's INIT message has the LYS_INIT_FLAG_PARAMS bit set:
+
+    [LEN][LYS_OP_INIT][FLAGS (1)][HASH (4)]
+
+The FLAGS byte is missing from the INIT messages of older boards. The HASH is
+only sent with the LYS_INIT_FLAG_CACHE bit, which means that the board has
+kept the last params that it accepted in retained RAM. It is the 32-bit
+FNV-1a hash of those params in the [PLEN][PARAM_TYPE][DATA] form. If the PC
+knows which params have that hash (see ParamRecords) it only sends the ones
+that changed:
+
+    [LEN][LYS_OP_CACHE][PLEN][INDEX][PARAM_TYPE][DATA][PLEN][INDEX]...
+
+where each record replaces the cached param at INDEX with one of the same
+length. A LYS_OP_CACHE message without records is sent if nothing changed.
+The board then uses its cached params when it receives LYS_OP_START.
 
 In C terms, the enums look like this:
 
@@ -40,6 +88,10 @@ typedef enum
     LYS_OP_PARAM,
     LYS_OP_ACK,
     LYS_OP_LOG,
+    LYS_OP_LOG_FMT,
+    LYS_OP_TELEMETRY,
+    LYS_OP_PARAMS,
+    LYS_OP_CACHE,
     LYS_OP_COUNT
 } lys_op_t;
 
@@ -52,17 +104,78 @@ typedef enum
     LYS_PARAM_TYPE_BOOL,
     LYS_PARAM_TYPE_STRING,
     LYS_PARAM_TYPE_ARRAY,
+    LYS_PARAM_TYPE_UINT16,
+    LYS_PARAM_TYPE_INT16,
+    LYS_PARAM_TYPE_UINT64,
+    LYS_PARAM_TYPE_INT64,
+    LYS_PARAM_TYPE_FLOAT32,
+    LYS_PARAM_TYPE_BYTES,
+    LYS_PARAM_TYPE_DELTA_ARRAY,
     LYS_PARAM_TYPE_COUNT
 } lys_param_t;
 
+LYS_PARAM_TYPE_BYTES is sent like LYS_PARAM_TYPE_STRING but holds arbitrary
+binary data. Neither can be an array item.
+
 """
 import time
 import struct
+import threading
+import collections
+
+import metrics
 
 
 LYS_MAX_STR_LEN = 64
 LYS_MAX_ARRAY_LEN = 64
 LYS_MAX_MSG_LEN = 64
+LYS_MAX_FMT_ARGS = ((LYS_MAX_MSG_LEN - 4) / 4)
+LYS_TELEMETRY_HEADER_LEN = 9
+
+# The INIT flag of boards that accept LYS_OP_PARAMS messages.
+LYS_INIT_FLAG_PARAMS = 0x01
+# The INIT flag of boards that send the hash of their cached params.
+LYS_INIT_FLAG_CACHE = 0x02
+
+# The lys_op_t and lys_param_t values as plain ints. These are compared
+# directly on the hot path instead of looking up the LYS_OP_X strings.
+LYS_OP_UNKNOWN = 0
+LYS_OP_INIT = 1
+LYS_OP_START = 2
+LYS_OP_RESULT = 3
+LYS_OP_FINISHED = 4
+LYS_OP_PARAM = 5
+LYS_OP_ACK = 6
+LYS_OP_LOG = 7
+LYS_OP_LOG_FMT = 8
+LYS_OP_TELEMETRY = 9
+LYS_OP_PARAMS = 10
+LYS_OP_CACHE = 11
+
+LYS_PARAM_TYPE_UINT32 = 0
+LYS_PARAM_TYPE_INT32 = 1
+LYS_PARAM_TYPE_UINT8 = 2
+LYS_PARAM_TYPE_INT8 = 3
+LYS_PARAM_TYPE_BOOL = 4
+LYS_PARAM_TYPE_STRING = 5
+LYS_PARAM_TYPE_ARRAY = 6
+LYS_PARAM_TYPE_UINT16 = 7
+LYS_PARAM_TYPE_INT16 = 8
+LYS_PARAM_TYPE_UINT64 = 9
+LYS_PARAM_TYPE_INT64 = 10
+LYS_PARAM_TYPE_FLOAT32 = 11
+LYS_PARAM_TYPE_BYTES = 12
+LYS_PARAM_TYPE_DELTA_ARRAY = 13
+
+# The largest number of bytes in a DELTA_ARRAY item's varint.
+LYS_MAX_VARINT_LEN = 10
+
+# The 32-bit FNV-1a parameters of the param cache hash.
+LYS_HASH_OFFSET_BASIS = 0x811C9DC5
+LYS_HASH_PRIME = 0x01000193
+
+# The number of param sets that ParamRecords remembers.
+MAX_PARAM_RECORDS = 32
 
 
 class LysError(Exception):
@@ -81,7 +194,11 @@ class LysOp(object):
     4: 'LYS_OP_FINISHED',
     5: 'LYS_OP_PARAM',
     6: 'LYS_OP_ACK',
-    7: 'LYS_OP_LOG'
+    7: 'LYS_OP_LOG',
+    8: 'LYS_OP_LOG_FMT',
+    9: 'LYS_OP_TELEMETRY',
+    10: 'LYS_OP_PARAMS',
+    11: 'LYS_OP_CACHE'
     }
 
     OP_TYPES_REVERSE = {
@@ -92,9 +209,15 @@ class LysOp(object):
     'LYS_OP_FINISHED': 4,
     'LYS_OP_PARAM': 5,
     'LYS_OP_ACK': 6,
-    'LYS_OP_LOG': 7
+    'LYS_OP_LOG': 7,
+    'LYS_OP_LOG_FMT': 8,
+    'LYS_OP_TELEMETRY': 9,
+    'LYS_OP_PARAMS': 10,
+    'LYS_OP_CACHE': 11
     }
 
+    __slots__ = ('opType', 'data')
+
     def __init__(self, op_type=None, data=None):
         """Creates a new Lys message with the given op and data."""
         self.opType = None
@@ -146,7 +269,8 @@ class LysOp(object):
         if (data is None):
             self.data = data
         else:
-            if (self.is_op('LYS_OP_PARAM') or self.is_op('LYS_OP_LOG')):
+            if (self.is_op('LYS_OP_PARAM') or self.is_op('LYS_OP_LOG') or
+                self.is_op('LYS_OP_LOG_FMT') or self.is_op('LYS_OP_TELEMETRY')):
                 self.data = data
             else:
                 raise LysError('Can not add data to an op of type %s.' %
@@ -158,6 +282,10 @@ class LysOp(object):
             raise LysError("Can not call dumps on unitialized object.")
         if (self.data is None):
             return LysOp.encode(self.opType)
+        elif (self.is_op('LYS_OP_LOG_FMT') or self.is_op('LYS_OP_TELEMETRY')):
+            # The data is a (fmt_id, args) or (param_type, (seq, timestamp,
+            # values)) tuple.
+            return LysOp.encode(self.opType, self.data[0], self.data[1])
         else:
             return LysOp.encode(self.opType,
                 self.data.paramType,
@@ -166,11 +294,35 @@ class LysOp(object):
     @staticmethod
     def encode(op, param_type=None, param_data=None):
         """Returns the specified op as a serialized str. The param_data may be a
-        list of values.
+        list of values. For LYS_OP_LOG_FMT the param_type is the format string
+        ID and the param_data is a sequence of arguments. For LYS_OP_PARAMS
+        the param_data is a sequence of (param_type, value) tuples and for
+        LYS_OP_CACHE it is a sequence of (index, param_type, value) tuples.
+        For LYS_OP_INIT the param_type is the optional cache HASH and the
+        param_data is the optional FLAGS byte.
 
         """
         op = LysOp.find_op_str(op)
 
+        if ('LYS_OP_LOG_FMT' == op):
+            return LysOp.encode_fmt(param_type, param_data)
+        elif ('LYS_OP_PARAMS' == op):
+            return LysOp.encode_params(param_data)
+        elif ('LYS_OP_CACHE' == op):
+            return LysOp.encode_cache(param_data)
+        elif (('LYS_OP_INIT' == op) and (param_type is not None)):
+            return struct.pack('<BBBI',
+                7,
+                LYS_OP_INIT,
+                ((param_data or 0) & 0xFF),
+                (param_type & 0xFFFFFFFF))
+        elif (('LYS_OP_INIT' == op) and (param_data is not None)):
+            return (chr(3) + chr(LYS_OP_INIT) + chr(param_data & 0xFF))
+        elif ('LYS_OP_TELEMETRY' == op):
+            # The param_data is a (seq, timestamp, values) tuple.
+            seq, timestamp, values = param_data
+            return LysOp.encode_telemetry(param_type, seq, timestamp, values)
+
         if (param_type is not None):
             param_type = LysData.find_param_type_str(param_type)
 
@@ -195,10 +347,29 @@ class LysOp(object):
         if (LYS_MAX_MSG_LEN < length):
             raise LysError("Message is too long: %d" % length)
 
-        if ((LysOp.find_op('LYS_OP_PARAM') == op) or
-            (LysOp.find_op('LYS_OP_LOG') == op)):
+        if ((LYS_OP_PARAM == op) or (LYS_OP_LOG == op)):
             param_type, param_data, remainder = LysData.decode(data_str)
             return (op, param_type, param_data, remainder)
+        elif (LYS_OP_LOG_FMT == op):
+            fmt_id, args, remainder = LysOp.decode_fmt(data_str)
+            return (op, fmt_id, args, remainder)
+        elif (LYS_OP_PARAMS == op):
+            params = LysOp.decode_params(data_str[:length])
+            return (op, None, params, (data_str[length:] or None))
+        elif (LYS_OP_CACHE == op):
+            patches = LysOp.decode_cache(data_str[:length])
+            return (op, None, patches, (data_str[length:] or None))
+        elif ((LYS_OP_INIT == op) and (3 == length)):
+            return (op, None, ord(data_str[2]), (data_str[length:] or None))
+        elif ((LYS_OP_INIT == op) and (7 == length)):
+            if (len(data_str) < length):
+                raise LysError("Truncated LYS_OP_INIT message.")
+            flags, cache_hash = struct.unpack_from('<BI', data_str, 2)
+            return (op, cache_hash, flags, (data_str[length:] or None))
+        elif (LYS_OP_TELEMETRY == op):
+            param_type, seq, timestamp, values, remainder = \
+                LysOp.decode_telemetry(data_str)
+            return (op, param_type, (seq, timestamp, values), remainder)
         elif (2 != length):
             raise LysError("Non-param message is too long.")
 
@@ -209,6 +380,206 @@ class LysOp(object):
         else:
             return (op, None, None, None)
 
+    @staticmethod
+    def encode_fmt(fmt_id, args=None):
+        """Returns a LYS_OP_LOG_FMT message as a serialized str. Each arg is
+        sent as a 32-bit value; negative values are sent in two's complement
+        form.
+
+        """
+        if (args is None):
+            args = []
+        if (LYS_MAX_FMT_ARGS < len(args)):
+            raise LysError("Too many format arguments: %d" % len(args))
+        try:
+            result = struct.pack('<BBH%dI' % len(args),
+                (4 + (4 * len(args))),
+                LYS_OP_LOG_FMT,
+                fmt_id,
+                *[(a & 0xFFFFFFFF) for a in args])
+        except struct.error:
+            raise LysError("Invalid format ID: %r" % fmt_id)
+        return result
+
+    @staticmethod
+    def decode_fmt(data_str):
+        """Expects a data_str in the form [LEN][LYS_OP_LOG_FMT][FMT_ID][ARGS].
+        The args are returned as unsigned 32-bit values. Returns a tuple in the
+        form (fmt_id, args, remainder|None).
+
+        """
+        length = ord(data_str[0])
+        if ((4 > length) or (0 != ((length - 4) % 4))):
+            raise LysError("Invalid LYS_OP_LOG_FMT length: %d" % length)
+
+        count = ((length - 4) / 4)
+        try:
+            fmt_id = struct.unpack_from('<H', data_str, 2)[0]
+            args = struct.unpack_from('<%dI' % count, data_str, 4)
+        except struct.error:
+            raise LysError("Truncated LYS_OP_LOG_FMT message.")
+
+        remainder = data_str[length:]
+        if (remainder):
+            return (fmt_id, args, remainder)
+        else:
+            return (fmt_id, args, None)
+
+    @staticmethod
+    def encode_params(params):
+        """Returns a LYS_OP_PARAMS message containing every one of the
+        (param_type, value) tuples as a serialized str.
+
+        """
+        result = [chr(LYS_OP_PARAMS)]
+        for param_type, value in params:
+            result.append(LysOp.param_record(param_type, value))
+        result = ''.join(result)
+        length = (len(result) + 1)
+        if (LYS_MAX_MSG_LEN < length):
+            raise LysError("Excessive data length: %d" % length)
+        return (chr(length) + result)
+
+    @staticmethod
+    def param_record(param_type, value):
+        """Returns a single param in the [PLEN][PARAM_TYPE][DATA] form that is
+        used by LYS_OP_PARAMS messages.
+
+        """
+        # The LYS_OP_PARAM message without its LEN and OP.
+        body = LysData.encode(param_type, value)[2:]
+        return (chr(len(body) + 1) + body)
+
+    @staticmethod
+    def decode_params(data_str):
+        """Expects a single [LEN][LYS_OP_PARAMS][PARAMS] message. Returns a
+        list of (param_type, value) tuples.
+
+        """
+        length = ord(data_str[0])
+        if ((3 > length) or (len(data_str) < length)):
+            raise LysError("Invalid LYS_OP_PARAMS length: %d" % length)
+
+        params = []
+        offset = 2
+        while (offset < length):
+            plen = ord(data_str[offset])
+            if ((2 > plen) or ((offset + plen) > length)):
+                raise LysError("Invalid param length in LYS_OP_PARAMS: %d" %
+                    plen)
+            # Each param is decoded as the LYS_OP_PARAM message it would
+            # otherwise have been sent as.
+            param_type, value, _ = LysData.decode(chr(plen + 1) +
+                chr(LYS_OP_PARAM) +
+                data_str[(offset + 1):(offset + plen)])
+            params.append((param_type, value))
+            offset += plen
+        return params
+
+    @staticmethod
+    def encode_cache(patches):
+        """Returns a LYS_OP_CACHE message containing every one of the
+        (index, param_type, value) tuples as a serialized str.
+
+        """
+        result = [chr(LYS_OP_CACHE)]
+        for index, param_type, value in patches:
+            if ((0 > index) or (0xFF < index)):
+                raise LysError("Invalid cache index: %r" % index)
+            record = LysOp.param_record(param_type, value)
+            result.append(chr(len(record) + 1) + chr(index) + record[1:])
+        result = ''.join(result)
+        length = (len(result) + 1)
+        if (LYS_MAX_MSG_LEN < length):
+            raise LysError("Excessive data length: %d" % length)
+        return (chr(length) + result)
+
+    @staticmethod
+    def decode_cache(data_str):
+        """Expects a single [LEN][LYS_OP_CACHE][PATCHES] message. Returns a
+        list of (index, param_type, value) tuples.
+
+        """
+        length = ord(data_str[0])
+        if ((2 > length) or (len(data_str) < length)):
+            raise LysError("Invalid LYS_OP_CACHE length: %d" % length)
+
+        patches = []
+        offset = 2
+        while (offset < length):
+            plen = ord(data_str[offset])
+            if ((3 > plen) or ((offset + plen) > length)):
+                raise LysError("Invalid param length in LYS_OP_CACHE: %d" %
+                    plen)
+            param_type, value, _ = LysData.decode(chr(plen) +
+                chr(LYS_OP_PARAM) +
+                data_str[(offset + 2):(offset + plen)])
+            patches.append((ord(data_str[offset + 1]), param_type, value))
+            offset += plen
+        return patches
+
+    @staticmethod
+    def encode_telemetry(param_type, seq, timestamp, values):
+        """Returns a LYS_OP_TELEMETRY message as a serialized str. The values
+        must be a non-empty sequence of fixed-size items.
+
+        """
+        param_type = LysData.find_param_type_str(param_type)
+        if (not LysData.PARAM_TYPE_FMTS.has_key(param_type)):
+            raise LysError("Telemetry can not contain %s items." % param_type)
+        if (not values):
+            raise LysError("Telemetry must contain at least one item.")
+
+        length = (LYS_TELEMETRY_HEADER_LEN +
+            (len(values) * LysData.PARAM_TYPE_LENS[param_type]))
+        if (LYS_MAX_MSG_LEN < length):
+            raise LysError("Excessive data length: %d" % length)
+
+        try:
+            return struct.pack('<BBBHI%d%s' %
+                    (len(values), LysData.PARAM_TYPE_FMTS[param_type]),
+                length,
+                LYS_OP_TELEMETRY,
+                LysData.find_param_type(param_type),
+                (seq & 0xFFFF),
+                (timestamp & 0xFFFFFFFF),
+                *values)
+        except struct.error:
+            raise LysError("Invalid values for type %s." % param_type)
+
+    @staticmethod
+    def decode_telemetry(data_str):
+        """Expects a data_str in the form
+        [LEN][LYS_OP_TELEMETRY][PARAM_TYPE][SEQ][TIMESTAMP][DATA]. Returns a
+        tuple in the form (param_type, seq, timestamp, values, remainder|None)
+        where values is a tuple.
+
+        """
+        length = ord(data_str[0])
+        param_type_str = LysData.find_param_type_str(ord(data_str[2]))
+        if (not LysData.PARAM_TYPE_FMTS.has_key(param_type_str)):
+            raise LysError("Telemetry can not contain %s items." %
+                param_type_str)
+
+        item_len = LysData.PARAM_TYPE_LENS[param_type_str]
+        data_len = (length - LYS_TELEMETRY_HEADER_LEN)
+        if ((0 >= data_len) or (0 != (data_len % item_len))):
+            raise LysError("Invalid LYS_OP_TELEMETRY length: %d" % length)
+
+        try:
+            seq, timestamp = struct.unpack_from('<HI', data_str, 3)
+            values = struct.unpack_from('<%d%s' % ((data_len / item_len),
+                    LysData.PARAM_TYPE_FMTS[param_type_str]),
+                data_str,
+                LYS_TELEMETRY_HEADER_LEN)
+        except struct.error:
+            raise LysError("Truncated LYS_OP_TELEMETRY message.")
+
+        remainder = data_str[length:]
+        if (not remainder):
+            remainder = None
+        return (ord(data_str[2]), seq, timestamp, values, remainder)
+
     def parse_str(self, data_str):
         """Expects a data_str in the form [LEN][PARAM_TYPE][DATA]. If the
         data_str contains any additional information then the unparsed remainder
@@ -218,7 +589,9 @@ class LysOp(object):
         """
         op, param_type, data, remaining = LysOp.decode(data_str)
 
-        if (data is not None):
+        if ((LYS_OP_LOG_FMT == op) or (LYS_OP_TELEMETRY == op)):
+            self.data = (param_type, data)
+        elif (data is not None):
             self.data = LysData(param_type, data)
         else:
             self.data = None
@@ -231,6 +604,14 @@ class LysOp(object):
             return None
 
 
+class DeltaArray(list):
+    """A list of integers (or bools) that is sent as a
+    LYS_PARAM_TYPE_DELTA_ARRAY instead of a LYS_PARAM_TYPE_ARRAY.
+
+    """
+    pass
+
+
 class LysData(object):
     """A simple class for serializing and deserializing strings of lys_param_t
     data. Does NOT support recursive data types.
@@ -244,7 +625,14 @@ class LysData(object):
     3: 'LYS_PARAM_TYPE_INT8',
     4: 'LYS_PARAM_TYPE_BOOL',
     5: 'LYS_PARAM_TYPE_STRING',
-    6: 'LYS_PARAM_TYPE_ARRAY'
+    6: 'LYS_PARAM_TYPE_ARRAY',
+    7: 'LYS_PARAM_TYPE_UINT16',
+    8: 'LYS_PARAM_TYPE_INT16',
+    9: 'LYS_PARAM_TYPE_UINT64',
+    10: 'LYS_PARAM_TYPE_INT64',
+    11: 'LYS_PARAM_TYPE_FLOAT32',
+    12: 'LYS_PARAM_TYPE_BYTES',
+    13: 'LYS_PARAM_TYPE_DELTA_ARRAY'
     }
 
     PARAM_TYPES_REVERSE = {
@@ -254,7 +642,14 @@ class LysData(object):
     'LYS_PARAM_TYPE_INT8': 3,
     'LYS_PARAM_TYPE_BOOL': 4,
     'LYS_PARAM_TYPE_STRING': 5,
-    'LYS_PARAM_TYPE_ARRAY': 6
+    'LYS_PARAM_TYPE_ARRAY': 6,
+    'LYS_PARAM_TYPE_UINT16': 7,
+    'LYS_PARAM_TYPE_INT16': 8,
+    'LYS_PARAM_TYPE_UINT64': 9,
+    'LYS_PARAM_TYPE_INT64': 10,
+    'LYS_PARAM_TYPE_FLOAT32': 11,
+    'LYS_PARAM_TYPE_BYTES': 12,
+    'LYS_PARAM_TYPE_DELTA_ARRAY': 13
     }
 
     PARAM_TYPE_LENS = {
@@ -262,9 +657,36 @@ class LysData(object):
     'LYS_PARAM_TYPE_INT32': 4,
     'LYS_PARAM_TYPE_UINT8': 1,
     'LYS_PARAM_TYPE_INT8': 1,
-    'LYS_PARAM_TYPE_BOOL': 1
+    'LYS_PARAM_TYPE_BOOL': 1,
+    'LYS_PARAM_TYPE_UINT16': 2,
+    'LYS_PARAM_TYPE_INT16': 2,
+    'LYS_PARAM_TYPE_UINT64': 8,
+    'LYS_PARAM_TYPE_INT64': 8,
+    'LYS_PARAM_TYPE_FLOAT32': 4
     }
 
+    # The struct format characters of the fixed-size param types.
+    PARAM_TYPE_FMTS = {
+    'LYS_PARAM_TYPE_UINT32': 'I',
+    'LYS_PARAM_TYPE_INT32': 'i',
+    'LYS_PARAM_TYPE_UINT8': 'B',
+    'LYS_PARAM_TYPE_INT8': 'b',
+    'LYS_PARAM_TYPE_BOOL': '?',
+    'LYS_PARAM_TYPE_UINT16': 'H',
+    'LYS_PARAM_TYPE_INT16': 'h',
+    'LYS_PARAM_TYPE_UINT64': 'Q',
+    'LYS_PARAM_TYPE_INT64': 'q',
+    'LYS_PARAM_TYPE_FLOAT32': 'f'
+    }
+
+    # The types that can be items of a LYS_PARAM_TYPE_DELTA_ARRAY.
+    DELTA_TYPES = ('LYS_PARAM_TYPE_UINT32', 'LYS_PARAM_TYPE_INT32',
+        'LYS_PARAM_TYPE_UINT8', 'LYS_PARAM_TYPE_INT8', 'LYS_PARAM_TYPE_BOOL',
+        'LYS_PARAM_TYPE_UINT16', 'LYS_PARAM_TYPE_INT16',
+        'LYS_PARAM_TYPE_UINT64', 'LYS_PARAM_TYPE_INT64')
+
+    __slots__ = ('paramType', 'paramData')
+
     def __init__(self, param_type=None, param_data=None):
         """Creates a new LysData payload."""
         self.paramType = None
@@ -316,7 +738,7 @@ class LysData(object):
 
     def set_data(self, data):
         """Sets this object's data."""
-        self.data = data
+        self.paramData = data
 
     def dumps(self):
         """Returns this object's data as a serialized str."""
@@ -327,18 +749,25 @@ class LysData(object):
     @staticmethod
     def encode(param_type, value):
         """Returns the specified data as a serialized str. The value may be a
-        list of values. The param_type can be an int or a str. 
+        list of values, which is compressed if it's a DeltaArray. The
+        param_type can be an int or a str.
 
         """
         param_type = LysData.find_param_type_str(param_type)
 
-        result = [chr(LysOp.find_op('LYS_OP_PARAM'))]
-        if (isinstance(value, list)):
-            result.append(chr(LysData.find_param_type('LYS_PARAM_TYPE_ARRAY')))
+        result = [chr(LYS_OP_PARAM)]
+        if (isinstance(value, DeltaArray)):
+            result.append(chr(LYS_PARAM_TYPE_DELTA_ARRAY))
+            result.append(chr(LysData.find_param_type(param_type)))
+            result.append(LysData._encode_deltas(param_type, value))
+            value = []
+        elif (isinstance(value, list)):
+            result.append(chr(LYS_PARAM_TYPE_ARRAY))
+            result.append(chr(LysData.find_param_type(param_type)))
         else:
             value = [value]
+            result.append(chr(LysData.find_param_type(param_type)))
 
-        result.append(chr(LysData.find_param_type(param_type)))
         for v in value:
             result.append(LysData._encode(param_type, v))
 
@@ -363,8 +792,8 @@ class LysData(object):
         if (LYS_MAX_MSG_LEN < length):
             raise LysError("Message is too long: %d" % length)
 
-        if (LysOp.find_op('LYS_OP_PARAM') != op):
-            if (LysOp.find_op('LYS_OP_LOG') != op):
+        if (LYS_OP_PARAM != op):
+            if (LYS_OP_LOG != op):
                 raise LysError('Message is not allowed to have data.')
 
         param_type = ord(data_str[2])
@@ -384,7 +813,14 @@ class LysData(object):
                 parsed, param_len, data = result
                 length -= param_len
                 parsed_data.append(parsed)
-        elif ('LYS_PARAM_TYPE_STRING' == param_type_str):
+        elif ('LYS_PARAM_TYPE_DELTA_ARRAY' == param_type_str):
+            param_type = ord(data_str[3])
+            parsed_data = LysData._decode_deltas(
+                LysData.find_param_type_str(param_type),
+                data_str[4:length])
+            data = None
+        elif (param_type_str in ('LYS_PARAM_TYPE_STRING',
+                'LYS_PARAM_TYPE_BYTES')):
             param_len = (length - 3)
             parsed_data = data[:param_len]
             data = data[param_len:]
@@ -419,51 +855,216 @@ class LysData(object):
     @staticmethod
     def _encode(param_type_str, value):
         """"""
-        result = []
+        if (param_type_str in ('LYS_PARAM_TYPE_STRING',
+                'LYS_PARAM_TYPE_BYTES')):
+            return str(value)
+        if (not LysData.PARAM_TYPE_FMTS.has_key(param_type_str)):
+            raise LysError("Unimplemented lys_param_t: %s" % param_type_str)
         try:
-            if ('LYS_PARAM_TYPE_UINT32' == param_type_str):
-                result.append(struct.pack('I', value))
-            elif ('LYS_PARAM_TYPE_INT32' == param_type_str):
-                result.append(struct.pack('i', value))
-            elif ('LYS_PARAM_TYPE_UINT8' == param_type_str):
-                result.append(struct.pack('B', value))
-            elif ('LYS_PARAM_TYPE_INT8' == param_type_str):
-                result.append(struct.pack('b', value))
-            elif ('LYS_PARAM_TYPE_BOOL' == param_type_str):
-                result.append(struct.pack('?', value))
-            elif ('LYS_PARAM_TYPE_STRING' == param_type_str):
-                result.append(value)
-            else:
-                raise LysError("Unimplemented lys_param_t: %s" % param_type_str)
+            return struct.pack('<' + LysData.PARAM_TYPE_FMTS[param_type_str],
+                value)
         except struct.error as err:
-            raise LysError("Invalid value (0x%X) for type %s." %
+            raise LysError("Invalid value (%r) for type %s." %
                 (value, param_type_str))
-        return ''.join(result)
+
+    @staticmethod
+    def _encode_deltas(param_type_str, values):
+        """Returns the varints of a LYS_PARAM_TYPE_DELTA_ARRAY."""
+        if (param_type_str not in LysData.DELTA_TYPES):
+            raise LysError("Delta arrays can not contain %s items." %
+                param_type_str)
+        if (not values):
+            raise LysError("Delta arrays must contain at least one item.")
+
+        result = bytearray()
+        prev = 0
+        for value in values:
+            # Checks the range of the value.
+            LysData._encode(param_type_str, value)
+            value = _to_int64(int(value))
+            delta = _to_int64(value - prev)
+            prev = value
+            if (0 > delta):
+                delta = (((-delta) << 1) - 1)
+            else:
+                delta <<= 1
+            while (0x7F < delta):
+                result.append(0x80 | (delta & 0x7F))
+                delta >>= 7
+            result.append(delta)
+        return str(result)
+
+    @staticmethod
+    def _decode_deltas(param_type_str, data):
+        """Returns the list of items in the varints of a
+        LYS_PARAM_TYPE_DELTA_ARRAY.
+
+        """
+        if (param_type_str not in LysData.DELTA_TYPES):
+            raise LysError("Delta arrays can not contain %s items." %
+                param_type_str)
+        if (not data):
+            raise LysError("Delta arrays must contain at least one item.")
+
+        bits = (8 * LysData.PARAM_TYPE_LENS[param_type_str])
+        mask = ((1 << bits) - 1)
+        signed = (LysData.PARAM_TYPE_FMTS[param_type_str].islower())
+
+        result = []
+        prev = 0
+        delta = 0
+        shift = 0
+        for b in bytearray(data):
+            delta |= ((b & 0x7F) << shift)
+            if (b & 0x80):
+                shift += 7
+                if ((7 * LYS_MAX_VARINT_LEN) <= shift):
+                    raise LysError("Invalid varint in %s delta array." %
+                        param_type_str)
+                continue
+
+            if (delta & 1):
+                delta = -((delta + 1) >> 1)
+            else:
+                delta >>= 1
+            prev = _to_int64(prev + delta)
+            # Items are truncated to their size like the board does.
+            value = (prev & mask)
+            if (signed and (value >> (bits - 1))):
+                value -= (1 << bits)
+            result.append(int(value))
+            delta = 0
+            shift = 0
+
+        if (shift):
+            raise LysError("Truncated %s value." % param_type_str)
+        if ('LYS_PARAM_TYPE_BOOL' == param_type_str):
+            result = [bool(v) for v in result]
+        return result
 
     @staticmethod
     def _parse(param_type_str, data):
         """"""
-        length = LysData.PARAM_TYPE_LENS[param_type_str]
-        if ('LYS_PARAM_TYPE_UINT32' == param_type_str):
-            return (struct.unpack('I', data[:length])[0], length, data[length:])
-        elif ('LYS_PARAM_TYPE_INT32' == param_type_str):
-            return (struct.unpack('i', data[:length])[0], length, data[length:])
-        elif ('LYS_PARAM_TYPE_UINT8' == param_type_str):
-            return (struct.unpack('B', data[:length])[0], length, data[length:])
-        elif ('LYS_PARAM_TYPE_INT8' == param_type_str):
-            return (struct.unpack('b', data[:length])[0], length, data[length:])
-        elif ('LYS_PARAM_TYPE_BOOL' == param_type_str):
-            return (struct.unpack('?', data[:length])[0], length, data[length:])
-        else:
+        if (not LysData.PARAM_TYPE_FMTS.has_key(param_type_str)):
             raise LysError("Unimplemented lys_param_t: %s" % param_type_str)
+        length = LysData.PARAM_TYPE_LENS[param_type_str]
+        try:
+            value = struct.unpack('<' + LysData.PARAM_TYPE_FMTS[param_type_str],
+                data[:length])[0]
+        except struct.error:
+            raise LysError("Truncated %s value." % param_type_str)
+        return (value, length, data[length:])
+
+
+def _to_int64(value):
+    """Wraps an int into the range of an int64_t."""
+    return (((value + (1 << 63)) & ((1 << 64) - 1)) - (1 << 63))
+
+
+def param_hash(records):
+    """Returns the FNV-1a hash that a board reports for a list of params in
+    the [PLEN][PARAM_TYPE][DATA] form (see LysOp.param_record).
+
+    """
+    result = LYS_HASH_OFFSET_BASIS
+    for c in ''.join(records):
+        result = (((result ^ ord(c)) * LYS_HASH_PRIME) & 0xFFFFFFFF)
+    return result
+
+
+class ParamRecords(object):
+    """Remembers the most recent param sets by their hash so that the params
+    that a board has cached can be compared with the ones that are about to
+    be sent. It can be shared by Lys objects in different threads.
+
+    """
+
+    def __init__(self, max_len=MAX_PARAM_RECORDS):
+        """Keeps at most max_len param sets."""
+        self.maxLen = max_len
+        self._records = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._records)
+
+    def add(self, records):
+        """Remembers a list of params in the [PLEN][PARAM_TYPE][DATA] form."""
+        key = param_hash(records)
+        with self._lock:
+            self._records.pop(key, None)
+            self._records[key] = list(records)
+            while (self.maxLen < len(self._records)):
+                self._records.popitem(last=False)
+
+    def patches(self, cache_hash, records):
+        """Returns the indexes of the records that differ from the params
+        with the given hash or None if the board has to be sent every param
+        (or if that would be shorter). The list is empty if nothing changed.
+
+        """
+        if (cache_hash == param_hash(records)):
+            return []
+
+        with self._lock:
+            cached = self._records.get(cache_hash)
+        if ((cached is None) or (len(cached) != len(records))):
+            return None
+
+        indexes = []
+        for i in xrange(0, len(records)):
+            if (cached[i] == records[i]):
+                continue
+            # Each patch needs the same length, a one-byte INDEX, and room
+            # for the message's LEN and OP.
+            if ((0xFF < i) or
+                    (len(cached[i]) != len(records[i])) or
+                    (LYS_MAX_MSG_LEN < (len(records[i]) + 3))):
+                return None
+            indexes.append(i)
+
+        # Each patch is one byte longer than the param.
+        if (sum(len(r) for r in records) < (len(indexes) +
+                sum(len(records[i]) for i in indexes))):
+            return None
+        return indexes
+
+
+# The ParamRecords that Lys objects use unless they are given their own.
+PARAM_RECORDS = ParamRecords()
 
 
 class Lys(object):
     """A high-level interface to the Lys protocol."""
 
-    def __init__(self, write_func, state_cb, input_params=None):
+    def __init__(self,
+                    write_func,
+                    state_cb,
+                    input_params=None,
+                    tracer=None,
+                    str_table=None,
+                    telemetry_cb=None,
+                    result_cb=None,
+                    keep_results=True,
+                    param_records=PARAM_RECORDS,
+                    sn=None):
         """The input_params should be a sequence of (param_type, param_data)
-        tuples. The state_cb will receive lys_op and desc_str parameters.
+        tuples. The state_cb will receive lys_op and desc_str parameters. If a
+        tracer.Tracer is given then decoded frames, ACKs, and state changes
+        will be recorded with it. The str_table is used to turn LYS_OP_LOG_FMT
+        messages into text (see strtab.StringTable). The resulting text is
+        passed to the state_cb as a LYS_OP_LOG string param. The telemetry_cb
+        will receive param_type, seq, timestamp, and values parameters for
+        every LYS_OP_TELEMETRY message; these messages are not ACK'd and are
+        dropped if no telemetry_cb is given. The result_cb will receive
+        param_type and param_data parameters for each result as it arrives.
+        The results are also collected and passed to the state_cb with
+        LYS_OP_FINISHED unless keep_results is False, in which case None is
+        passed instead. The input_params are remembered in param_records so
+        that a board that has cached an earlier set only needs the params that
+        changed; pass None to always send every param. The sn labels the
+        ACK latency and board error metrics (see metrics.py), which aren't
+        updated if it's None.
 
         """
         if (write_func is None):
@@ -472,134 +1073,332 @@ class Lys(object):
             raise LysError("The state_cb can not be None.")
 
         self.inputParams = input_params
-        self.state = LysOp.find_op('LYS_OP_UNKNOWN')
+        self.state = LYS_OP_UNKNOWN
 
         self._writeFunc = write_func
         self._stateCB = state_cb
+        self._tracer = tracer
+        self._strTable = str_table
+        self._telemetryCB = telemetry_cb
+        self._resultCB = result_cb
+        self._keepResults = keep_results
+        self._paramRecords = param_records
+        self._metricsSN = sn
         self._remainder = None
+        self._bulkRemainder = None
         self._waitingForACK = False
+        self._ackWaitStart = None
         self._msgOutFIFO = []
         self._results = []
+        self._initFlags = 0
 
     def is_state(self, op_type):
         """Convenience method for determining the state of the Lys object."""
         return (self.state == LysOp.find_op(op_type))
 
+    def ack_wait_start(self):
+        """Returns the time.time() when the message that is waiting for an
+        ACK was sent or None if no ACK is expected.
+
+        """
+        if (not self._waitingForACK):
+            return None
+        return self._ackWaitStart
+
     def parse(self, data_str):
-        """"""
-        if (self._remainder):
-            data_str = ''.join((self._remainder, data_str))
+        """Parses data that was read from the control channel."""
+        self._remainder = self._parse(data_str, self._remainder, self._update)
+
+    def parse_bulk(self, data_str):
+        """Parses data that was read from a separate bulk channel. Only
+        LYS_OP_LOG, LYS_OP_LOG_FMT, and LYS_OP_TELEMETRY messages are expected
+        there and they are not ACK'd.
 
-        op, param_type, param_data, remainder = LysOp.decode(data_str)
-        self._remainder = remainder
+        """
+        self._bulkRemainder = self._parse(data_str,
+            self._bulkRemainder,
+            self._update_bulk)
 
-        self._update(op, param_type, param_data)
+    def _parse(self, data_str, remainder, update_func):
+        """Passes every complete message in the remainder plus data_str to
+        update_func. Returns the new remainder (an incomplete message) or None.
+        Errors are only raised for the first message.
+
+        """
+        if (remainder):
+            data_str = ''.join((remainder, data_str))
 
-        if (self._remainder):
+        # The messages are walked with an offset so that only each message is
+        # copied instead of everything that follows it.
+        offset = 0
+        end = len(data_str)
+        while (offset < end):
             try:
-                self.parse(self._remainder)
+                length = ord(data_str[offset])
+                if (2 > length):
+                    raise LysError("Invalid message length: %d" % length)
+                if ((end - offset) < length):
+                    # Wait for the rest of the message to arrive.
+                    return data_str[offset:]
+
+                op, param_type, param_data, _ = LysOp.decode(
+                    data_str[offset:(offset + length)])
             except LysError:
-                pass
+                if (0 == offset):
+                    raise
+                return None
+            offset += length
+
+            if (self._tracer):
+                with self._tracer.span(LysOp.OP_TYPES.get(op, 'LYS_OP_?'),
+                        'lys',
+                        {'param_type': param_type, 'state': self.state}):
+                    update_func(op, param_type, param_data)
+            else:
+                update_func(op, param_type, param_data)
+        return None
 
     def reset(self):
         """"""
-        self.state = LysOp.find_op('LYS_OP_UNKNOWN')
+        self.state = LYS_OP_UNKNOWN
         self._remainder = None
+        self._bulkRemainder = None
         self._waitingForACK = False
         self._msgOutFIFO = []
         self._results = []
 
     def _update(self, op, param_type=None, param_data=None):
         """"""
+        if (LYS_OP_TELEMETRY == op):
+            # Telemetry is never ACK'd so it doesn't affect the state.
+            self._telemetry_received(param_type, param_data)
+            return
+
         if (self._waitingForACK):
-            if (LysOp.find_op('LYS_OP_ACK') == op):
+            if (LYS_OP_ACK == op):
                 self._waitingForACK = False
+                if (self._metricsSN is not None):
+                    metrics.ACK_SECONDS.observe(
+                        (time.time() - self._ackWaitStart),
+                        sn=self._metricsSN)
+                if (self._tracer):
+                    self._tracer.instant('ack_rx', 'lys')
                 if (not self._msgOutFIFO):
-                    if (self.is_state('LYS_OP_INIT')):
-                        self.state = LysOp.find_op('LYS_OP_START')
-                        self._stateCB(self.state, None)
+                    if (LYS_OP_INIT == self.state):
+                        self.state = LYS_OP_START
+                        self._state_changed(self.state, None)
                 else:
                     self._send_next_msg()
+            elif ((LYS_OP_LOG == op) or (LYS_OP_LOG_FMT == op)):
+                # A board that sends its logs from a queue in the background
+                # can send one before the ACK arrives. Its ACK is sent right
+                # away because it doesn't need an ACK itself.
+                self._log_received(op, param_type, param_data)
+                self._write_msg(LYS_OP_ACK, None, None, False)
             else:
                 self.is_state('LYS_OP_UNKNOWN')
-                self._stateCB(self.state, "ACK not received.")
+                self._state_changed(self.state, "ACK not received.")
                 self._waitingForACK = False
             return
 
-        if (LysOp.find_op('LYS_OP_LOG') == op):
-            self._stateCB(op, (param_type, param_data))
-            self._msgOutFIFO.append((LysOp.find_op('LYS_OP_ACK'),
+        if ((LYS_OP_LOG == op) or (LYS_OP_LOG_FMT == op)):
+            self._log_received(op, param_type, param_data)
+            self._msgOutFIFO.append((LYS_OP_ACK,
                 None,
                 None,
                 False))
-        elif (LysOp.find_op('LYS_OP_UNKNOWN') == op):
+        elif (LYS_OP_UNKNOWN == op):
             self.state = op
-            self._stateCB(self.state, "The nRF board reported an error.")
-        elif (LysOp.find_op('LYS_OP_ACK') == op):
+            if (self._metricsSN is not None):
+                metrics.DEVICE_ERRORS.inc(sn=self._metricsSN)
+            self._state_changed(self.state, "The nRF board reported an error.")
+        elif (LYS_OP_ACK == op):
             self.is_state('LYS_OP_UNKNOWN')
-            self._stateCB(self.state,
+            self._state_changed(self.state,
                 "Unexpected LYS_OP_ACK message received.")
-        elif (LysOp.find_op('LYS_OP_INIT') == op):
-            self._msgOutFIFO.append((LysOp.find_op('LYS_OP_ACK'),
+        elif (LYS_OP_INIT == op):
+            self._msgOutFIFO.append((LYS_OP_ACK,
                 None,
                 None,
                 False))
-            if (self.is_state('LYS_OP_UNKNOWN')):
+            if (LYS_OP_UNKNOWN == self.state):
                 self._results = []
+                self._initFlags = (param_data or 0)
                 self.state = op
-                self._stateCB(self.state, None)
-                if (self.inputParams):
-                    for param_type, param_data in self.inputParams:
-                        self._msgOutFIFO.append((LysOp.find_op('LYS_OP_PARAM'),
-                            param_type,
-                            param_data,
-                            True))
-                self._msgOutFIFO.append((LysOp.find_op('LYS_OP_START'),
+                self._state_changed(self.state, None)
+                self._queue_params(param_type)
+                self._msgOutFIFO.append((LYS_OP_START,
                     None,
                     None,
                     True))
             else:
                 self.is_state('LYS_OP_UNKNOWN')
-                self._stateCB(self.state,
+                self._state_changed(self.state,
                     "Unexpected LYS_OP_INIT message received.")
-        elif (LysOp.find_op('LYS_OP_RESULT') == op):
-            self._msgOutFIFO.append((LysOp.find_op('LYS_OP_ACK'),
+        elif (LYS_OP_RESULT == op):
+            self._msgOutFIFO.append((LYS_OP_ACK,
                 None,
                 None,
                 False))
-            if (LysOp.find_op('LYS_OP_START') == self.state):
+            if (LYS_OP_START == self.state):
                 self.state = op
-                self._stateCB(self.state, None)
+                self._state_changed(self.state, None)
             else:
-                self.state = LysOp.find_op('LYS_OP_UNKNOWN')
-                self._stateCB(self.state,
+                self.state = LYS_OP_UNKNOWN
+                self._state_changed(self.state,
                     "Unexpected LYS_OP_RESULT message received.")
-        elif (LysOp.find_op('LYS_OP_PARAM') == op):
-            self._msgOutFIFO.append((LysOp.find_op('LYS_OP_ACK'),
+        elif ((LYS_OP_PARAM == op) or (LYS_OP_PARAMS == op)):
+            self._msgOutFIFO.append((LYS_OP_ACK,
                 None,
                 None,
                 False))
-            if (LysOp.find_op('LYS_OP_RESULT') == self.state):
-                self._results.append((param_type, param_data))
+            if (LYS_OP_RESULT == self.state):
+                if (LYS_OP_PARAM == op):
+                    self._result_received(param_type, param_data)
+                else:
+                    for param_type, value in param_data:
+                        self._result_received(param_type, value)
             else:
-                self.state = LysOp.find_op('LYS_OP_UNKNOWN')
-                self._stateCB(self.state,
-                    "Unexpected LYS_OP_FINISHED message received.")
-        elif (LysOp.find_op('LYS_OP_FINISHED') == op):
-            self._msgOutFIFO.append((LysOp.find_op('LYS_OP_ACK'),
+                self.state = LYS_OP_UNKNOWN
+                self._state_changed(self.state,
+                    "Unexpected %s message received." % LysOp.OP_TYPES[op])
+        elif (LYS_OP_FINISHED == op):
+            self._msgOutFIFO.append((LYS_OP_ACK,
                 None,
                 None,
                 False))
-            if (self.is_state('LYS_OP_RESULT')):
+            if (LYS_OP_RESULT == self.state):
                 self.state = op
-                self._stateCB(self.state, self._results)
+                if (self._keepResults):
+                    self._state_changed(self.state, self._results)
+                else:
+                    self._state_changed(self.state, None)
             else:
                 self.is_state('LYS_OP_UNKNOWN')
-                self._stateCB(self.state,
+                self._state_changed(self.state,
                     "Unexpected LYS_OP_FINISHED message received.")
 
         self._send_next_msg()
 
+    def _update_bulk(self, op, param_type=None, param_data=None):
+        """Handles a message from the bulk channel."""
+        if ((LYS_OP_LOG == op) or (LYS_OP_LOG_FMT == op)):
+            self._log_received(op, param_type, param_data)
+        elif (LYS_OP_TELEMETRY == op):
+            self._telemetry_received(param_type, param_data)
+        else:
+            self.state = LYS_OP_UNKNOWN
+            self._state_changed(self.state,
+                "Unexpected %s message on the bulk channel." %
+                LysOp.OP_TYPES[op])
+
+    def _result_received(self, param_type, param_data):
+        """Passes a result to the result_cb and keeps it if required."""
+        if (self._resultCB is not None):
+            self._resultCB(param_type, param_data)
+        if (self._keepResults):
+            self._results.append((param_type, param_data))
+
+    def _log_received(self, op, param_type, param_data):
+        """Reports a LYS_OP_LOG or LYS_OP_LOG_FMT message."""
+        if (LYS_OP_LOG_FMT == op):
+            self._log_fmt_received(param_type, param_data)
+        else:
+            self._state_changed(op, (param_type, param_data))
+
+    def _log_fmt_received(self, fmt_id, args):
+        """Reports a LYS_OP_LOG_FMT message as a LYS_OP_LOG string."""
+        if (self._strTable is not None):
+            text = self._strTable.format(fmt_id, args)
+        else:
+            text = ('LYS_OP_LOG_FMT 0x%04X %r' % (fmt_id, args))
+        self._state_changed(LYS_OP_LOG,
+            (LYS_PARAM_TYPE_STRING, text))
+
+    def _telemetry_received(self, param_type, param_data):
+        """Passes a LYS_OP_TELEMETRY message to the telemetry_cb."""
+        if (self._telemetryCB is not None):
+            seq, timestamp, values = param_data
+            self._telemetryCB(param_type, seq, timestamp, values)
+
+    def _state_changed(self, op, data):
+        """Passes a state change to the state_cb."""
+        if (self._tracer):
+            with self._tracer.span('state_cb', 'lys',
+                    {'op': LysOp.OP_TYPES[op]}):
+                self._stateCB(op, data)
+        else:
+            self._stateCB(op, data)
+
+    def _queue_params(self, cache_hash):
+        """Adds the messages that send the inputParams to the _msgOutFIFO.
+        These are LYS_OP_CACHE messages with only the changed params if the
+        board's cached params have the given hash and are known.
+
+        """
+        params = (self.inputParams or [])
+        indexes = None
+        if (self._paramRecords is not None):
+            try:
+                records = [LysOp.param_record(param_type, param_data)
+                    for param_type, param_data in params]
+            except LysError:
+                # The error is raised when the param is sent.
+                records = None
+            if (records is not None):
+                if ((cache_hash is not None) and
+                        (self._initFlags & LYS_INIT_FLAG_CACHE)):
+                    indexes = self._paramRecords.patches(cache_hash, records)
+                self._paramRecords.add(records)
+
+        if (self._tracer and (cache_hash is not None)):
+            self._tracer.instant('param_cache', 'lys',
+                {'hit': (indexes is not None),
+                    'patches': len(indexes or [])})
+
+        if (indexes is None):
+            for param_type, param_data in params:
+                self._msgOutFIFO.append((LYS_OP_PARAM,
+                    param_type,
+                    param_data,
+                    True))
+            return
+
+        # At least one message is sent so that the board uses its cache.
+        patches = []
+        length = 2
+        for i in indexes:
+            patch_len = (len(records[i]) + 1)
+            if (patches and (LYS_MAX_MSG_LEN < (length + patch_len))):
+                self._msgOutFIFO.append((LYS_OP_CACHE, None, patches, True))
+                patches = []
+                length = 2
+            patches.append((i, params[i][0], params[i][1]))
+            length += patch_len
+        self._msgOutFIFO.append((LYS_OP_CACHE, None, patches, True))
+
+    def _pack_params(self, param_type, param_data):
+        """Moves as many of the PARAM messages at the front of the
+        _msgOutFIFO as fit into a LYS_OP_PARAMS message along with the given
+        param. Returns the (op, param_type, param_data) of the message to
+        send, which is the given LYS_OP_PARAM if nothing else fits.
+
+        """
+        params = [(param_type, param_data)]
+        length = (2 + len(LysOp.param_record(param_type, param_data)))
+        while (self._msgOutFIFO and (LYS_OP_PARAM == self._msgOutFIFO[0][0])):
+            next_type, next_data = self._msgOutFIFO[0][1:3]
+            next_len = len(LysOp.param_record(next_type, next_data))
+            if (LYS_MAX_MSG_LEN < (length + next_len)):
+                break
+            params.append((next_type, next_data))
+            length += next_len
+            del self._msgOutFIFO[0]
+
+        if (1 == len(params)):
+            return (LYS_OP_PARAM, param_type, param_data)
+        return (LYS_OP_PARAMS, None, params)
+
     def _send_next_msg(self):
         """"""
         if (self._waitingForACK):
@@ -609,10 +1408,22 @@ class Lys(object):
             msg = self._msgOutFIFO[0]
             del self._msgOutFIFO[0]
             op, param_type, param_data, ack_reqd = msg
+            if ((LYS_OP_PARAM == op) and
+                    (self._initFlags & LYS_INIT_FLAG_PARAMS)):
+                op, param_type, param_data = self._pack_params(param_type,
+                    param_data)
 
-            self._writeFunc(LysOp.encode(op, param_type, param_data))
+            self._write_msg(op, param_type, param_data, ack_reqd)
 
             if (ack_reqd):
                 self._waitingForACK = True
+                self._ackWaitStart = time.time()
             else:
                 self._send_next_msg()
+
+    def _write_msg(self, op, param_type, param_data, ack_reqd):
+        """Encodes and writes a single message."""
+        if (self._tracer):
+            self._tracer.instant('send', 'lys',
+                {'op': LysOp.find_op_str(op), 'ack_reqd': ack_reqd})
+        self._writeFunc(LysOp.encode(op, param_type, param_data))
@@ -0,0 +1,636 @@
+#!/usr/bin/env python
+"""A long-lived daemon that keeps every J-Link debugger attached and runs Lys
+experiments on them as jobs. Running lcli.py for every experiment pays for the
+imports, the J-Link enumeration, attaching, and the RTT socket's banner check
+each time; the daemon only does this once. Jobs are submitted over a local
+Unix socket and are scheduled onto the first free board (or a specific one).
+A job can run make in any directory so the socket is only accessible to the
+user that started the daemon and lives in $XDG_RUNTIME_DIR (or the home
+directory) by default.
+
+Requests and responses are JSON objects, one per line. A job is submitted
+with:
+
+    {"op": "submit", "init_params": "[('UINT32', 10)]", "timeout_s": null,
+        "no_result": false, "makefile_dir": null, "elf_file": null,
+        "sn": null, "bulk_channel": null, "deadlines": null,
+        "keep_results": true, "compact_log": false, "verbose": false}
+
+where every key except "op" is optional and init_params uses the condensed
+str form that lcli.py accepts. The daemon responds with a "queued" event, a
+"started" event once a board has been assigned, a "param" event for each
+result as it arrives, and finally either a "result" event that holds the same
+dictionary that lcli.py prints (including its 'VERBOSE_OUTPUT' if verbose is
+true and without its 'RESULT' if keep_results is false) or an "error" event:
+
+    {"event": "queued", "job": 1}
+    {"event": "started", "job": 1, "sn": 682522292}
+    {"event": "param", "job": 1, "param": ["UINT32", 10]}
+    {"event": "result", "job": 1, "result": {...}}
+    {"event": "error", "job": 1, "message": "...", "exit_code": 4}
+
+Binary data can't be sent as JSON strings so the value of each BYTES param
+is sent as {"bytes": BASE64} and every other str is decoded as latin-1 (which
+keeps ASCII text unchanged). The submit function turns the BYTES values back
+into strs.
+
+The {"op": "boards"} request returns the state of each board and
+{"op": "shutdown"} stops the daemon. The submit function in this module
+implements the client side.
+
+The metrics of every session (see metrics.py) can be scraped by Prometheus
+from --metrics_port or written to --metrics_file after every job.
+
+Use either -h or --help to print the help menu from a command line.
+
+"""
+import os
+import sys
+import json
+import errno
+import base64
+import socket
+import argparse
+import threading
+import traceback
+import Queue
+import SocketServer
+
+import maker
+import dbg
+import rtt
+import lcli
+import metrics
+
+
+def _default_socket_path():
+    """Returns a socket path that only the current user can write to."""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if (runtime_dir and os.path.isdir(runtime_dir)):
+        return os.path.join(runtime_dir, 'lysd.sock')
+    return os.path.join(os.path.expanduser('~'), '.lysd.sock')
+
+
+DEFAULT_SOCKET_PATH = _default_socket_path()
+
+# The J-Link's RTT socket only exposes channel 0 for a single debugger so the
+# daemon reads and writes the channel through each debugger instead.
+RTT_CONTROL_CHANNEL = 0
+
+
+class LysdError(Exception):
+    """Subclass for reporting errors."""
+
+    def __init__(self, err_str, exit_code=None):
+        """Creates a new object with the given message and exit code."""
+        super(LysdError, self).__init__(err_str)
+        self.exit_code = exit_code
+
+
+class Job(object):
+    """An experiment that is waiting for (or running on) a board. Events for
+    the client are put in the events queue.
+
+    """
+
+    def __init__(self, job_id, request):
+        """Creates a new object from a submit request."""
+        self.jobId = job_id
+        self.request = request
+        self.sn = request.get('sn')
+        self.events = Queue.Queue()
+
+    def send(self, event, **kwargs):
+        """Queues an event for the client."""
+        kwargs['event'] = event
+        kwargs['job'] = self.jobId
+        self.events.put(kwargs)
+
+
+class Board(threading.Thread):
+    """Keeps one debugger attached and runs the jobs that the daemon assigns
+    to it.
+
+    """
+
+    def __init__(self, lysd, sn):
+        """Creates a new object but does not attach or start the thread."""
+        super(Board, self).__init__()
+        self.daemon = True
+
+        self.sn = sn
+        self.job = None
+
+        self._lysd = lysd
+        self._debugger = None
+
+    def attach(self):
+        """Attaches to the debugger if it isn't already attached."""
+        if (self._debugger is None):
+            self._debugger = dbg.Debugger(self.sn)
+
+    def detach(self):
+        """Closes the debugger. Errors are ignored because the board is
+        either being shut down or is already in a bad state.
+
+        """
+        if (self._debugger is not None):
+            try:
+                self._debugger.close()
+            except Exception:
+                pass
+            self._debugger = None
+
+    def run(self):
+        """Runs jobs until the daemon shuts down."""
+        while (True):
+            job = self._lysd.next_job(self)
+            if (job is None):
+                break
+            job.send('started', sn=self.sn)
+            try:
+                job.send('result', result=self._run_job(job))
+            except (lcli.LCLIError, LysdError) as err:
+                job.send('error', message=err.message, exit_code=err.exit_code)
+            except maker.MakerError as err:
+                job.send('error', message=err.message,
+                    exit_code=lcli.EXIT_CODES['LCLI_EXIT_CODE_MAKE_ERROR'])
+            except Exception as err:
+                # Start over with a fresh connection for the next job.
+                self.detach()
+                job.send('error',
+                    message=('%s: %s' % (type(err).__name__, err)),
+                    exit_code=lcli.EXIT_CODES['LCLI_EXIT_CODE_INTERNAL_ERROR'])
+                if (self._lysd.verbose):
+                    traceback.print_exc()
+            finally:
+                self._lysd.job_done(self)
+        self.detach()
+
+    def _run_job(self, job):
+        """Resets the target and runs a session on it. Returns the expanded
+        result dictionary.
+
+        """
+        request = job.request
+        init_params = request.get('init_params')
+        if (init_params):
+            init_params = lcli.LCLI.parse_condensed_params(str(init_params))
+
+        if (request.get('makefile_dir')):
+            # make needs the debugger to itself.
+            self.detach()
+            maker.build_and_flash(request['makefile_dir'], self.sn)
+
+        self.attach()
+        self._debugger.reset()
+        self._debugger.rtt_start()
+
+        bulk_channel = request.get('bulk_channel')
+        bulk_read_func = None
+        if (bulk_channel is not None):
+            bulk_read_func = (lambda n:
+                self._debugger.rtt_read(bulk_channel, n))
+
+        _lcli = lcli.LCLI()
+        terminal = rtt.PolledRTT(self.sn,
+            lambda n: self._debugger.rtt_read(RTT_CONTROL_CHANNEL, n),
+            lambda data: self._debugger.rtt_write(RTT_CONTROL_CHANNEL, data),
+            _lcli.debugLog,
+            bulk_read_func=bulk_read_func)
+        try:
+            result_dict = _lcli.run_terminal(terminal,
+                init_params,
+                self._debugger.go,
+                bool(request.get('no_result')),
+                request.get('timeout_s'),
+                elf_file=request.get('elf_file'),
+                deadlines=request.get('deadlines'),
+                result_cb=(lambda param_type, value: job.send('param',
+                    param=lcli.LCLI.expand_param_types([(param_type,
+                        value)])[0])),
+                keep_results=request.get('keep_results', True),
+                compact_log=bool(request.get('compact_log')))
+        finally:
+            terminal.close()
+
+        if (request.get('verbose')):
+            result_dict['VERBOSE_OUTPUT'] = _lcli.debugLog
+        return lcli.LCLI.expand_result_dict(result_dict)
+
+
+class LysDaemon(object):
+    """Owns the boards, the queue of pending jobs, and the Unix socket."""
+
+    def __init__(self,
+                    socket_path=DEFAULT_SOCKET_PATH,
+                    serial_numbers=None,
+                    verbose=False,
+                    metrics_port=None,
+                    metrics_file=None):
+        """Enumerates the J-Link debuggers once and attaches to each of them
+        (or only to the given serial_numbers). Does not start serving. The
+        metrics are served over HTTP on the metrics_port and written to the
+        metrics_file after every job if either is given.
+
+        """
+        jlinks = dbg.enum_jlinks(refresh=True)
+        if (not jlinks):
+            raise LysdError('No J-Link debuggers found.',
+                lcli.EXIT_CODES['LCLI_EXIT_CODE_JLINK_NOT_FOUND'])
+        if (serial_numbers is None):
+            serial_numbers = jlinks
+        for sn in serial_numbers:
+            if (not sn in jlinks):
+                raise LysdError('The specified J-Link was not found (SN=%d).' %
+                    sn, lcli.EXIT_CODES['LCLI_EXIT_CODE_JLINK_NOT_FOUND'])
+
+        self.socketPath = socket_path
+        self.verbose = verbose
+        self.metricsPort = metrics_port
+        self.metricsFile = metrics_file
+        self.boards = []
+
+        self._pending = []
+        self._nextJobId = 1
+        self._cond = threading.Condition()
+        self._shutdown = False
+        self._server = None
+        self._metricsServer = None
+
+        for sn in serial_numbers:
+            board = Board(self, sn)
+            board.attach()
+            self.boards.append(board)
+
+    def serve_forever(self):
+        """Starts the boards and handles clients until shutdown is called."""
+        if (os.path.exists(self.socketPath)):
+            self._remove_stale_socket()
+        if (self.metricsPort is not None):
+            try:
+                self._metricsServer = metrics.REGISTRY.serve(self.metricsPort)
+            except metrics.MetricsError as err:
+                raise LysdError(err.message,
+                    lcli.EXIT_CODES['LCLI_EXIT_CODE_INTERNAL_ERROR'])
+        # Other users must not be able to connect and submit jobs.
+        old_umask = os.umask(0077)
+        try:
+            self._server = _Server(self.socketPath, _Handler)
+        finally:
+            os.umask(old_umask)
+        os.chmod(self.socketPath, 0600)
+        self._server.lysd = self
+
+        for board in self.boards:
+            board.start()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if (self._metricsServer):
+                self._metricsServer.close()
+                self._metricsServer = None
+            if (os.path.exists(self.socketPath)):
+                os.unlink(self.socketPath)
+            with self._cond:
+                self._shutdown = True
+                self._cond.notify_all()
+            for board in self.boards:
+                board.join()
+
+    def _remove_stale_socket(self):
+        """Removes a socket that was left behind by a daemon that didn't exit
+        cleanly. Raises a LysdError if a daemon is still listening on it or
+        if it can't be checked.
+
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socketPath)
+        except socket.error as err:
+            if (errno.ECONNREFUSED != err.errno):
+                raise LysdError('Could not check %s: %s' %
+                    (self.socketPath, err.strerror),
+                    lcli.EXIT_CODES['LCLI_EXIT_CODE_INTERNAL_ERROR'])
+            os.unlink(self.socketPath)
+            return
+        finally:
+            sock.close()
+        raise LysdError('lysd is already running at %s.' % self.socketPath,
+            lcli.EXIT_CODES['LCLI_EXIT_CODE_INTERNAL_ERROR'])
+
+    def shutdown(self):
+        """Stops serving; must be called from a different thread than
+        serve_forever. Jobs that are still pending are failed.
+
+        """
+        with self._cond:
+            self._shutdown = True
+            pending = self._pending
+            self._pending = []
+            metrics.JOBS_PENDING.set(0)
+            self._cond.notify_all()
+        for job in pending:
+            job.send('error', message='The daemon is shutting down.',
+                exit_code=lcli.EXIT_CODES['LCLI_EXIT_CODE_INTERNAL_ERROR'])
+        if (self._server):
+            self._server.shutdown()
+
+    def submit(self, request):
+        """Queues a job and returns it."""
+        sn = request.get('sn')
+        with self._cond:
+            job = Job(self._nextJobId, request)
+            self._nextJobId += 1
+            if (self._shutdown):
+                job.send('error', message='The daemon is shutting down.',
+                    exit_code=lcli.EXIT_CODES['LCLI_EXIT_CODE_INTERNAL_ERROR'])
+            elif ((sn is not None) and
+                    (not sn in [board.sn for board in self.boards])):
+                job.send('error',
+                    message=('The specified J-Link was not found (SN=%d).' %
+                        sn),
+                    exit_code=lcli.EXIT_CODES['LCLI_EXIT_CODE_JLINK_NOT_FOUND'])
+            else:
+                job.send('queued')
+                self._pending.append(job)
+                metrics.JOBS_PENDING.set(len(self._pending))
+                self._cond.notify_all()
+        return job
+
+    def next_job(self, board):
+        """Blocks until there is a job that the board can run. Returns None
+        when the daemon is shutting down.
+
+        """
+        with self._cond:
+            while (not self._shutdown):
+                for job in self._pending:
+                    if ((job.sn is None) or (job.sn == board.sn)):
+                        self._pending.remove(job)
+                        metrics.JOBS_PENDING.set(len(self._pending))
+                        board.job = job
+                        return job
+                self._cond.wait()
+            return None
+
+    def job_done(self, board):
+        """Marks the board as free and updates the metrics_file."""
+        with self._cond:
+            board.job = None
+        if (self.metricsFile):
+            try:
+                metrics.REGISTRY.write_textfile(self.metricsFile)
+            except metrics.MetricsError:
+                # A full disk shouldn't fail the jobs.
+                if (self.verbose):
+                    traceback.print_exc()
+
+    def board_states(self):
+        """Returns a list of dictionaries that describe the boards and the
+        number of jobs that are waiting for one.
+
+        """
+        with self._cond:
+            states = [{'sn': board.sn,
+                'busy': (board.job is not None),
+                'job': (board.job.jobId if board.job else None)}
+                for board in self.boards]
+            return (states, len(self._pending))
+
+
+class _Server(SocketServer.ThreadingUnixStreamServer):
+    """Handles each client in its own thread."""
+    daemon_threads = True
+
+
+class _Handler(SocketServer.StreamRequestHandler):
+    """Reads requests from a client and writes the resulting events."""
+
+    def handle(self):
+        lysd = self.server.lysd
+        while (True):
+            line = self.rfile.readline()
+            if (not line):
+                return
+            try:
+                request = json.loads(line)
+                if (not isinstance(request, dict)):
+                    raise ValueError('Requests must be JSON objects.')
+            except ValueError as err:
+                self._send({'event': 'error', 'job': None,
+                    'message': ('Malformed request: %s' % err),
+                    'exit_code':
+                        lcli.EXIT_CODES['LCLI_EXIT_CODE_INVALID_PARAMS']})
+                continue
+
+            op = request.get('op')
+            if ('submit' == op):
+                job = lysd.submit(request)
+                while (True):
+                    event = self._send(job.events.get())
+                    if (event['event'] in ('result', 'error')):
+                        break
+            elif ('boards' == op):
+                states, pending = lysd.board_states()
+                self._send({'event': 'boards',
+                    'boards': states,
+                    'pending': pending})
+            elif ('shutdown' == op):
+                self._send({'event': 'shutdown'})
+                lysd.shutdown()
+                return
+            else:
+                self._send({'event': 'error', 'job': None,
+                    'message': ('Unknown op: %r' % op),
+                    'exit_code':
+                        lcli.EXIT_CODES['LCLI_EXIT_CODE_INVALID_PARAMS']})
+
+    def _send(self, event):
+        """Writes an event; a client that has gone away is ignored. An event
+        that can't be serialized is replaced by an error event. Returns the
+        event that was sent.
+
+        """
+        try:
+            line = json.dumps(_encode(event))
+        except (TypeError, ValueError) as err:
+            event = {'event': 'error',
+                'job': event.get('job'),
+                'message': ('Could not serialize the %s event: %s' %
+                    (event.get('event'), err)),
+                'exit_code': lcli.EXIT_CODES['LCLI_EXIT_CODE_INTERNAL_ERROR']}
+            line = json.dumps(event)
+        try:
+            self.wfile.write(line + '\n')
+            self.wfile.flush()
+        except socket.error:
+            pass
+        return event
+
+
+def _encode(obj):
+    """Returns a copy of obj that json can serialize no matter what bytes its
+    strs hold (see the module's docstring).
+
+    """
+    if (isinstance(obj, str)):
+        return obj.decode('latin-1')
+    if (isinstance(obj, (list, tuple))):
+        if ((2 == len(obj)) and
+                (obj[0] in ('BYTES', 'LYS_PARAM_TYPE_BYTES')) and
+                isinstance(obj[1], str)):
+            return [obj[0], {'bytes': base64.b64encode(obj[1])}]
+        return [_encode(item) for item in obj]
+    if (isinstance(obj, dict)):
+        return dict((_encode(key), _encode(value))
+            for key, value in obj.items())
+    return obj
+
+
+def _decode_bytes(obj):
+    """Turns the {"bytes": BASE64} objects of BYTES values back into strs."""
+    if ((1 == len(obj)) and ('bytes' in obj)):
+        return base64.b64decode(obj['bytes'])
+    return obj
+
+
+def _request(socket_path, request, event_cb=None):
+    """Sends a request and returns the last event of its response."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(socket_path)
+        except socket.error as err:
+            raise LysdError('Could not connect to lysd at %s: %s' %
+                (socket_path, err.strerror),
+                lcli.EXIT_CODES['LCLI_EXIT_CODE_INTERNAL_ERROR'])
+        f = sock.makefile('rwb')
+        f.write(json.dumps(request) + '\n')
+        f.flush()
+        while (True):
+            line = f.readline()
+            if (not line):
+                raise LysdError('lysd closed the connection.',
+                    lcli.EXIT_CODES['LCLI_EXIT_CODE_INTERNAL_ERROR'])
+            event = json.loads(line, object_hook=_decode_bytes)
+            if (event_cb is not None):
+                event_cb(event)
+            if (event['event'] not in ('queued', 'started', 'param')):
+                return event
+    finally:
+        sock.close()
+
+
+def submit(init_params=None,
+            timeout_s=None,
+            no_result=False,
+            makefile_dir=None,
+            elf_file=None,
+            sn=None,
+            bulk_channel=None,
+            deadlines=None,
+            keep_results=True,
+            compact_log=False,
+            verbose=False,
+            socket_path=DEFAULT_SOCKET_PATH,
+            event_cb=None):
+    """Runs a job on the daemon and returns the same dictionary that lcli.py
+    prints (with lists in place of tuples). The init_params can be a list of
+    tuples or the condensed str form and the deadlines, keep_results, and
+    compact_log are the same as for LCLI.run. If sn is None then the first free board is
+    used. The event_cb, if given, receives every event as it arrives
+    (including a "param" event for each result). Raises a LysdError if the job
+    fails.
+
+    """
+    if ((init_params is not None) and (not isinstance(init_params, str))):
+        init_params = repr(init_params)
+    event = _request(socket_path,
+        {'op': 'submit',
+            'init_params': init_params,
+            'timeout_s': timeout_s,
+            'no_result': no_result,
+            'makefile_dir': makefile_dir,
+            'elf_file': elf_file,
+            'sn': sn,
+            'bulk_channel': bulk_channel,
+            'deadlines': deadlines,
+            'keep_results': keep_results,
+            'compact_log': compact_log,
+            'verbose': verbose},
+        event_cb)
+    if ('error' == event['event']):
+        raise LysdError(event['message'], event['exit_code'])
+    return event['result']
+
+
+def boards(socket_path=DEFAULT_SOCKET_PATH):
+    """Returns a list of dictionaries with each board's 'sn', whether it is
+    'busy', and the ID of the 'job' that it is running.
+
+    """
+    return _request(socket_path, {'op': 'boards'})['boards']
+
+
+def shutdown(socket_path=DEFAULT_SOCKET_PATH):
+    """Asks the daemon to exit."""
+    _request(socket_path, {'op': 'shutdown'})
+
+
+if __name__ == "__main__":
+    """Parses the command line arguments and runs the daemon until it is shut
+    down or interrupted.
+
+    """
+    parser = argparse.ArgumentParser(description='Run Lys experiments on ' +
+        'warm J-Link connections.')
+    parser.add_argument('-S',
+        '--socket',
+        dest='socket_path',
+        type=str,
+        default=DEFAULT_SOCKET_PATH,
+        help='the path of the Unix socket to listen on (default: %s)' %
+        DEFAULT_SOCKET_PATH)
+    parser.add_argument('-s',
+        '--serial_number',
+        dest='serial_numbers',
+        type=int,
+        action='append',
+        help='the serial number of a J-Link debugger to use (may be ' +
+        'repeated; default: all of them)')
+    parser.add_argument('-v',
+        dest='verbose',
+        action='store_true',
+        help='print tracebacks for unexpected errors')
+    parser.add_argument('--metrics_port',
+        dest='metrics_port',
+        type=int,
+        default=None,
+        help='serve Prometheus metrics over HTTP on this local port')
+    parser.add_argument('--metrics_file',
+        dest='metrics_file',
+        type=str,
+        default=None,
+        help='write Prometheus metrics to this file after every job (e.g. ' +
+        "for node_exporter's textfile collector)")
+
+    args = parser.parse_args()
+    try:
+        daemon = LysDaemon(args.socket_path,
+            args.serial_numbers,
+            args.verbose,
+            args.metrics_port,
+            args.metrics_file)
+    except LysdError as err:
+        print os.linesep + 'ERROR: ' + err.message + os.linesep
+        sys.exit(err.exit_code)
+
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    except LysdError as err:
+        print os.linesep + 'ERROR: ' + err.message + os.linesep
+        sys.exit(err.exit_code)
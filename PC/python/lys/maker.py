@@ -1,29 +1,128 @@
+import time
+import threading
 import subprocess
+import multiprocessing
 
 
 BUILD_TYPES = ['debug', 'release']
 
+# The Makefile targets that only compile each build type.
+BUILD_TARGETS = {'debug': 'default', 'release': 'release'}
+
 
 class MakerError(Exception):
 	"""Subclass for reporting errors."""
 	pass
 
 
+class MakeResult(object):
+	"""The outcome of one invocation of make. The sn is None for a build."""
+
+	def __init__(self, sn, returncode, out, err, elapsed_s):
+		self.sn = sn
+		self.returncode = returncode
+		self.out = out
+		self.err = err
+		self.elapsed_s = elapsed_s
+
+	@property
+	def ok(self):
+		return (0 == self.returncode)
+
+	def __repr__(self):
+		return ('MakeResult(sn=%r, returncode=%d, elapsed_s=%.2f)' %
+			(self.sn, self.returncode, self.elapsed_s))
+
+
 def build_and_flash(armgcc_path, sn, version="debug"):
 	"""Calls make in the specified directory to build and download the project
 	to the debugger with the given serial number.
 
 	"""
+	version = _check_version(version)
+	result = _make(armgcc_path, ['flash_%s' % version, 'SN=%d' % sn], sn)
+	if (not result.ok):
+		raise MakerError('Make exited with error number %d.' %
+			result.returncode)
+
+
+def build(armgcc_path, version="debug", jobs=None):
+	"""Compiles the project without downloading it. The jobs are passed to
+	make's -j option and default to the number of CPUs. Returns a MakeResult.
+
+	"""
+	version = _check_version(version)
+	if (jobs is None):
+		jobs = multiprocessing.cpu_count()
+	result = _make(armgcc_path, ['-j%d' % jobs, BUILD_TARGETS[version]])
+	if (not result.ok):
+		raise MakerError('Make exited with error number %d.' %
+			result.returncode)
+	return result
+
+
+def build_and_flash_all(armgcc_path,
+						serial_numbers,
+						version="debug",
+						jobs=None,
+						max_parallel=None):
+	"""Compiles the project once and then downloads it to every one of the
+	serial_numbers at the same time (or at most max_parallel at a time).
+	Returns a (build_result, flash_results) tuple where flash_results is a
+	dictionary of MakeResult objects keyed by serial number. A failed build
+	raises a MakerError but a failed download is only reported in its
+	MakeResult so that the other boards can still be used.
+
+	"""
+	version = _check_version(version)
+	build_result = build(armgcc_path, version, jobs)
+
+	if (max_parallel is None):
+		max_parallel = len(serial_numbers)
+	semaphore = threading.Semaphore(max(1, max_parallel))
+	flash_results = {}
+	lock = threading.Lock()
+
+	def flash(sn):
+		with semaphore:
+			start = time.time()
+			try:
+				# The build is up to date so make only runs nrfjprog.
+				result = _make(armgcc_path,
+					['flash_%s' % version, 'SN=%d' % sn],
+					sn)
+			except MakerError as err:
+				# The thread can't raise so the error goes in the result.
+				result = MakeResult(sn, -1, '', str(err), (time.time() - start))
+		with lock:
+			flash_results[sn] = result
+
+	threads = [threading.Thread(target=flash, args=(sn,))
+		for sn in serial_numbers]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+	return (build_result, flash_results)
+
+
+def _check_version(version):
+	"""Returns the version in lower case or raises a MakerError."""
 	version = version.lower()
 	if (not version in BUILD_TYPES):
 		raise MakerError("Invalid version param: ", version)
+	return version
 
-	process = subprocess.Popen(['make', 'flash_%s' % version, 'SN=%d' % sn],
-		cwd=armgcc_path,
-		stdout=subprocess.PIPE, 
-		stderr=subprocess.PIPE)
-	out, err = process.communicate()
-	errcode = process.returncode
 
-	if (errcode != 0):
-		raise MakerError('Make exited with error number %d.' % errcode)
+def _make(armgcc_path, args, sn=None):
+	"""Runs make with the given args and returns a MakeResult."""
+	start = time.time()
+	try:
+		process = subprocess.Popen(['make'] + args,
+			cwd=armgcc_path,
+			stdout=subprocess.PIPE,
+			stderr=subprocess.PIPE)
+	except OSError as err:
+		raise MakerError('Make could not be started: %s' % err.strerror)
+	out, err = process.communicate()
+	return MakeResult(sn, process.returncode, out, err, (time.time() - start))
@@ -0,0 +1,368 @@
+"""Counts what the Lys stack does so that slow or flaky boards can be found
+across many sessions. LCLI, RTT, Lys, and lysd update the metrics below in
+REGISTRY, labeled with the J-Link serial number ('sn') of the board (replays
+of captures aren't counted), and the registry can be exported in the
+Prometheus text format either as a file (e.g. for the node_exporter textfile
+collector) or from a local HTTP server:
+
+    metrics.REGISTRY.write_textfile('/var/lib/node_exporter/lys.prom')
+    server = metrics.REGISTRY.serve(9464)
+
+Runs per minute are rate(lys_runs_total[1m]) and a board's failure rate is
+its runs with an outcome other than 'ok' divided by all of its runs. The
+registry is only kept in memory so the counters start from zero in every
+process, which Prometheus handles as a counter reset.
+
+Other metrics can be added with Registry.counter, gauge, and histogram. Every
+update takes the values of the metric's labels as keyword arguments:
+
+    jobs = metrics.REGISTRY.counter('my_jobs_total', 'Jobs run.', ('sn',))
+    jobs.inc(sn='682522292')
+
+"""
+import os
+import math
+import threading
+
+
+# The upper bounds of the default histogram buckets in seconds.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0, 30.0, 60.0, 120.0, 300.0)
+ACK_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+    0.5, 1.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class MetricsError(Exception):
+    """Subclass for reporting errors."""
+    pass
+
+
+class Metric(object):
+    """The values of a metric for every combination of its labels that has
+    been used.
+
+    """
+
+    TYPE = 'untyped'
+
+    def __init__(self, name, help_str, label_names=()):
+        self.name = name
+        self.help = help_str
+        self.labelNames = tuple(label_names)
+        # Maps a tuple of label values to the value.
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Forgets every value."""
+        with self._lock:
+            self._values = {}
+
+    def value(self, **labels):
+        """Returns the value for the given labels (or None)."""
+        with self._lock:
+            return self._values.get(self._key(labels))
+
+    def samples(self):
+        """Returns a list of (suffix, labels, value) tuples, where labels is a
+        list of (name, value) tuples, sorted by their labels.
+
+        """
+        with self._lock:
+            items = sorted(self._values.items())
+        return [('', zip(self.labelNames, key), value) for key, value in items]
+
+    def _key(self, labels):
+        """Returns the tuple of label values for a labels dictionary."""
+        if (len(labels) != len(self.labelNames)):
+            raise MetricsError("%s needs the labels %r, not %r." %
+                (self.name, self.labelNames, tuple(sorted(labels.keys()))))
+        try:
+            return tuple(str(labels[name]) for name in self.labelNames)
+        except KeyError:
+            raise MetricsError("%s needs the labels %r, not %r." %
+                (self.name, self.labelNames, tuple(sorted(labels.keys()))))
+
+
+class Counter(Metric):
+    """A count that only goes up."""
+
+    TYPE = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """Adds a non-negative amount."""
+        if (0 > amount):
+            raise MetricsError("Counters can't decrease: %s" % self.name)
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = (self._values.get(key, 0) + amount)
+
+
+class Gauge(Metric):
+    """A value that can go up and down."""
+
+    TYPE = 'gauge'
+
+    def set(self, value, **labels):
+        """Replaces the value."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        """Adds an amount."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = (self._values.get(key, 0) + amount)
+
+    def dec(self, amount=1, **labels):
+        """Subtracts an amount."""
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Counts observations in buckets with upper bounds and keeps their sum
+    and count.
+
+    """
+
+    TYPE = 'histogram'
+
+    def __init__(self, name, help_str, label_names=(), buckets=DEFAULT_BUCKETS):
+        """The buckets are upper bounds in increasing order; a +Inf bucket is
+        always added.
+
+        """
+        super(Histogram, self).__init__(name, help_str, label_names)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+
+    def observe(self, value, **labels):
+        """Adds an observation."""
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if (state is None):
+                # The count of each bucket (without +Inf), the sum, and the
+                # count.
+                state = [[0] * len(self.buckets), 0.0, 0]
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if (value <= bound):
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def value(self, **labels):
+        """Returns a (bucket_counts, sum, count) tuple for the given labels
+        (or None). The bucket counts are cumulative.
+
+        """
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            if (state is None):
+                return None
+            return (list(state[0]), state[1], state[2])
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(state[0]), state[1], state[2]))
+                for key, state in self._values.items())
+        result = []
+        for key, (counts, total, count) in items:
+            labels = zip(self.labelNames, key)
+            for bound, bucket_count in zip(self.buckets, counts):
+                result.append(('_bucket',
+                    (labels + [('le', _format_value(bound))]),
+                    bucket_count))
+            result.append(('_bucket', (labels + [('le', '+Inf')]), count))
+            result.append(('_sum', labels, total))
+            result.append(('_count', labels, count))
+        return result
+
+
+class Registry(object):
+    """Holds metrics by name and exports them."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, help_str, label_names=()):
+        """Returns the Counter with the given name, creating it if needed."""
+        return self._get(Counter, name, help_str, label_names)
+
+    def gauge(self, name, help_str, label_names=()):
+        """Returns the Gauge with the given name, creating it if needed."""
+        return self._get(Gauge, name, help_str, label_names)
+
+    def histogram(self, name, help_str, label_names=(), buckets=DEFAULT_BUCKETS):
+        """Returns the Histogram with the given name, creating it if
+        needed.
+
+        """
+        return self._get(Histogram, name, help_str, label_names, buckets)
+
+    def get(self, name):
+        """Returns the metric with the given name or None."""
+        with self._lock:
+            return self._metrics.get(name)
+
+    def clear(self):
+        """Forgets the values of every metric but keeps the metrics."""
+        with self._lock:
+            metrics = self._metrics.values()
+        for metric in metrics:
+            metric.clear()
+
+    def render(self):
+        """Returns every metric in the Prometheus text format."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.append('# HELP %s %s' % (metric.name,
+                metric.help.replace('\\', '\\\\').replace('\n', '\\n')))
+            lines.append('# TYPE %s %s' % (metric.name, metric.TYPE))
+            for suffix, labels, value in metric.samples():
+                if (labels):
+                    label_str = ('{%s}' % ','.join('%s="%s"' %
+                        (name, _escape_label(label_value))
+                        for name, label_value in labels))
+                else:
+                    label_str = ''
+                lines.append('%s%s%s %s' % (metric.name,
+                    suffix,
+                    label_str,
+                    _format_value(value)))
+        return ('\n'.join(lines) + '\n')
+
+    def write_textfile(self, path):
+        """Replaces the file at path with the output of render. The file is
+        renamed into place so that readers never see part of it.
+
+        """
+        tmp_path = (path + '.tmp')
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(self.render())
+            os.rename(tmp_path, path)
+        except (IOError, OSError) as err:
+            raise MetricsError("Could not write metrics: %s" % err.strerror)
+
+    def serve(self, port, address='127.0.0.1'):
+        """Starts a MetricsServer that returns the output of render for
+        every GET request.
+
+        """
+        return MetricsServer(self, port, address)
+
+    def _get(self, cls, name, help_str, label_names, *args):
+        """Returns the existing metric with the name or a new one."""
+        with self._lock:
+            metric = self._metrics.get(name)
+            if (metric is None):
+                metric = cls(name, help_str, label_names, *args)
+                self._metrics[name] = metric
+            elif ((not isinstance(metric, cls)) or
+                    (metric.labelNames != tuple(label_names))):
+                raise MetricsError("%s already exists as a different metric." %
+                    name)
+            return metric
+
+
+class MetricsServer(object):
+    """An HTTP server in its own thread that exports a Registry."""
+
+    def __init__(self, registry, port, address='127.0.0.1'):
+        """Starts serving on the given address and port. Use port 0 to pick
+        a free port, which is then available as the port attribute.
+
+        """
+        # The HTTP modules are only loaded by programs that serve metrics.
+        import BaseHTTPServer
+
+        class _MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+            """Returns the registry's metrics for every GET request."""
+
+            def do_GET(self):
+                body = registry.render()
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                # Scrapes aren't logged to stderr.
+                pass
+
+        try:
+            self._server = BaseHTTPServer.HTTPServer((address, port),
+                _MetricsHandler)
+        except (IOError, OSError) as err:
+            raise MetricsError("Could not serve metrics: %s" % err.strerror)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        """Stops serving and waits for the thread."""
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+
+def _escape_label(value):
+    """Escapes a label value for the text format."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    """Returns a sample value in the text format."""
+    if (isinstance(value, float)):
+        if (math.isnan(value)):
+            return 'NaN'
+        if (math.isinf(value)):
+            if (0 < value):
+                return '+Inf'
+            return '-Inf'
+        return repr(value)
+    return str(value)
+
+
+# The metrics that are updated by the lys modules.
+REGISTRY = Registry()
+
+RUNS = REGISTRY.counter('lys_runs_total',
+    "LCLI sessions by outcome ('ok', 'error', or 'deadline').",
+    ('sn', 'outcome'))
+RUN_SECONDS = REGISTRY.histogram('lys_run_duration_seconds',
+    'The time from opening the terminal until the session ended.',
+    ('sn',))
+RUNS_ACTIVE = REGISTRY.gauge('lys_runs_active',
+    'LCLI sessions that are in progress.',
+    ('sn',))
+LAST_RUN_TIME = REGISTRY.gauge('lys_last_run_timestamp_seconds',
+    'The time.time() when the last session ended.',
+    ('sn',))
+DEADLINES = REGISTRY.counter('lys_deadlines_total',
+    'Sessions abandoned because a phase took too long.',
+    ('sn', 'phase'))
+RTT_ERRORS = REGISTRY.counter('lys_rtt_errors_total',
+    'RTT_EVENT_ERROR events read from the terminal.',
+    ('sn',))
+RTT_BYTES = REGISTRY.counter('lys_rtt_bytes_total',
+    "Bytes read ('rx') from and written ('tx') to the terminal.",
+    ('sn', 'direction'))
+DEVICE_ERRORS = REGISTRY.counter('lys_device_errors_total',
+    'LYS_OP_UNKNOWN messages that reported an error on the board.',
+    ('sn',))
+ACK_SECONDS = REGISTRY.histogram('lys_ack_latency_seconds',
+    'The time from sending a message until its LYS_OP_ACK arrived.',
+    ('sn',),
+    ACK_BUCKETS)
+JOBS_PENDING = REGISTRY.gauge('lys_jobs_pending',
+    'lysd jobs that are waiting for a board.')
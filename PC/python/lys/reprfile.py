@@ -0,0 +1,58 @@
+"""Reads back the files that store the repr of Python values: the log files
+that lcli.py writes with --log_file, sweep journals (see checkpoint.py), and
+stats snapshots. ast.literal_eval can't read the repr of a float that isn't
+finite (e.g. a FLOAT32 result of nan or inf) so literal_eval reads the names
+nan and inf as floats as well:
+
+    reprfile.literal_eval(repr([('FLOAT32', float('nan'))]))
+
+params_key turns a list of init params into the str that these files use to
+find the records of the same params.
+
+"""
+import ast
+
+
+# The names that repr uses for floats that aren't finite.
+_FLOAT_NAMES = {'nan': float('nan'), 'inf': float('inf')}
+
+
+class ReprFileError(Exception):
+    """Subclass for reporting errors."""
+    pass
+
+
+class _FloatNames(ast.NodeTransformer):
+    """Replaces the names nan, inf, and -inf with numbers."""
+
+    def visit_Name(self, node):
+        if (node.id in _FLOAT_NAMES):
+            return ast.copy_location(ast.Num(_FLOAT_NAMES[node.id]), node)
+        return node
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if (isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Num)):
+            return ast.copy_location(ast.Num(-node.operand.n), node)
+        return node
+
+
+def literal_eval(node_or_string):
+    """The same as ast.literal_eval except that the names nan and inf are
+    floats. Raises SyntaxError or ValueError like ast.literal_eval.
+
+    """
+    if (isinstance(node_or_string, basestring)):
+        node_or_string = ast.parse(node_or_string, mode='eval')
+    return ast.literal_eval(_FloatNames().visit(node_or_string))
+
+
+def params_key(init_params):
+    """Returns the str that identifies a list of init params, e.g. in a
+    logreader index or a stats.Aggregator. Lists and tuples are treated the
+    same way.
+
+    """
+    if (init_params is None):
+        return repr(None)
+    return repr([tuple(p) for p in init_params])
@@ -3,6 +3,8 @@ import Queue
 import socket
 import select
 
+import metrics
+
 # TODO: Probably needs to be opened and closed if two debuggers are present.
 
 class RTTError(Exception):
@@ -10,6 +12,15 @@ class RTTError(Exception):
     pass
 
 
+# The RTTEvent types as plain ints so that the event loops can compare them
+# directly.
+RTT_EVENT_STARTUP = 0
+RTT_EVENT_CONNECTED = 1
+RTT_EVENT_RX = 2
+RTT_EVENT_IDLE = 3
+RTT_EVENT_ERROR = 4
+
+
 class RTTEvent(object):
     """A simple object for use when passing data between threads in a queue."""
 
@@ -29,18 +40,33 @@ class RTTEvent(object):
     'RTT_EVENT_ERROR': 4
     }
 
-    def __init__(self, event_type):
-        """Creates a new object with the given event type."""
+    # One is created for every chunk that is read so there is no __dict__.
+    __slots__ = ('event_type', 'err_str', 'data')
+
+    def __init__(self, event_type, data=None, err_str=None):
+        """Creates a new object with the given event type, which can be an
+        int or a RTT_EVENT_X str.
+
+        """
         if (isinstance(event_type, str)):
             self.event_type = self.EVENT_TYPES_REVERSE[event_type]
         else:
             self.event_type = event_type
-        self.err_str = None
-        self.data = None
+        self.err_str = err_str
+        self.data = data
 
-    def is_type(self, event_type_str):
+    def is_type(self, event_type):
         """A convenience method for comparing types."""
-        return (self.event_type == self.EVENT_TYPES_REVERSE[event_type_str])
+        if (isinstance(event_type, str)):
+            event_type = self.EVENT_TYPES_REVERSE[event_type]
+        return (self.event_type == event_type)
+
+
+# Events without data are shared instead of being created every time. They
+# must not be modified.
+STARTUP_EVENT = RTTEvent(RTT_EVENT_STARTUP)
+CONNECTED_EVENT = RTTEvent(RTT_EVENT_CONNECTED)
+IDLE_EVENT = RTTEvent(RTT_EVENT_IDLE)
 
 
 class RTT(object):
@@ -49,19 +75,56 @@ class RTT(object):
 
     """
 
-    def __init__(self, sn, debug_log=None):
-        """Constructs a new RTT object and starts an RTT thread."""
+    # Whether the traffic and sessions of this kind of terminal are counted in
+    # the metrics module (replays of captures are not).
+    METRICS = True
+
+    def __init__(self,
+                    sn,
+                    debug_log=None,
+                    tracer=None,
+                    capture=None,
+                    bulk_read_func=None):
+        """Constructs a new RTT object and starts an RTT thread. If a
+        tracer.Tracer is given then socket activity will be recorded with it.
+        If a capture.CaptureWriter is given then every chunk that is read from
+        or written to the socket will be saved to it. If a bulk_read_func is
+        given then a second thread uses it to poll a bulk RTT channel (e.g.
+        dbg.rtt_read) and its data is made available via read_bulk.
+
+        """
+        self._init_state(sn, debug_log, tracer)
+
+        self._thread = RTTThread(self.rxQueue,
+            self.txQueue,
+            tracer=tracer,
+            capture=capture)
+        self._thread.start()
+
+        if (bulk_read_func is not None):
+            self._bulkThread = RTTBulkThread(bulk_read_func,
+                self.bulkQueue,
+                tracer=tracer,
+                capture=capture)
+            self._bulkThread.start()
+
+    def _init_state(self, sn, debug_log, tracer):
+        """Sets up the queues and state that every kind of terminal shares.
+        The constructors then start the threads that fill the queues.
+
+        """
         self.sn = sn
 
         self._debugLog = debug_log
+        self._tracer = tracer
         self.rxQueue = Queue.Queue()
         self.txQueue = Queue.Queue()
+        self.bulkQueue = Queue.Queue()
         self.snConfirmed = False
         self.startupIdleCount = 0
         self.closed = False
-
-        self._thread = RTTThread(self.rxQueue, self.txQueue)
-        self._thread.start()
+        self._thread = None
+        self._bulkThread = None
 
     def write(self, data_str):
         """Adds the specified str to write queue."""
@@ -69,50 +132,91 @@ class RTT(object):
             raise RTTError("Can not write to a closed terminal.")
         if (self._debugLog):
             self._debugLog.append('[RTT] Writing: ' + str([ord(x) for x in data_str]))
+        if (self._tracer):
+            self._tracer.instant('write', 'rtt', {'len': len(data_str)})
+        if (self.METRICS):
+            metrics.RTT_BYTES.inc(len(data_str), sn=self.sn, direction='tx')
         self.txQueue.put(data_str)
 
     def close(self):
         """Instructs the RTT thread to shutdown."""
         self.closed = True
         self._thread.close()
+        if (self._bulkThread is not None):
+            self._bulkThread.close()
+            if (self._bulkThread is not threading.current_thread()):
+                # Wait for the thread so that the debugger can be closed.
+                self._bulkThread.join(RTTBulkThread.JOIN_TIMEOUT_S)
+
+    def read_bulk(self):
+        """Returns the next RTT_EVENT_RX event from the bulk channel or None if
+        no data is waiting. Never blocks.
+
+        """
+        try:
+            event = self.bulkQueue.get_nowait()
+        except Queue.Empty:
+            return None
+        self._count_event(event)
+        return event
 
     def read(self, block=True, timeout_s=None):
         """Reads an item from the queue."""
+        return self._count_event(self._read(block, timeout_s))
+
+    def _read(self, block, timeout_s):
+        """Reads an item from the queue and turns it into the event that
+        read returns.
+
+        """
         event = self.rxQueue.get(block, timeout_s)
-        if (event.is_type('RTT_EVENT_RX')):
+        if (RTT_EVENT_RX == event.event_type):
             if (self.snConfirmed):
                 if (not event.data.startswith('Process: ')):
                     return event
                 else:
-                    return RTTEvent('RTT_EVENT_STARTUP')
+                    return STARTUP_EVENT
             else:
                 sn = self._parse_sn(event.data)
                 if (sn is not None):
                     if (sn == self.sn):
                         self.snConfirmed = True
-                        return RTTEvent('RTT_EVENT_CONNECTED')
+                        return CONNECTED_EVENT
                     else:
                         self.close()
-                        event = RTTEvent('RTT_EVENT_ERROR')
-                        event.err_str = ("Incorrect serial number found: %d"%sn)
+                        event = RTTEvent(RTT_EVENT_ERROR,
+                            err_str=("Incorrect serial number found: %d" % sn))
                         return event
                 else:
-                    return RTTEvent('RTT_EVENT_STARTUP')
-        elif (event.is_type('RTT_EVENT_IDLE')):
+                    return STARTUP_EVENT
+        elif (RTT_EVENT_IDLE == event.event_type):
             if (self.snConfirmed):
                 return event
             else:
                 self.close()
-                event = RTTEvent('RTT_EVENT_ERROR')
-                event.err_str = ("J-Link serial number could not be confirmed.")
+                event = RTTEvent(RTT_EVENT_ERROR,
+                    err_str="J-Link serial number could not be confirmed.")
                 return event
-        elif (event.is_type('RTT_EVENT_ERROR')):
+        elif (RTT_EVENT_CONNECTED == event.event_type):
+            self.snConfirmed = True
+            return event
+        elif (RTT_EVENT_ERROR == event.event_type):
             self.close()
             return event
         else:
             raise RTTError("Unknown RTTEvent type: %d" % event.event_type)
         self.rxQueue.task_done()
 
+    def _count_event(self, event):
+        """Updates the RTT metrics for an event that is being returned."""
+        if (not self.METRICS):
+            pass
+        elif (RTT_EVENT_RX == event.event_type):
+            metrics.RTT_BYTES.inc(len(event.data), sn=self.sn, direction='rx')
+        elif (RTT_EVENT_ERROR == event.event_type):
+            metrics.RTT_ERRORS.inc(sn=self.sn)
+        return event
+
     def _parse_sn(self, r_str):
         # NOTE: If this is the first time the socket has been read then it will
         #       start by printing a few lines:
@@ -130,6 +234,53 @@ class RTT(object):
                         pass
 
 
+class PolledRTT(RTT):
+    """Reads and writes RTT channel 0 with the given functions (e.g.
+    dbg.Debugger.rtt_read and rtt_write) instead of the J-Link's RTT socket.
+    The socket is only available for one J-Link at a time so this is used
+    when several boards are attached at once. The serial number is known in
+    advance so the first event is always RTT_EVENT_CONNECTED.
+
+    """
+
+    def __init__(self,
+                    sn,
+                    read_func,
+                    write_func,
+                    debug_log=None,
+                    tracer=None,
+                    bulk_read_func=None):
+        """Constructs a new object and starts an RTTPollThread. The read_func
+        must accept a max length and return a str and the write_func must
+        accept a str and return the number of bytes that were written.
+
+        """
+        self._init_state(sn, debug_log, tracer)
+
+        self.rxQueue.put(CONNECTED_EVENT)
+        self._thread = RTTPollThread(read_func,
+            write_func,
+            self.rxQueue,
+            self.txQueue,
+            tracer=tracer)
+        self._thread.start()
+
+        if (bulk_read_func is not None):
+            self._bulkThread = RTTBulkThread(bulk_read_func,
+                self.bulkQueue,
+                tracer=tracer)
+            self._bulkThread.start()
+
+    def close(self):
+        """Instructs the threads to shutdown and waits for them so that the
+        debugger can be reused.
+
+        """
+        super(PolledRTT, self).close()
+        if (self._thread is not threading.current_thread()):
+            self._thread.join(RTTPollThread.JOIN_TIMEOUT_S)
+
+
 class RTTThread(threading.Thread):
     """Creates a simple interface to the telnet socket that is created by
     SEGGER's RTT-enabled J-Link drivers. See
@@ -140,9 +291,16 @@ class RTTThread(threading.Thread):
     DEFAULT_HOST = "127.0.0.1"
     DEFAULT_PORT = 19021
     DEFAULT_READ_LEN = 1024
+    MAX_READ_LEN = 65536
     DEFAULT_TIMEOUT_S = 0.1
 
-    def __init__(self, rx_queue, tx_queue, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    def __init__(self,
+                    rx_queue,
+                    tx_queue,
+                    host=DEFAULT_HOST,
+                    port=DEFAULT_PORT,
+                    tracer=None,
+                    capture=None):
         """Creates a new object but does not start the thread."""
         super(RTTThread, self).__init__()
         self.daemon = True
@@ -154,9 +312,37 @@ class RTTThread(threading.Thread):
         self._port = port
         self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self._stop = threading.Event()
+        self._tracer = tracer
+        self._capture = capture
+        # Every read goes into the same buffer, which grows while reads fill
+        # it (i.e. during a burst) and shrinks again when they don't.
+        self._readBuf = bytearray(self.DEFAULT_READ_LEN)
+        self._readView = memoryview(self._readBuf)
+
+    def _recv(self):
+        """Reads whatever is waiting on the socket and returns it as a str,
+        which is empty if the socket was closed. The str is the only copy that
+        is made and it is owned by the consumer of the rxQueue.
+
+        """
+        n = self._sock.recv_into(self._readBuf)
+        r_str = self._readView[:n].tobytes()
+        size = len(self._readBuf)
+        if ((n == size) and (size < self.MAX_READ_LEN)):
+            self._resize_buf(size * 2)
+        elif ((n < (size / 4)) and (size > self.DEFAULT_READ_LEN)):
+            self._resize_buf(size / 2)
+        return r_str
+
+    def _resize_buf(self, size):
+        """Replaces the read buffer with one of the given size."""
+        self._readBuf = bytearray(size)
+        self._readView = memoryview(self._readBuf)
 
     def run(self):
         """Interacts with the socket until the semaphore is set."""
+        if (self._tracer):
+            self._tracer.name_thread('RTTThread')
         try:
             self._sock.connect((self._host, self._port))
 
@@ -178,31 +364,42 @@ class RTTThread(threading.Thread):
 
                 if readable:
                     idle = False
-                    r_str = self._sock.recv(self.DEFAULT_READ_LEN)
+                    r_str = self._recv()
                     if (r_str):
-                        event = RTTEvent('RTT_EVENT_RX')
-                        event.data = r_str
+                        if (self._tracer):
+                            self._tracer.instant('rx', 'rtt',
+                                {'len': len(r_str)})
+                        if (self._capture):
+                            self._capture.write_rx(r_str)
+                        event = RTTEvent(RTT_EVENT_RX, r_str)
                         self.rxQueue.put(event)
 
                 if writable:
                     if (self.txQueue.not_empty):
-                        if (0 == self._sock.send(self.txQueue.get())):
-                            event = RTTEvent('RTT_EVENT_ERROR')
-                            event.err_str = 'Socket connection broken.'
+                        w_str = self.txQueue.get()
+                        if (self._tracer):
+                            self._tracer.instant('tx', 'rtt',
+                                {'len': len(w_str)})
+                        if (self._capture):
+                            self._capture.write_tx(w_str)
+                        if (0 == self._sock.send(w_str)):
+                            event = RTTEvent(RTT_EVENT_ERROR,
+                                err_str='Socket connection broken.')
                             self.rxQueue.put(event)
                             self.close()
 
                 if (idle):
-                   self.rxQueue.put(RTTEvent('RTT_EVENT_IDLE'))
+                   self.rxQueue.put(IDLE_EVENT)
 
                 if (errored):
-                    event = RTTEvent('RTT_EVENT_ERROR')
-                    event.err_str = 'Select exception'
+                    if (self._tracer):
+                        self._tracer.instant('select_error', 'rtt')
+                    event = RTTEvent(RTT_EVENT_ERROR,
+                        err_str='Select exception')
                     self.rxQueue.put(event)
 
         except socket.error as err:
-            event = RTTEvent('RTT_EVENT_ERROR')
-            event.err_str = err.strerror
+            event = RTTEvent(RTT_EVENT_ERROR, err_str=err.strerror)
             self.rxQueue.put(event)
             self.close()
 
@@ -211,3 +408,134 @@ class RTTThread(threading.Thread):
     def close(self):
         """Sets the semaphore to instruct the thread to close."""
         self._stop.set()
+
+
+class RTTBulkThread(threading.Thread):
+    """Polls a bulk RTT channel with the given read function and puts its
+    data in a queue. Keeping this traffic separate from the RTT socket means
+    that bursts of logs can't delay the control messages.
+
+    """
+
+    DEFAULT_READ_LEN = 1024
+    DEFAULT_POLL_INTERVAL_S = 0.01
+    JOIN_TIMEOUT_S = 1.0
+
+    def __init__(self,
+                    read_func,
+                    bulk_queue,
+                    poll_interval_s=DEFAULT_POLL_INTERVAL_S,
+                    tracer=None,
+                    capture=None):
+        """Creates a new object but does not start the thread. The read_func
+        must accept a max length and return a str.
+
+        """
+        super(RTTBulkThread, self).__init__()
+        self.daemon = True
+
+        self.bulkQueue = bulk_queue
+
+        self._readFunc = read_func
+        self._pollInterval = poll_interval_s
+        self._tracer = tracer
+        self._capture = capture
+        self._stop = threading.Event()
+
+    def run(self):
+        """Polls the channel until the semaphore is set."""
+        if (self._tracer):
+            self._tracer.name_thread('RTTBulkThread')
+        while (not self._stop.is_set()):
+            try:
+                r_str = self._readFunc(self.DEFAULT_READ_LEN)
+            except Exception as err:
+                event = RTTEvent(RTT_EVENT_ERROR,
+                    err_str=('Bulk channel read failed: %s' % err))
+                self.bulkQueue.put(event)
+                return
+
+            if (r_str):
+                if (self._tracer):
+                    self._tracer.instant('bulk_rx', 'rtt', {'len': len(r_str)})
+                if (self._capture):
+                    self._capture.write_bulk_rx(r_str)
+                event = RTTEvent(RTT_EVENT_RX, r_str)
+                self.bulkQueue.put(event)
+            else:
+                self._stop.wait(self._pollInterval)
+
+    def close(self):
+        """Sets the semaphore to instruct the thread to close."""
+        self._stop.set()
+
+
+class RTTPollThread(threading.Thread):
+    """Polls RTT channel 0 with the given read function and writes queued
+    data with the given write function. Produces the same events as
+    RTTThread.
+
+    """
+
+    DEFAULT_READ_LEN = 1024
+    DEFAULT_POLL_INTERVAL_S = 0.01
+    JOIN_TIMEOUT_S = 1.0
+
+    def __init__(self,
+                    read_func,
+                    write_func,
+                    rx_queue,
+                    tx_queue,
+                    poll_interval_s=DEFAULT_POLL_INTERVAL_S,
+                    tracer=None):
+        """Creates a new object but does not start the thread."""
+        super(RTTPollThread, self).__init__()
+        self.daemon = True
+
+        self.rxQueue = rx_queue
+        self.txQueue = tx_queue
+
+        self._readFunc = read_func
+        self._writeFunc = write_func
+        self._pollInterval = poll_interval_s
+        self._tracer = tracer
+        self._stop = threading.Event()
+
+    def run(self):
+        """Polls the channel until the semaphore is set."""
+        if (self._tracer):
+            self._tracer.name_thread('RTTPollThread')
+        pending = ''
+        while (not self._stop.is_set()):
+            try:
+                if (not pending):
+                    try:
+                        pending = self.txQueue.get_nowait()
+                    except Queue.Empty:
+                        pass
+                if (pending):
+                    n = self._writeFunc(pending)
+                    if (n):
+                        if (self._tracer):
+                            self._tracer.instant('tx', 'rtt', {'len': n})
+                        pending = pending[n:]
+
+                r_str = self._readFunc(self.DEFAULT_READ_LEN)
+            except Exception as err:
+                event = RTTEvent(RTT_EVENT_ERROR,
+                    err_str=('RTT poll failed: %s' % err))
+                self.rxQueue.put(event)
+                return
+
+            if (r_str):
+                if (self._tracer):
+                    self._tracer.instant('rx', 'rtt', {'len': len(r_str)})
+                event = RTTEvent(RTT_EVENT_RX, r_str)
+                self.rxQueue.put(event)
+            else:
+                self.rxQueue.put(IDLE_EVENT)
+                self._stop.wait(self._pollInterval)
+
+    def close(self):
+        """Sets the semaphore to instruct the thread to close."""
+        self._stop.set()
@@ -0,0 +1,487 @@
+"""Summarizes the results of many runs without keeping them. An Aggregator is
+fed the dictionaries that are returned by LCLI.run and keeps, for every
+distinct INIT_PARAMS and every numeric result (by its index in 'RESULT'), the
+count, mean, variance, min, and max (with Welford's algorithm) and a
+QuantileSketch from which approximate quantiles can be read:
+
+    aggregator = stats.Aggregator(snapshot_path='stats.snapshot')
+    for i in xrange(0, 1000000):
+        aggregator.add(run_func(init_params))
+    for group in aggregator.summary():
+        print group['INIT_PARAMS'], group['RESULTS'][0]['QUANTILES'][0.99]
+
+The items of array results are added one at a time and results that aren't
+finite numbers are ignored. Aggregators (and their parts) can be merged so
+that runs on different boards or in different processes can be combined.
+If a snapshot_path is given then the state is written to it every
+snapshot_interval_s seconds as the repr of the to_dict form and
+Aggregator.load continues from it.
+
+The QuantileSketch is a KLL sketch: the values are kept in levels where each
+item of level h stands for 2**h values. A level that grows past its capacity
+is sorted and every other item (starting at a random one of the first two)
+moves up a level. The capacities shrink by a factor of 2/3 towards the lower
+levels so the sketch holds O(k) items however many values are added and a
+quantile's rank is off by roughly 1.7/k of the count.
+
+"""
+import os
+import math
+import time
+import random
+
+import reprfile
+
+
+# The size of the largest level of a QuantileSketch.
+DEFAULT_K = 200
+
+# The ratio of the capacities of adjacent levels and the smallest capacity.
+LEVEL_RATIO = (2.0 / 3.0)
+MIN_LEVEL_CAPACITY = 2
+
+DEFAULT_QUANTILES = (0.01, 0.1, 0.5, 0.9, 0.99)
+
+DEFAULT_SNAPSHOT_INTERVAL_S = 60
+
+
+class StatsError(Exception):
+    """Subclass for reporting errors."""
+    pass
+
+
+class RunningStats(object):
+    """The count, mean, variance, min, and max of the values that have been
+    added, updated in constant time and space.
+
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.min = None
+        self.max = None
+        # The sum of the squared differences from the mean.
+        self._m2 = 0.0
+
+    def add(self, value):
+        """Adds a single value."""
+        self.count += 1
+        delta = (value - self.mean)
+        self.mean += (delta / float(self.count))
+        self._m2 += (delta * (value - self.mean))
+        if ((self.min is None) or (value < self.min)):
+            self.min = value
+        if ((self.max is None) or (value > self.max)):
+            self.max = value
+
+    def merge(self, other):
+        """Adds the values of another RunningStats."""
+        if (0 == other.count):
+            return
+        if (0 == self.count):
+            self.count = other.count
+            self.mean = other.mean
+            self._m2 = other._m2
+            self.min = other.min
+            self.max = other.max
+            return
+
+        count = (self.count + other.count)
+        delta = (other.mean - self.mean)
+        self.mean += ((delta * other.count) / float(count))
+        self._m2 += (other._m2 +
+            ((delta * delta * self.count * other.count) / float(count)))
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def variance(self):
+        """Returns the sample variance or 0.0 if there are fewer than two
+        values.
+
+        """
+        if (2 > self.count):
+            return 0.0
+        return (self._m2 / (self.count - 1))
+
+    def stddev(self):
+        """Returns the sample standard deviation."""
+        return math.sqrt(self.variance())
+
+    def to_dict(self):
+        """Returns the state as a dictionary of plain values."""
+        return {'count': self.count,
+            'mean': self.mean,
+            'm2': self._m2,
+            'min': self.min,
+            'max': self.max}
+
+    @classmethod
+    def from_dict(cls, state):
+        """Returns a RunningStats with a state that was returned by
+        to_dict.
+
+        """
+        result = cls()
+        result.count = state['count']
+        result.mean = state['mean']
+        result._m2 = state['m2']
+        result.min = state['min']
+        result.max = state['max']
+        return result
+
+
+class QuantileSketch(object):
+    """A mergeable sketch of the distribution of the values that have been
+    added (see above).
+
+    """
+
+    def __init__(self, k=DEFAULT_K, seed=None):
+        """The k is the capacity of the largest level; larger values are
+        more accurate and use more memory. The seed makes the compactions
+        repeatable.
+
+        """
+        if (MIN_LEVEL_CAPACITY > k):
+            raise StatsError("The k must be at least %d." % MIN_LEVEL_CAPACITY)
+        self.k = k
+        self.count = 0
+        self._levels = [[]]
+        self._random = random.Random(seed)
+
+    def __len__(self):
+        """Returns the number of items that are kept."""
+        return sum(len(level) for level in self._levels)
+
+    def add(self, value):
+        """Adds a single value."""
+        self._levels[0].append(value)
+        self.count += 1
+        if (len(self._levels[0]) >= self._capacity(0)):
+            self._compress()
+
+    def merge(self, other):
+        """Adds the values of another QuantileSketch."""
+        while (len(self._levels) < len(other._levels)):
+            self._levels.append([])
+        for h, level in enumerate(other._levels):
+            self._levels[h].extend(level)
+        self.count += other.count
+        self._compress()
+
+    def quantile(self, q):
+        """Returns the approximate value at the given quantile (0.0 to 1.0)
+        or None if no values have been added.
+
+        """
+        return self.quantiles([q])[0]
+
+    def quantiles(self, qs):
+        """Returns a list of the approximate values at each of the given
+        quantiles.
+
+        """
+        for q in qs:
+            if ((0.0 > q) or (1.0 < q)):
+                raise StatsError("Invalid quantile: %r" % q)
+
+        items = []
+        for h, level in enumerate(self._levels):
+            weight = (1 << h)
+            items.extend((value, weight) for value in level)
+        if (not items):
+            return [None for q in qs]
+        items.sort()
+        total = sum(weight for _, weight in items)
+
+        result = []
+        for q in qs:
+            target = (q * total)
+            cumulative = 0
+            value = items[-1][0]
+            for item, weight in items:
+                cumulative += weight
+                if (cumulative >= target):
+                    value = item
+                    break
+            result.append(value)
+        return result
+
+    def to_dict(self):
+        """Returns the state as a dictionary of plain values."""
+        return {'k': self.k,
+            'count': self.count,
+            'levels': [list(level) for level in self._levels]}
+
+    @classmethod
+    def from_dict(cls, state, seed=None):
+        """Returns a QuantileSketch with a state that was returned by
+        to_dict.
+
+        """
+        result = cls(state['k'], seed)
+        result.count = state['count']
+        result._levels = [list(level) for level in state['levels']]
+        if (not result._levels):
+            result._levels = [[]]
+        return result
+
+    def _capacity(self, h):
+        """Returns the number of items that level h can hold."""
+        depth = (len(self._levels) - h - 1)
+        return max(MIN_LEVEL_CAPACITY,
+            int(math.ceil(self.k * (LEVEL_RATIO ** depth))))
+
+    def _compress(self):
+        """Compacts every level that has reached its capacity."""
+        h = 0
+        while (h < len(self._levels)):
+            if (len(self._levels[h]) >= self._capacity(h)):
+                if ((h + 1) == len(self._levels)):
+                    self._levels.append([])
+                level = sorted(self._levels[h])
+                # An odd item stays behind so that the total weight is kept.
+                kept = []
+                if (len(level) % 2):
+                    kept.append(level.pop(self._random.randint(0, 1) *
+                        (len(level) - 1)))
+                offset = self._random.randint(0, 1)
+                self._levels[h + 1].extend(level[offset::2])
+                self._levels[h] = kept
+            h += 1
+
+
+class Series(object):
+    """The RunningStats and QuantileSketch of one result."""
+
+    def __init__(self, k=DEFAULT_K):
+        self.stats = RunningStats()
+        self.sketch = QuantileSketch(k)
+
+    def add(self, value):
+        """Adds a single value."""
+        self.stats.add(value)
+        self.sketch.add(value)
+
+    def merge(self, other):
+        """Adds the values of another Series."""
+        self.stats.merge(other.stats)
+        self.sketch.merge(other.sketch)
+
+    def summary(self, quantiles=DEFAULT_QUANTILES):
+        """Returns a dictionary with the 'COUNT', 'MEAN', 'VARIANCE', 'MIN',
+        'MAX', and 'QUANTILES' (which maps each quantile to its value).
+
+        """
+        return {'COUNT': self.stats.count,
+            'MEAN': self.stats.mean,
+            'VARIANCE': self.stats.variance(),
+            'MIN': self.stats.min,
+            'MAX': self.stats.max,
+            'QUANTILES': dict(zip(quantiles,
+                self.sketch.quantiles(quantiles)))}
+
+    def to_dict(self):
+        """Returns the state as a dictionary of plain values."""
+        return {'stats': self.stats.to_dict(), 'sketch': self.sketch.to_dict()}
+
+    @classmethod
+    def from_dict(cls, state):
+        """Returns a Series with a state that was returned by to_dict."""
+        result = cls()
+        result.stats = RunningStats.from_dict(state['stats'])
+        result.sketch = QuantileSketch.from_dict(state['sketch'])
+        return result
+
+
+# Results are grouped by the same keys that logreader uses in its index.
+params_key = reprfile.params_key
+
+
+def _numbers(value):
+    """Returns the finite numbers in a result value, which is either a single
+    value or a list of array items.
+
+    """
+    if (not isinstance(value, (list, tuple))):
+        value = [value]
+    result = []
+    for v in value:
+        if (isinstance(v, bool)):
+            v = int(v)
+        elif (not isinstance(v, (int, long, float))):
+            continue
+        if (isinstance(v, float) and (math.isnan(v) or math.isinf(v))):
+            continue
+        result.append(v)
+    return result
+
+
+class Aggregator(object):
+    """Keeps a Series for every result of every distinct INIT_PARAMS along
+    with the number of runs and errors.
+
+    """
+
+    def __init__(self,
+                    k=DEFAULT_K,
+                    snapshot_path=None,
+                    snapshot_interval_s=DEFAULT_SNAPSHOT_INTERVAL_S,
+                    group_func=None):
+        """The k is passed to each QuantileSketch. If a snapshot_path is
+        given then the state is written to it every snapshot_interval_s
+        seconds while results are added. The group_func, if given, receives
+        the INIT_PARAMS of each run and returns the init params that it's
+        grouped by (e.g. without a param that only counts repetitions).
+
+        """
+        self.k = k
+        self.snapshotPath = snapshot_path
+        self.snapshotInterval = snapshot_interval_s
+
+        self._groupFunc = group_func
+
+        # Maps params_key(init_params) to a dictionary with the
+        # 'INIT_PARAMS', the number of 'RUNS' and 'ERRORS', and a dictionary
+        # that maps each result's index to its Series.
+        self._groups = {}
+        self._lastSnapshot = time.time()
+
+    def __len__(self):
+        """Returns the number of distinct INIT_PARAMS."""
+        return len(self._groups)
+
+    def add(self, result_dict):
+        """Adds the results of a run. Runs with ERROR set are only counted."""
+        init_params = result_dict.get('INIT_PARAMS')
+        if (self._groupFunc is not None):
+            init_params = self._groupFunc(init_params)
+        group = self._group(init_params)
+        group['RUNS'] += 1
+        if (result_dict.get('ERROR')):
+            group['ERRORS'] += 1
+        else:
+            for i, (_, value) in enumerate(result_dict.get('RESULT') or []):
+                numbers = _numbers(value)
+                if (not numbers):
+                    continue
+                series = group['RESULTS'].get(i)
+                if (series is None):
+                    series = Series(self.k)
+                    group['RESULTS'][i] = series
+                for v in numbers:
+                    series.add(v)
+
+        if ((self.snapshotPath is not None) and
+                ((time.time() - self._lastSnapshot) >= self.snapshotInterval)):
+            self.snapshot()
+
+    def merge(self, other):
+        """Adds the state of another Aggregator."""
+        for other_group in other._groups.values():
+            group = self._group(other_group['INIT_PARAMS'])
+            group['RUNS'] += other_group['RUNS']
+            group['ERRORS'] += other_group['ERRORS']
+            for i, other_series in other_group['RESULTS'].items():
+                series = group['RESULTS'].get(i)
+                if (series is None):
+                    series = Series(self.k)
+                    group['RESULTS'][i] = series
+                series.merge(other_series)
+
+    def summary(self, quantiles=DEFAULT_QUANTILES):
+        """Returns a list with a dictionary for every distinct INIT_PARAMS,
+        in the order of their keys, with the 'INIT_PARAMS', the number of
+        'RUNS' and 'ERRORS', and the 'RESULTS', which maps each result's index
+        to the dictionary that is described by Series.summary.
+
+        """
+        result = []
+        for key in sorted(self._groups.keys()):
+            group = self._groups[key]
+            result.append({'INIT_PARAMS': group['INIT_PARAMS'],
+                'RUNS': group['RUNS'],
+                'ERRORS': group['ERRORS'],
+                'RESULTS': dict((i, series.summary(quantiles))
+                    for i, series in group['RESULTS'].items())})
+        return result
+
+    def to_dict(self):
+        """Returns the state as a dictionary of plain values."""
+        return {'k': self.k,
+            'groups': [{'init_params': group['INIT_PARAMS'],
+                    'runs': group['RUNS'],
+                    'errors': group['ERRORS'],
+                    'results': dict((i, series.to_dict())
+                        for i, series in group['RESULTS'].items())}
+                for group in self._groups.values()]}
+
+    @classmethod
+    def from_dict(cls, state, **kwargs):
+        """Returns an Aggregator with a state that was returned by to_dict.
+        The kwargs are passed to the constructor.
+
+        """
+        kwargs.setdefault('k', state['k'])
+        result = cls(**kwargs)
+        for group_state in state['groups']:
+            group = result._group(group_state['init_params'])
+            group['RUNS'] = group_state['runs']
+            group['ERRORS'] = group_state['errors']
+            for i, series_state in group_state['results'].items():
+                group['RESULTS'][i] = Series.from_dict(series_state)
+        return result
+
+    def snapshot(self, path=None):
+        """Replaces the file at path (or the snapshotPath) with the current
+        state.
+
+        """
+        if (path is None):
+            path = self.snapshotPath
+        if (path is None):
+            raise StatsError("No snapshot path was given.")
+        tmp_path = (path + '.tmp')
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(repr(self.to_dict()) + '\n')
+            os.rename(tmp_path, path)
+        except (IOError, OSError) as err:
+            raise StatsError("Could not write snapshot: %s" % err.strerror)
+        self._lastSnapshot = time.time()
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """Returns an Aggregator with the state of a snapshot file. The
+        kwargs are passed to the constructor, e.g. to keep writing snapshots
+        to the same path.
+
+        """
+        try:
+            with open(path, 'rb') as f:
+                state = reprfile.literal_eval(f.read())
+        except IOError as err:
+            raise StatsError("Could not read snapshot: %s" % err.strerror)
+        except (SyntaxError, ValueError):
+            raise StatsError("Malformed snapshot: %s" % path)
+        try:
+            return cls.from_dict(state, **kwargs)
+        except (KeyError, TypeError, ValueError):
+            raise StatsError("Malformed snapshot: %s" % path)
+
+    def _group(self, init_params):
+        """Returns the group of the given init params, creating it first if
+        it's new.
+
+        """
+        key = params_key(init_params)
+        group = self._groups.get(key)
+        if (group is None):
+            group = {'INIT_PARAMS': init_params,
+                'RUNS': 0,
+                'ERRORS': 0,
+                'RESULTS': {}}
+            self._groups[key] = group
+        return group
@@ -0,0 +1,170 @@
+"""Resolves the format string IDs that are sent in LYS_OP_LOG_FMT messages.
+
+The firmware's LYS_LOG_FMT macro places each format string in a '.lys_fmt'
+section that is linked at address zero but never downloaded to the device. A
+string's ID is its offset within that section so the table can be rebuilt from
+the ELF file that was produced by the build. The arguments are sent as 32-bit
+words and are interpreted according to the printf conversion that consumes
+them: d and i are signed, u, x, X, o, and c are unsigned, and e, f, and g
+reinterpret the word as a float. The s conversion is not supported because
+pointers can not be resolved on the PC.
+
+"""
+import re
+import struct
+
+
+DEFAULT_SECTION = '.lys_fmt'
+
+# Matches a single printf conversion specification.
+_CONVERSION = re.compile(
+    r'%(?P<flags>[-+ #0]*)(?P<width>\*|\d+)?(?:\.(?P<prec>\*|\d+))?'
+    r'(?:hh|h|ll|l|j|z|t|L)?(?P<conv>[diouxXcfFeEgGsp%])')
+
+
+class StringTableError(Exception):
+    """Subclass for reporting errors."""
+    pass
+
+
+class StringTable(object):
+    """Maps format string IDs to printf-style format strings."""
+
+    def __init__(self, strings=None):
+        """The strings should be a dictionary of IDs and format strings."""
+        if (strings is None):
+            strings = {}
+        self.strings = strings
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __contains__(self, fmt_id):
+        return (fmt_id in self.strings)
+
+    def __getitem__(self, fmt_id):
+        return self.strings[fmt_id]
+
+    @classmethod
+    def from_elf(cls, path, section=DEFAULT_SECTION):
+        """Reads the format strings from the given section of an ELF file."""
+        try:
+            with open(path, 'rb') as f:
+                elf = f.read()
+        except IOError as err:
+            raise StringTableError("Could not open ELF file: %s" %
+                err.strerror)
+
+        addr, data = _elf_section(elf, section)
+
+        strings = {}
+        start = 0
+        while (start < len(data)):
+            end = data.find('\0', start)
+            if (end < 0):
+                end = len(data)
+            if (end > start):
+                strings[addr + start] = data[start:end]
+            start = (end + 1)
+        return cls(strings)
+
+    def format(self, fmt_id, args):
+        """Returns the text that the firmware would have printed. Unknown IDs
+        and malformed strings do not raise errors because losing a log line
+        is better than losing the rest of the session.
+
+        """
+        if (not fmt_id in self.strings):
+            return ('<unknown format 0x%04X> %r' % (fmt_id, tuple(args)))
+        try:
+            return _printf(self.strings[fmt_id], args)
+        except (IndexError, ValueError, TypeError, OverflowError):
+            return ('<bad format 0x%04X> %s %r' %
+                (fmt_id, self.strings[fmt_id], tuple(args)))
+
+
+def _printf(fmt, args):
+    """Applies a C format string to a sequence of 32-bit words."""
+    args = list(args)
+    result = []
+    pos = 0
+    for m in _CONVERSION.finditer(fmt):
+        result.append(fmt[pos:m.start()])
+        pos = m.end()
+
+        conv = m.group('conv')
+        if ('%' == conv):
+            result.append('%')
+            continue
+
+        width = m.group('width') or ''
+        if ('*' == width):
+            width = str(_signed(args.pop(0)))
+        prec = m.group('prec')
+        if ('*' == prec):
+            prec = str(_signed(args.pop(0)))
+        spec = ('%' + m.group('flags') + width)
+        if (prec is not None):
+            spec += ('.' + prec)
+
+        value = args.pop(0)
+        if (conv in 'di'):
+            result.append((spec + 'd') % _signed(value))
+        elif ('u' == conv):
+            result.append((spec + 'd') % value)
+        elif (conv in 'oxXc'):
+            result.append((spec + conv) % value)
+        elif (conv in 'fFeEgG'):
+            value = struct.unpack('<f', struct.pack('<I', value))[0]
+            result.append((spec + conv) % value)
+        elif ('p' == conv):
+            result.append('0x%08X' % value)
+        else:
+            result.append('<%%%s 0x%08X>' % (conv, value))
+    result.append(fmt[pos:])
+    return ''.join(result)
+
+
+def _signed(value):
+    """Converts an unsigned 32-bit value to a signed one."""
+    if (value & 0x80000000):
+        return (value - 0x100000000)
+    return value
+
+
+def _elf_section(elf, name):
+    """Returns the (address, data) of the named section in the ELF file."""
+    if (elf[:4] != '\x7fELF'):
+        raise StringTableError("Not an ELF file.")
+
+    ei_class = ord(elf[4])
+    ei_data = ord(elf[5])
+    endian = {1: '<', 2: '>'}.get(ei_data)
+    if (endian is None):
+        raise StringTableError("Unknown ELF byte order: %d" % ei_data)
+
+    if (1 == ei_class):
+        shoff = struct.unpack_from(endian + 'I', elf, 0x20)[0]
+        shentsize, shnum, shstrndx = struct.unpack_from(endian + 'HHH',
+            elf, 0x2E)
+        sh_fmt = (endian + 'IIIIII')
+    elif (2 == ei_class):
+        shoff = struct.unpack_from(endian + 'Q', elf, 0x28)[0]
+        shentsize, shnum, shstrndx = struct.unpack_from(endian + 'HHH',
+            elf, 0x3A)
+        sh_fmt = (endian + 'IIQQQQ')
+    else:
+        raise StringTableError("Unknown ELF class: %d" % ei_class)
+
+    headers = []
+    for i in range(0, shnum):
+        sh_name, sh_type, sh_flags, sh_addr, sh_offset, sh_size = \
+            struct.unpack_from(sh_fmt, elf, shoff + (i * shentsize))
+        headers.append((sh_name, sh_addr, sh_offset, sh_size))
+
+    names_offset = headers[shstrndx][2]
+    for sh_name, sh_addr, sh_offset, sh_size in headers:
+        start = (names_offset + sh_name)
+        if (elf[start:elf.find('\0', start)] == name):
+            return (sh_addr, elf[sh_offset:sh_offset + sh_size])
+    raise StringTableError("ELF file does not contain a %s section." % name)
@@ -0,0 +1,290 @@
+"""Runs experiments over spaces of init params while running as few of them
+on hardware as possible. Each space describes the values of one init param:
+
+    spaces = [sweep.Range('UINT32', 10, 1000, 10),
+        sweep.Choice('UINT8', [1, 2, 4])]
+
+A point is one init params list that takes a value from every space, e.g.
+[('UINT32', 10), ('UINT8', 1)]. A Sweep passes points to a run function that
+returns the dictionary that is described by LCLI.run (see lcli_runner) and
+remembers every trial so that a point is never run twice. The strategies are:
+
+    grid - every point in order; a prune function can skip the rest of the
+        innermost space (e.g. once a threshold is crossed) and a stop
+        function can end the sweep
+    random - a number of distinct points chosen at random
+    bisect - the first value of a Range for which a predicate is True,
+        assuming that the predicate is monotonic over the range
+
+A run that returns ERROR (or raises an exception) is retried up to the given
+number of retries per point, as long as the sweep's total retry budget lasts.
+If a checkpoint.Journal is given then every point's outcome is appended to
+it and a sweep that is started again with the same journal skips the points
+that already completed, so a long sweep can be resumed after a failure. If a
+stats.Aggregator is given then the final result of every point that is run
+is added to it.
+
+"""
+import random as _random
+
+import lcli
+import checkpoint
+
+
+class SweepError(Exception):
+    """Subclass for reporting errors."""
+    pass
+
+
+class Range(object):
+    """The values start, start + step, ... that are less than stop."""
+
+    def __init__(self, param_type, start, stop, step=1):
+        if (0 >= step):
+            raise SweepError("The step must be positive.")
+        self.paramType = param_type
+        self.start = start
+        self.stop = stop
+        self.step = step
+
+    def __len__(self):
+        return max(0, ((self.stop - self.start + self.step - 1) // self.step))
+
+    def __getitem__(self, i):
+        if ((i < 0) or (i >= len(self))):
+            raise IndexError(i)
+        return (self.start + (i * self.step))
+
+    def __iter__(self):
+        for i in range(0, len(self)):
+            yield self[i]
+
+
+class Choice(object):
+    """An explicit list of values."""
+
+    def __init__(self, param_type, values):
+        if (not values):
+            raise SweepError("A Choice needs at least one value.")
+        self.paramType = param_type
+        self.values = list(values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        return self.values[i]
+
+    def __iter__(self):
+        return iter(self.values)
+
+
+def lcli_runner(sn, **kwargs):
+    """Returns a run function that runs each point with a new LCLI object and
+    the given serial number. The kwargs are passed to LCLI.run.
+
+    """
+    def run(init_params):
+        return lcli.LCLI().run(sn,
+            lcli.LCLI.parse_condensed_params(init_params),
+            **kwargs)
+    return run
+
+
+def result_value(result_dict, index=0):
+    """Returns the value of the result at the given index or None if the run
+    failed or didn't return that many results.
+
+    """
+    if (result_dict.get('ERROR') or (not result_dict.get('RESULT'))):
+        return None
+    results = result_dict['RESULT']
+    if (index >= len(results)):
+        return None
+    return results[index][1]
+
+
+class Sweep(object):
+    """Runs points from a list of spaces with a run function. The trials
+    list holds an (init_params, result_dict) tuple for every point that was
+    actually run, in order, and the retryBudget is the number of retries that
+    are left.
+
+    """
+
+    def __init__(self,
+                    spaces,
+                    run_func,
+                    journal=None,
+                    retries=0,
+                    retry_budget=None,
+                    aggregator=None):
+        """The journal is an optional checkpoint.Journal. Each point is
+        attempted up to (1 + retries) times while the retry_budget (which is
+        unlimited by default) lasts. The aggregator is an optional
+        stats.Aggregator; points that are skipped because the journal has
+        them are not added to it again.
+
+        """
+        if (not spaces):
+            raise SweepError("At least one space is required.")
+        self.spaces = list(spaces)
+        self.trials = []
+        self.retryBudget = retry_budget
+
+        self._runFunc = run_func
+        self._journal = journal
+        self._retries = retries
+        self._aggregator = aggregator
+        self._results = {}
+        self._failed = []
+
+    def __len__(self):
+        """Returns the number of points in the full grid."""
+        n = 1
+        for space in self.spaces:
+            n *= len(space)
+        return n
+
+    def point(self, index):
+        """Returns the point at the given index of the full grid. The last
+        space changes fastest.
+
+        """
+        values = []
+        for space in reversed(self.spaces):
+            index, i = divmod(index, len(space))
+            values.append((space.paramType, space[i]))
+        values.reverse()
+        return values
+
+    def run(self, init_params):
+        """Returns the result of a point, running it if it hasn't been run
+        before.
+
+        """
+        key = repr(init_params)
+        if (key in self._results):
+            return self._results[key]
+        if ((self._journal is not None) and
+                self._journal.is_done(init_params)):
+            self._results[key] = self._journal.result(init_params)
+            return self._results[key]
+
+        attempts = 0
+        while (True):
+            attempts += 1
+            result_dict = self._attempt(init_params)
+            self.trials.append((init_params, result_dict))
+            if (not result_dict.get('ERROR')):
+                status = checkpoint.STATUS_DONE
+                break
+            if ((attempts > self._retries) or (0 == self.retryBudget)):
+                status = checkpoint.STATUS_FAILED
+                self._failed.append(init_params)
+                break
+            if (self.retryBudget is not None):
+                self.retryBudget -= 1
+
+        if (self._journal is not None):
+            self._journal.append(init_params, status, result_dict, attempts)
+        if (self._aggregator is not None):
+            self._aggregator.add(result_dict)
+        self._results[key] = result_dict
+        return result_dict
+
+    def failed(self):
+        """Returns the points whose retries ran out during this sweep."""
+        return list(self._failed)
+
+    def _attempt(self, init_params):
+        """Runs a point once. Exceptions are turned into an ERROR result so
+        that they can be retried and journaled like any other failure.
+
+        """
+        try:
+            return self._runFunc(list(init_params))
+        except Exception as err:
+            return {'INIT_PARAMS': init_params,
+                'LOG': [],
+                'RESULT': None,
+                'ERROR': True,
+                'EXCEPTION': ('%s: %s' % (type(err).__name__, err))}
+
+    def grid(self, prune_func=None, stop_func=None):
+        """Runs every point of the grid. After each run,
+        prune_func(init_params, result_dict) can return True to skip the
+        remaining values of the last space and stop_func(init_params,
+        result_dict) can return True to end the sweep. Returns a list of
+        (init_params, result_dict) tuples for the points that were visited.
+
+        """
+        visited = []
+        inner = len(self.spaces[-1])
+        index = 0
+        total = len(self)
+        while (index < total):
+            init_params = self.point(index)
+            result_dict = self.run(init_params)
+            visited.append((init_params, result_dict))
+            if (stop_func and stop_func(init_params, result_dict)):
+                break
+            if (prune_func and prune_func(init_params, result_dict)):
+                # Jump to the first value of the last space.
+                index = (((index // inner) + 1) * inner)
+            else:
+                index += 1
+        return visited
+
+    def random(self, count, seed=None, stop_func=None):
+        """Runs up to count distinct points that are chosen at random. The
+        stop_func is the same as for grid. Returns a list of (init_params,
+        result_dict) tuples.
+
+        """
+        rng = _random.Random(seed)
+        count = min(count, len(self))
+        visited = []
+        for index in rng.sample(xrange(len(self)), count):
+            init_params = self.point(index)
+            result_dict = self.run(init_params)
+            visited.append((init_params, result_dict))
+            if (stop_func and stop_func(init_params, result_dict)):
+                break
+        return visited
+
+    def bisect(self, predicate, space_index=0, fixed=None):
+        """Finds the first value of the Range (or Choice) at space_index for
+        which predicate(result_dict) is True. The predicate must be False for
+        every value before that one and True for every value after it. The
+        other spaces take the values in the fixed dictionary, which is keyed
+        by space index and defaults to each space's first value. Returns the
+        value or None if the predicate is never True; only about log2(n)
+        points are run.
+
+        """
+        if (fixed is None):
+            fixed = {}
+        space = self.spaces[space_index]
+
+        def test(i):
+            init_params = []
+            for j in range(0, len(self.spaces)):
+                if (j == space_index):
+                    value = space[i]
+                else:
+                    value = fixed.get(j, self.spaces[j][0])
+                init_params.append((self.spaces[j].paramType, value))
+            return predicate(self.run(init_params))
+
+        lo = 0
+        hi = len(space)
+        while (lo < hi):
+            mid = ((lo + hi) // 2)
+            if (test(mid)):
+                hi = mid
+            else:
+                lo = (mid + 1)
+        if (lo == len(space)):
+            return None
+        return space[lo]
@@ -0,0 +1,206 @@
+"""Collects LYS_OP_TELEMETRY batches into preallocated NumPy ring buffers. A
+TelemetryStream object is passed to Lys (or LCLI.run) as the telemetry_cb and
+keeps the most recent samples of each param type along with the sequence
+number and timestamp of every batch. Batches can also be consumed as they
+arrive by iterating over the stream from another thread.
+
+NumPy is only required by this module.
+
+"""
+import threading
+import Queue
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import lys
+
+
+DEFAULT_CAPACITY = (1 << 20)
+
+DTYPES = {
+    'LYS_PARAM_TYPE_UINT32': '<u4',
+    'LYS_PARAM_TYPE_INT32': '<i4',
+    'LYS_PARAM_TYPE_UINT8': 'u1',
+    'LYS_PARAM_TYPE_INT8': 'i1',
+    'LYS_PARAM_TYPE_BOOL': '?',
+    'LYS_PARAM_TYPE_UINT16': '<u2',
+    'LYS_PARAM_TYPE_INT16': '<i2',
+    'LYS_PARAM_TYPE_UINT64': '<u8',
+    'LYS_PARAM_TYPE_INT64': '<i8',
+    'LYS_PARAM_TYPE_FLOAT32': '<f4'
+    }
+
+# Describes one batch; INDEX is the total number of samples of the same
+# param type that had been received before it.
+BATCH_DTYPE = [('seq', '<u2'), ('timestamp', '<u4'), ('index', '<u8'),
+    ('count', '<u2')]
+
+SEQ_MODULUS = (1 << 16)
+
+
+class TelemetryError(Exception):
+    """Subclass for reporting errors."""
+    pass
+
+
+class RingBuffer(object):
+    """A fixed-size, preallocated buffer that keeps the most recent items."""
+
+    def __init__(self, capacity, dtype):
+        """Allocates space for capacity items of the given dtype."""
+        if (numpy is None):
+            raise TelemetryError("NumPy is required for telemetry buffers.")
+        self.capacity = capacity
+        self.total = 0
+        self._data = numpy.empty(capacity, dtype=dtype)
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def extend(self, values):
+        """Appends a sequence of items, overwriting the oldest ones."""
+        values = numpy.asarray(values, dtype=self._data.dtype)
+        n = len(values)
+        if (n >= self.capacity):
+            self._data[:] = values[n - self.capacity:]
+            self.total += n
+            # Rotate so that the oldest item is at the start of the ring.
+            self._data = numpy.roll(self._data, (self.total % self.capacity))
+            return
+
+        start = (self.total % self.capacity)
+        end = (start + n)
+        if (end <= self.capacity):
+            self._data[start:end] = values
+        else:
+            split = (self.capacity - start)
+            self._data[start:] = values[:split]
+            self._data[:end - self.capacity] = values[split:]
+        self.total += n
+
+    def since(self, index):
+        """Returns a copy of the items whose index is at least the given one.
+        Items that have already been overwritten are omitted.
+
+        """
+        first = max(index, self.total - self.capacity, 0)
+        n = (self.total - first)
+        if (0 >= n):
+            return self._data[:0].copy()
+        start = (first % self.capacity)
+        end = (start + n)
+        if (end <= self.capacity):
+            return self._data[start:end].copy()
+        return numpy.concatenate((self._data[start:],
+            self._data[:end - self.capacity]))
+
+    def values(self):
+        """Returns a copy of the buffered items from oldest to newest."""
+        return self.since(0)
+
+
+class TelemetryStream(object):
+    """Receives telemetry from Lys. Every param type gets its own ring of
+    samples and a ring of batch descriptions.
+
+    """
+
+    POLL_INTERVAL_S = 0.1
+
+    def __init__(self,
+                    capacity=DEFAULT_CAPACITY,
+                    batch_capacity=None,
+                    queue_size=0):
+        """The capacity is the number of samples kept for each param type and
+        the batch_capacity is the number of batch descriptions (it defaults to
+        the capacity). If queue_size is non-zero then up to that many batches
+        are also queued for iteration; further batches are only buffered.
+
+        """
+        if (numpy is None):
+            raise TelemetryError("NumPy is required for telemetry buffers.")
+        if (batch_capacity is None):
+            batch_capacity = capacity
+
+        self.samples = {}
+        self.batches = {}
+        self.dropped = 0
+
+        self._capacity = capacity
+        self._batchCapacity = batch_capacity
+        self._lastSeq = None
+        self._lock = threading.Lock()
+        self._queue = None
+        self._closed = threading.Event()
+        if (queue_size):
+            self._queue = Queue.Queue(queue_size)
+
+    def __call__(self, param_type, seq, timestamp, values):
+        """Adds a batch. Matches the telemetry_cb signature used by Lys."""
+        param_type = lys.LysData.find_param_type_str(param_type)
+        if (not DTYPES.has_key(param_type)):
+            raise TelemetryError("Unsupported telemetry type: %s" % param_type)
+
+        with self._lock:
+            if (self._lastSeq is not None):
+                self.dropped += ((seq - self._lastSeq - 1) % SEQ_MODULUS)
+            self._lastSeq = seq
+
+            if (not self.samples.has_key(param_type)):
+                self.samples[param_type] = RingBuffer(self._capacity,
+                    DTYPES[param_type])
+                self.batches[param_type] = RingBuffer(self._batchCapacity,
+                    BATCH_DTYPE)
+
+            samples = self.samples[param_type]
+            self.batches[param_type].extend([(seq,
+                timestamp,
+                samples.total,
+                len(values))])
+            samples.extend(values)
+
+        if (self._queue is not None):
+            try:
+                self._queue.put_nowait((param_type, seq, timestamp, values))
+            except Queue.Full:
+                pass
+
+    def __iter__(self):
+        """Yields (param_type, seq, timestamp, values) tuples until close is
+        called. Requires a non-zero queue_size.
+
+        """
+        if (self._queue is None):
+            raise TelemetryError("Iteration requires a queue_size.")
+        while (True):
+            try:
+                yield self._queue.get(True, self.POLL_INTERVAL_S)
+            except Queue.Empty:
+                if (self._closed.is_set()):
+                    return
+
+    def close(self):
+        """Ends any iteration once the queued batches have been consumed."""
+        self._closed.set()
+
+    def values(self, param_type):
+        """Returns the buffered samples of the given type as an array."""
+        param_type = lys.LysData.find_param_type_str(param_type)
+        with self._lock:
+            if (not self.samples.has_key(param_type)):
+                return numpy.empty(0, dtype=DTYPES[param_type])
+            return self.samples[param_type].values()
+
+    def batch_info(self, param_type):
+        """Returns the buffered batch descriptions of the given type as a
+        structured array with 'seq', 'timestamp', 'index', and 'count' fields.
+
+        """
+        param_type = lys.LysData.find_param_type_str(param_type)
+        with self._lock:
+            if (not self.batches.has_key(param_type)):
+                return numpy.empty(0, dtype=BATCH_DTYPE)
+            return self.batches[param_type].values()
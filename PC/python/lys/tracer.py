@@ -0,0 +1,129 @@
+"""An opt-in event recorder for Lys sessions. Timestamped spans and instant
+events are collected from the RTT thread, the Lys state machine, and LCLI and
+then exported in the Chrome trace format so that they can be inspected with
+chrome://tracing or https://ui.perfetto.dev.
+
+Tracing is disabled by default. Objects that can be traced accept an optional
+Tracer and skip all tracing work when it is None, so the cost of the disabled
+case is a single attribute check.
+
+"""
+import os
+import time
+import json
+import threading
+
+
+class TracerError(Exception):
+    """Subclass for reporting errors."""
+    pass
+
+
+class _Span(object):
+    """A context manager that records a complete ('X') event on exit."""
+
+    __slots__ = ('_tracer', '_name', '_cat', '_args', '_start')
+
+    def __init__(self, tracer, name, cat, args):
+        """Creates a new object but does not start the span."""
+        self._tracer = tracer
+        self._name = name
+        self._cat = cat
+        self._args = args
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        end = time.time()
+        self._tracer._add({'name': self._name,
+            'cat': self._cat,
+            'ph': 'X',
+            'ts': self._tracer._us(self._start),
+            'dur': (end - self._start) * 1e6,
+            'args': self._args})
+        return False
+
+
+class Tracer(object):
+    """Collects trace events from any thread. Events are stored as
+    dictionaries that already use the Chrome trace event field names.
+
+    """
+
+    def __init__(self, process_name='lys'):
+        """Creates a new, empty trace."""
+        self.events = []
+        self._pid = os.getpid()
+        self._t0 = time.time()
+        self._lock = threading.Lock()
+        self._threadNames = {}
+        self._add({'name': 'process_name',
+            'ph': 'M',
+            'args': {'name': process_name}})
+
+    def instant(self, name, cat, args=None):
+        """Records an event with no duration."""
+        self._add({'name': name,
+            'cat': cat,
+            'ph': 'i',
+            's': 't',
+            'ts': self._us(time.time()),
+            'args': args})
+
+    def span(self, name, cat, args=None):
+        """Returns a context manager that records the time spent inside of it.
+
+        """
+        return _Span(self, name, cat, args)
+
+    def counter(self, name, values):
+        """Records a counter sample. The values should be a dictionary of
+        series names and numbers.
+
+        """
+        self._add({'name': name,
+            'ph': 'C',
+            'ts': self._us(time.time()),
+            'args': values})
+
+    def name_thread(self, name):
+        """Assigns a readable name to the calling thread."""
+        tid = threading.current_thread().ident
+        with self._lock:
+            if (self._threadNames.get(tid) == name):
+                return
+            self._threadNames[tid] = name
+        self._add({'name': 'thread_name',
+            'ph': 'M',
+            'args': {'name': name}})
+
+    def dumps(self):
+        """Returns the trace as a Chrome trace format JSON str."""
+        with self._lock:
+            events = list(self.events)
+        return json.dumps({'traceEvents': events,
+            'displayTimeUnit': 'ms'})
+
+    def save(self, path):
+        """Writes the trace to the given path."""
+        try:
+            with open(path, 'wb') as f:
+                f.write(self.dumps())
+        except IOError as err:
+            raise TracerError("Could not write trace file: %s" % err.strerror)
+
+    def _us(self, t):
+        """Converts a time.time() value to microseconds since creation."""
+        return (t - self._t0) * 1e6
+
+    def _add(self, event):
+        """Adds the pid/tid fields and stores the event."""
+        event['pid'] = self._pid
+        event['tid'] = threading.current_thread().ident
+        if (event.get('args') is None):
+            del event['args']
+        with self._lock:
+            self.events.append(event)
@@ -0,0 +1,207 @@
+"""Checks the parts of the codec that have to agree with the firmware byte for
+byte: the param cache's hash and patches, LYS_OP_CACHE and LYS_OP_PARAMS
+messages, and delta arrays. Run from the PC/python directory with:
+
+    python -m unittest discover tests
+
+"""
+import os
+import sys
+import unittest
+
+
+# The directory that holds the lys package.
+PACKAGE_PARENT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_PARENT)
+
+from lys import lys
+
+
+UINT8 = 'LYS_PARAM_TYPE_UINT8'
+UINT32 = 'LYS_PARAM_TYPE_UINT32'
+UINT64 = 'LYS_PARAM_TYPE_UINT64'
+INT8 = 'LYS_PARAM_TYPE_INT8'
+INT64 = 'LYS_PARAM_TYPE_INT64'
+BOOL = 'LYS_PARAM_TYPE_BOOL'
+STRING = 'LYS_PARAM_TYPE_STRING'
+
+
+def _records(params):
+    """Returns the [PLEN][PARAM_TYPE][DATA] records of a list of params."""
+    return [lys.LysOp.param_record(param_type, value)
+        for param_type, value in params]
+
+
+class ParamHashTest(unittest.TestCase):
+
+    def test_fnv1a_vectors(self):
+        self.assertEqual(lys.param_hash([]), 0x811C9DC5)
+        self.assertEqual(lys.param_hash(['a']), 0xE40C292C)
+        self.assertEqual(lys.param_hash(['foo', 'bar']), 0xBF9CF968)
+
+    def test_matches_firmware(self):
+        # hash_calc in lys.c returns 0xEF2BC015 for these bytes.
+        records = _records([(UINT32, 10), (STRING, 'abc')])
+        self.assertEqual(''.join(records),
+            '\x06\x00\x0a\x00\x00\x00\x05\x05abc')
+        self.assertEqual(lys.param_hash(records), 0xEF2BC015)
+
+
+class ParamRecordsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cached = _records([(UINT32, 10), (UINT8, 7), (STRING, 'ab')])
+        self.cacheHash = lys.param_hash(self.cached)
+        self.paramRecords = lys.ParamRecords()
+        self.paramRecords.add(self.cached)
+
+    def test_unchanged(self):
+        self.assertEqual(self.paramRecords.patches(self.cacheHash,
+            self.cached), [])
+
+    def test_changed_params(self):
+        records = _records([(UINT32, 11), (UINT8, 7), (STRING, 'cd')])
+        self.assertEqual(self.paramRecords.patches(self.cacheHash, records),
+            [0, 2])
+
+    def test_unknown_hash(self):
+        records = _records([(UINT32, 11), (UINT8, 7), (STRING, 'ab')])
+        self.assertIsNone(self.paramRecords.patches(0x12345678, records))
+
+    def test_different_count(self):
+        records = _records([(UINT32, 11), (UINT8, 7)])
+        self.assertIsNone(self.paramRecords.patches(self.cacheHash, records))
+
+    def test_different_length(self):
+        records = _records([(UINT32, 10), (UINT8, 7), (STRING, 'abc')])
+        self.assertIsNone(self.paramRecords.patches(self.cacheHash, records))
+
+    def test_patches_longer_than_params(self):
+        cached = _records([(UINT32, 10)])
+        self.paramRecords.add(cached)
+        self.assertIsNone(self.paramRecords.patches(lys.param_hash(cached),
+            _records([(UINT32, 11)])))
+
+    def test_oldest_set_is_forgotten(self):
+        param_records = lys.ParamRecords(max_len=2)
+        sets = [_records([(UINT32, i), (UINT8, 7)]) for i in range(0, 3)]
+        for records in sets:
+            param_records.add(records)
+        self.assertEqual(len(param_records), 2)
+        self.assertIsNone(param_records.patches(lys.param_hash(sets[0]),
+            sets[2]))
+        self.assertEqual(param_records.patches(lys.param_hash(sets[1]),
+            sets[2]), [0])
+
+
+class CacheMessageTest(unittest.TestCase):
+
+    def test_encoding(self):
+        self.assertEqual(lys.LysOp.encode_cache([(3, UINT8, 7)]),
+            '\x06\x0b\x04\x03\x02\x07')
+
+    def test_round_trip(self):
+        patches = [(0, lys.LYS_PARAM_TYPE_UINT32, 0xDEADBEEF),
+            (200, lys.LYS_PARAM_TYPE_STRING, 'xy'),
+            (255, lys.LYS_PARAM_TYPE_INT8, -1)]
+        self.assertEqual(lys.LysOp.decode_cache(
+            lys.LysOp.encode_cache(patches)), patches)
+
+    def test_invalid_index(self):
+        self.assertRaises(lys.LysError, lys.LysOp.encode_cache,
+            [(256, UINT8, 7)])
+
+    def test_init_hash(self):
+        op, cache_hash, flags, _ = lys.LysOp.decode(lys.LysOp.encode(
+            'LYS_OP_INIT',
+            0xDEADBEEF,
+            (lys.LYS_INIT_FLAG_PARAMS | lys.LYS_INIT_FLAG_CACHE)))
+        self.assertEqual((op, cache_hash, flags), (lys.LYS_OP_INIT,
+            0xDEADBEEF,
+            (lys.LYS_INIT_FLAG_PARAMS | lys.LYS_INIT_FLAG_CACHE)))
+
+
+class ParamsMessageTest(unittest.TestCase):
+
+    def test_encoding(self):
+        self.assertEqual(lys.LysOp.encode_params([(UINT32, 10),
+                (STRING, 'abc')]),
+            '\x0d\x0a\x06\x00\x0a\x00\x00\x00\x05\x05abc')
+
+    def test_round_trip(self):
+        params = [(lys.LYS_PARAM_TYPE_UINT32, 10),
+            (lys.LYS_PARAM_TYPE_BOOL, True),
+            (lys.LYS_PARAM_TYPE_STRING, 'abc'),
+            (lys.LYS_PARAM_TYPE_INT64, -(1 << 63))]
+        self.assertEqual(lys.LysOp.decode_params(
+            lys.LysOp.encode_params(params)), params)
+
+    def test_too_long(self):
+        self.assertRaises(lys.LysError, lys.LysOp.encode_params,
+            [(UINT64, i) for i in range(0, 7)])
+
+    def test_lys_packs_params(self):
+        params = [(UINT32, i) for i in range(0, 20)]
+        out = []
+        session = lys.Lys(out.append, lambda op, data: None, params,
+            param_records=None)
+        session.parse(lys.LysOp.encode('LYS_OP_INIT',
+            None,
+            lys.LYS_INIT_FLAG_PARAMS))
+        # The INIT is ACKed before the params are sent.
+        self.assertEqual(out.pop(0), '\x02' + chr(lys.LYS_OP_ACK))
+        # Each message holds as many params as fit and the START follows
+        # the last one.
+        received = []
+        while (out != ['\x02' + chr(lys.LYS_OP_START)]):
+            self.assertEqual(len(out), 1)
+            op, _, data, _ = lys.LysOp.decode(out.pop())
+            self.assertEqual(op, lys.LYS_OP_PARAMS)
+            self.assertEqual(len(data), 10)
+            received.extend(data)
+            session.parse('\x02' + chr(lys.LYS_OP_ACK))
+        self.assertEqual(received,
+            [(lys.LYS_PARAM_TYPE_UINT32, i) for i in range(0, 20)])
+
+
+class DeltaArrayTest(unittest.TestCase):
+
+    def _round_trip(self, param_type, values):
+        _, decoded, _ = lys.LysData.decode(lys.LysData.encode(param_type,
+            lys.DeltaArray(values)))
+        return decoded
+
+    def test_encoding(self):
+        # The deltas 1, 1, 1, and -2 as zigzag varints.
+        self.assertEqual(lys.LysData.encode(UINT32,
+                lys.DeltaArray([1, 2, 3, 1])),
+            '\x08\x05\x0d\x00\x02\x02\x02\x03')
+
+    def test_int64_extremes(self):
+        values = [(1 << 63) - 1, -(1 << 63), 0, -(1 << 63), (1 << 63) - 1]
+        self.assertEqual(self._round_trip(INT64, values), values)
+
+    def test_uint64_extremes(self):
+        values = [(1 << 64) - 1, 0, (1 << 64) - 1, 1 << 63]
+        self.assertEqual(self._round_trip(UINT64, values), values)
+
+    def test_small_types(self):
+        self.assertEqual(self._round_trip(INT8, [-128, 127, 0, -1]),
+            [-128, 127, 0, -1])
+        self.assertEqual(self._round_trip(BOOL, [True, False, True]),
+            [True, False, True])
+
+    def test_invalid_arrays(self):
+        self.assertRaises(lys.LysError, lys.LysData.encode, UINT32,
+            lys.DeltaArray([]))
+        self.assertRaises(lys.LysError, lys.LysData.encode, STRING,
+            lys.DeltaArray(['a']))
+        self.assertRaises(lys.LysError, lys.LysData.encode, UINT8,
+            lys.DeltaArray([256]))
+        # The last varint is cut short.
+        self.assertRaises(lys.LysError, lys.LysData.decode,
+            '\x05\x05\x0d\x00\x80')
+
+
+if __name__ == '__main__':
+    unittest.main()
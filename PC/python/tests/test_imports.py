@@ -0,0 +1,62 @@
+"""Checks that the package stays cheap to import for users of the codec alone.
+Run from the PC/python directory with:
+
+    python -m unittest discover tests
+
+"""
+import os
+import sys
+import json
+import unittest
+import subprocess
+
+
+# The directory that holds the lys package.
+PACKAGE_PARENT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Importing the package and using the codec must take less than this (the
+# codec alone takes a few tens of milliseconds).
+IMPORT_BUDGET_S = 0.5
+
+# Modules that must not be loaded until a debugger or NumPy is used.
+HEAVY_MODULES = ('pynrfjprog', 'numpy', 'lys.dbg')
+
+_CHILD = """
+import sys
+import json
+import time
+start = time.time()
+import lys
+lys.lys.LysData
+elapsed = (time.time() - start)
+json.dump({'elapsed': elapsed,
+    'modules': [name for name, module in sys.modules.items()
+        if (module is not None)]}, sys.stdout)
+"""
+
+
+class ImportTest(unittest.TestCase):
+
+    def _import_codec(self):
+        """Imports the codec in a new interpreter and returns its import time
+        and the names of the modules that it loaded.
+
+        """
+        out = subprocess.check_output([sys.executable, '-c', _CHILD],
+            cwd=PACKAGE_PARENT)
+        result = json.loads(out)
+        return (result['elapsed'], set(result['modules']))
+
+    def test_codec_does_not_load_heavy_modules(self):
+        _, modules = self._import_codec()
+        for name in HEAVY_MODULES:
+            self.assertNotIn(name, modules)
+
+    def test_codec_import_budget(self):
+        # The fastest of a few runs so that a busy machine doesn't fail it.
+        elapsed = min(self._import_codec()[0] for _ in range(0, 3))
+        self.assertLess(elapsed, IMPORT_BUDGET_S)
+
+
+if __name__ == '__main__':
+    unittest.main()
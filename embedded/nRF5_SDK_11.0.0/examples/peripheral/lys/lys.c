@@ -7,6 +7,11 @@
 
 
 #define LYS_RTT_CHANNEL            (0UL)
+#ifdef LYS_BULK_RTT_CHANNEL
+    #define LYS_LOG_RTT_CHANNEL    LYS_BULK_RTT_CHANNEL
+#else
+    #define LYS_LOG_RTT_CHANNEL    LYS_RTT_CHANNEL
+#endif
 
 #define LYS_LEN_INDEX              (0UL)
 #define LYS_OP_INDEX               (1UL)
@@ -14,15 +19,55 @@
 #define LYS_DATA_INDEX             (3UL)
 #define LYS_ARRAY_PARAM_TYPE_INDEX (3UL)
 #define LYS_ARRAY_DATA_INDEX       (4UL)
+#define LYS_FMT_ID_INDEX           (2UL)
+#define LYS_FMT_ARGS_INDEX         (4UL)
+#define LYS_TELEMETRY_SEQ_INDEX    (3UL)
+#define LYS_TELEMETRY_TS_INDEX     (5UL)
+#define LYS_TELEMETRY_DATA_INDEX   (9UL)
+#define LYS_INIT_FLAGS_INDEX       (2UL)
+#define LYS_PARAMS_INDEX           (2UL)
+#define LYS_CACHE_INDEX            (2UL)
 
 #define LYS_MSG_NO_PARAM_LEN       (2UL)
+#define LYS_MAX_VARINT_LEN         (10UL)
+#define LYS_HASH_LEN               (4UL)
+
+// The 32-bit FNV-1a parameters.
+#define LYS_HASH_OFFSET_BASIS      (0x811C9DC5UL)
+#define LYS_HASH_PRIME             (0x01000193UL)
+
+#define LYS_CACHE_MAGIC            (0x4C595343UL)
+
+
+typedef enum
+{
+    CACHE_MODE_NONE = 0, // No params have been received yet.
+    CACHE_MODE_FULL,     // Received params are replacing the cached ones.
+    CACHE_MODE_PATCH,    // LYS_OP_CACHE messages are updating the cached params.
+    CACHE_MODE_REPLAY    // The cached params are being passed on after START.
+} cache_mode_t;
+
+
+// The last accepted init params as [PLEN][lys_param_type_t][data] records.
+// The magic is only set while the hash matches the records.
+typedef struct
+{
+    uint32_t magic;
+    uint32_t hash;
+    uint32_t len;
+    uint8_t  data[LYS_PARAM_CACHE_SIZE];
+} lys_cache_t;
 
 
 static uint8_t       m_buf[LYS_MAX_MSG_LEN];
 static const uint8_t m_ack_buf[LYS_MSG_NO_PARAM_LEN] = {LYS_MSG_NO_PARAM_LEN,
                                                            LYS_OP_ACK};
+static const uint8_t m_result_buf[LYS_MSG_NO_PARAM_LEN] = {LYS_MSG_NO_PARAM_LEN,
+                                                              LYS_OP_RESULT};
 
 static uint8_t       m_buf_index = 0;
+static uint16_t      m_telemetry_seq = 0;
+static uint8_t       m_params_index  = 0;
 static lys_state_t   m_state     = LYS_STATE_UNKNOWN;
 static bool          m_error     = false;
 
@@ -30,6 +75,32 @@ static lys_str_t     m_str;
 static lys_array_t   m_array;
 static lys_param_t   m_param;
 
+// Received delta arrays are decoded into this buffer.
+static uint64_t      m_delta_buf[LYS_MAX_ARRAY_LEN / sizeof(uint64_t)];
+
+// The param cache isn't initialized so that it survives a reset.
+static lys_cache_t   m_cache __attribute__((section(".lys_retained")));
+static cache_mode_t  m_cache_mode     = CACHE_MODE_NONE;
+static uint32_t      m_cache_offset   = 0;
+static bool          m_cache_overflow = false;
+
+// The ring buffer of queued messages. The indexes run freely and are masked
+// when the buffer is accessed. Only lys_process (or a blocking function that
+// has taken over the channel) sends from it.
+static uint8_t           m_tx_queue[LYS_TX_QUEUE_SIZE];
+static uint8_t           m_tx_msg[LYS_MAX_MSG_LEN];
+static uint8_t           m_rx_ack[LYS_MSG_NO_PARAM_LEN];
+static uint32_t          m_rx_ack_len     = 0;
+static uint32_t          m_tx_dropped     = 0;
+static volatile uint32_t m_tx_head        = 0;
+static volatile uint32_t m_tx_tail        = 0;
+static volatile bool     m_tx_ack_pending = false;
+static volatile bool     m_channel_owned  = false;
+
+#ifdef LYS_BULK_RTT_CHANNEL
+static uint8_t       m_bulk_rtt_buf[LYS_BULK_RTT_BUF_SIZE];
+#endif
+
 
 static lys_error_t verify_array_len(lys_array_t *p_array, uint32_t *p_data_len)
 {
@@ -89,6 +160,205 @@ static lys_error_t verify_str_len(lys_str_t *p_str, uint32_t *p_data_len)
 }
 
 
+// Returns the item at index i as an int64_t.
+static int64_t array_item_get(const lys_array_t *p_array, uint32_t i)
+{
+    switch (p_array->param_type)
+    {
+    case LYS_PARAM_TYPE_UINT32:
+        return p_array->data.p_uint32[i];
+    case LYS_PARAM_TYPE_INT32:
+        return p_array->data.p_int32[i];
+    case LYS_PARAM_TYPE_UINT16:
+        return p_array->data.p_uint16[i];
+    case LYS_PARAM_TYPE_INT16:
+        return p_array->data.p_int16[i];
+    case LYS_PARAM_TYPE_UINT8:
+        return p_array->data.p_uint8[i];
+    case LYS_PARAM_TYPE_INT8:
+        return p_array->data.p_int8[i];
+    case LYS_PARAM_TYPE_UINT64:
+        return (int64_t)p_array->data.p_uint64[i];
+    case LYS_PARAM_TYPE_INT64:
+        return p_array->data.p_int64[i];
+    case LYS_PARAM_TYPE_BOOL:
+        return p_array->data.p_bool[i];
+    default:
+        return 0;
+    }
+}
+
+
+static bool delta_type_valid(lys_param_type_t param_type)
+{
+    uint32_t param_len;
+
+    if ((LYS_PARAM_TYPE_FLOAT32 == param_type) ||
+        (LYS_ERROR_SUCCESS != lys_param_len_lookup(param_type, &param_len)))
+    {
+        return false;
+    }
+    return (LYS_PARAM_VARIABLE_SIZE != param_len);
+}
+
+
+// Writes the varints of a delta array to p_data, which has room for max_len
+// bytes. If p_data is NULL then the length is found without writing anything.
+static lys_error_t delta_encode(const lys_array_t *p_array,
+    uint8_t *p_data,
+    uint32_t max_len,
+    uint32_t *p_len)
+{
+    int64_t prev = 0;
+
+    if ((NULL == p_array) ||
+        (0 == p_array->item_count) ||
+        !delta_type_valid(p_array->param_type))
+    {
+        return LYS_ERROR_INVALID_PARAM;
+    }
+
+    *p_len = 0;
+    for (uint32_t i=0; i < p_array->item_count; i++)
+    {
+        int64_t  value = array_item_get(p_array, i);
+        int64_t  delta = (int64_t)((uint64_t)value - (uint64_t)prev);
+        uint64_t zigzag;
+
+        prev = value;
+        if (0 > delta)
+        {
+            zigzag = ~((uint64_t)delta << 1);
+        }
+        else
+        {
+            zigzag = ((uint64_t)delta << 1);
+        }
+
+        do
+        {
+            if (*p_len >= max_len)
+            {
+                // The array is too long.
+                return LYS_ERROR_INVALID_PARAM;
+            }
+            if (NULL != p_data)
+            {
+                p_data[*p_len] = (zigzag & 0x7F);
+                if (0x7F < zigzag)
+                {
+                    p_data[*p_len] |= 0x80;
+                }
+            }
+            (*p_len)++;
+            zigzag >>= 7;
+        } while (0 != zigzag);
+    }
+    return LYS_ERROR_SUCCESS;
+}
+
+
+// Decodes len bytes of varints into m_delta_buf and points m_array at them.
+static lys_error_t delta_decode(lys_param_type_t param_type,
+    const uint8_t *p_data,
+    uint32_t len)
+{
+    uint8_t  *p_buf = (uint8_t*)m_delta_buf;
+    uint32_t  param_len;
+    uint32_t  count = 0;
+    uint64_t  zigzag = 0;
+    uint32_t  shift = 0;
+    int64_t   prev = 0;
+
+    if ((0 == len) || !delta_type_valid(param_type))
+    {
+        return LYS_ERROR_INVALID_PARAM;
+    }
+    (void)lys_param_len_lookup(param_type, &param_len);
+
+    for (uint32_t i=0; i < len; i++)
+    {
+        zigzag |= ((uint64_t)(p_data[i] & 0x7F) << shift);
+        if (p_data[i] & 0x80)
+        {
+            shift += 7;
+            if ((7 * LYS_MAX_VARINT_LEN) <= shift)
+            {
+                return LYS_ERROR_INVALID_PARAM;
+            }
+            continue;
+        }
+
+        if (sizeof(m_delta_buf) < ((count + 1) * param_len))
+        {
+            // The array is too long.
+            return LYS_ERROR_INVALID_PARAM;
+        }
+
+        prev = (int64_t)((uint64_t)prev + ((zigzag >> 1) ^ (0 - (zigzag & 1))));
+        // Items are little-endian so the low bytes are the truncated item.
+        memcpy(&p_buf[count * param_len], &prev, param_len);
+        count++;
+        zigzag = 0;
+        shift  = 0;
+    }
+
+    if (0 != shift)
+    {
+        // The last varint was cut short.
+        return LYS_ERROR_INVALID_PARAM;
+    }
+
+    m_array.param_type   = param_type;
+    m_array.item_count   = count;
+    m_array.data.p_uint8 = p_buf;
+    return LYS_ERROR_SUCCESS;
+}
+
+
+// Returns the number of bytes that param_add will add for the param.
+static lys_error_t param_len_get(const lys_param_t *p_param, uint32_t *p_len)
+{
+    lys_error_t err;
+
+    if (NULL == p_param)
+    {
+        return LYS_ERROR_INVALID_PARAM;
+    }
+
+    err = lys_param_len_lookup(p_param->param_type, p_len);
+    if (LYS_ERROR_SUCCESS != err)
+    {
+        return err;
+    }
+
+    if (LYS_PARAM_TYPE_ARRAY == p_param->param_type)
+    {
+        err = verify_array_len(p_param->data.p_array, p_len);
+        *p_len += (LYS_ARRAY_DATA_INDEX - LYS_PARAM_TYPE_INDEX);
+    }
+    else if (LYS_PARAM_TYPE_DELTA_ARRAY == p_param->param_type)
+    {
+        err = delta_encode(p_param->data.p_array,
+            NULL,
+            (LYS_MAX_MSG_LEN - LYS_ARRAY_DATA_INDEX),
+            p_len);
+        *p_len += (LYS_ARRAY_DATA_INDEX - LYS_PARAM_TYPE_INDEX);
+    }
+    else if ((LYS_PARAM_TYPE_STRING == p_param->param_type) ||
+        (LYS_PARAM_TYPE_BYTES == p_param->param_type))
+    {
+        err = verify_str_len(p_param->data.p_str, p_len);
+        *p_len += (LYS_DATA_INDEX - LYS_PARAM_TYPE_INDEX);
+    }
+    else
+    {
+        *p_len += (LYS_DATA_INDEX - LYS_PARAM_TYPE_INDEX);
+    }
+    return err;
+}
+
+
 static lys_error_t param_add(const lys_param_t *p_param)
 {
     lys_error_t       err;
@@ -124,7 +394,26 @@ static lys_error_t param_add(const lys_param_t *p_param)
             param_type           = p_array->param_type;
             p_param_data         = p_array->data.p_uint8;
         }
-        else if (LYS_PARAM_TYPE_STRING == param_type)
+        else if (LYS_PARAM_TYPE_DELTA_ARRAY == param_type)
+        {
+            lys_array_t *p_array = p_param->data.p_array;
+
+            // The varints are written in place so there's nothing to copy.
+            err = delta_encode(p_array,
+                &m_buf[m_buf_index + 2],
+                (LYS_MAX_MSG_LEN - (m_buf_index + 2)),
+                &param_len);
+            if (LYS_ERROR_SUCCESS != err)
+            {
+                return err;
+            }
+            m_buf[m_buf_index++] = LYS_PARAM_TYPE_DELTA_ARRAY;
+            m_buf[m_buf_index++] = p_array->param_type;
+            m_buf_index         += param_len;
+            return LYS_ERROR_SUCCESS;
+        }
+        else if ((LYS_PARAM_TYPE_STRING == param_type) ||
+            (LYS_PARAM_TYPE_BYTES == param_type))
         {
             lys_str_t *p_str = p_param->data.p_str;
             err = verify_str_len(p_str, &param_len);
@@ -157,6 +446,25 @@ static lys_error_t param_add(const lys_param_t *p_param)
 }
 
 
+static lys_error_t fmt_msg_create(uint16_t fmt_id,
+    const uint32_t *p_args,
+    uint32_t arg_count)
+{
+    if ((LYS_MAX_FMT_ARGS < arg_count) || ((NULL == p_args) && (0 != arg_count)))
+    {
+        return LYS_ERROR_INVALID_PARAM;
+    }
+
+    m_buf[LYS_OP_INDEX] = LYS_OP_LOG_FMT;
+    memcpy(&m_buf[LYS_FMT_ID_INDEX], &fmt_id, sizeof(fmt_id));
+    memcpy(&m_buf[LYS_FMT_ARGS_INDEX], p_args, (arg_count * sizeof(uint32_t)));
+
+    m_buf_index          = (LYS_FMT_ARGS_INDEX + (arg_count * sizeof(uint32_t)));
+    m_buf[LYS_LEN_INDEX] = m_buf_index;
+    return LYS_ERROR_SUCCESS;
+}
+
+
 static lys_error_t msg_create(lys_op_t op, const lys_param_t *p_param)
 {
     lys_error_t err;
@@ -166,8 +474,16 @@ static lys_error_t msg_create(lys_op_t op, const lys_param_t *p_param)
 
     switch (op)
     {
-    case LYS_OP_UNKNOWN:
     case LYS_OP_INIT:
+        m_buf[m_buf_index++] = LYS_INIT_FLAG_PARAMS;
+        if (LYS_CACHE_MAGIC == m_cache.magic)
+        {
+            m_buf[LYS_INIT_FLAGS_INDEX] |= LYS_INIT_FLAG_CACHE;
+            memcpy(&m_buf[m_buf_index], &m_cache.hash, LYS_HASH_LEN);
+            m_buf_index += LYS_HASH_LEN;
+        }
+        break;
+    case LYS_OP_UNKNOWN:
     case LYS_OP_START:
     case LYS_OP_RESULT:
     case LYS_OP_FINISHED:
@@ -188,16 +504,180 @@ static lys_error_t msg_create(lys_op_t op, const lys_param_t *p_param)
 }
 
 
-static void msg_send(void)
+// Creates a LYS_OP_PARAMS message. The params must have been checked with
+// param_len_get to make sure that they fit.
+static lys_error_t params_msg_create(const lys_param_t *p_params,
+    uint32_t param_count)
 {
-    uint32_t bytes_written = 0;
+    lys_error_t err;
+    uint8_t     plen_index;
+
+    m_buf_index          = LYS_OP_INDEX;
+    m_buf[m_buf_index++] = LYS_OP_PARAMS;
+
+    for (uint32_t i=0; i < param_count; i++)
+    {
+        plen_index = m_buf_index++;
+        if (LYS_ERROR_SUCCESS != (err=param_add(&p_params[i])))
+        {
+            return err;
+        }
+        m_buf[plen_index] = (m_buf_index - plen_index);
+    }
+    m_buf[LYS_LEN_INDEX] = m_buf_index;
+    return LYS_ERROR_SUCCESS;
+}
+
+
+static void error(void)
+{
+    m_error          = true;
+    m_state          = LYS_STATE_UNKNOWN;
+    m_params_index   = 0;
+    m_tx_tail        = m_tx_head;
+    m_tx_ack_pending = false;
+    m_rx_ack_len     = 0;
+    m_cache_mode     = CACHE_MODE_NONE;
+}
+
+
+static uint32_t queue_free(void)
+{
+    return (LYS_TX_QUEUE_SIZE - (m_tx_head - m_tx_tail));
+}
+
+
+// Copies a message into the queue, which must have room for it.
+static void queue_push(const uint8_t *p_msg)
+{
+    uint32_t head = m_tx_head;
+    uint32_t len  = p_msg[LYS_LEN_INDEX];
+
+    for (uint32_t i=0; i < len; i++)
+    {
+        m_tx_queue[(head + i) & (LYS_TX_QUEUE_SIZE - 1)] = p_msg[i];
+    }
+    // The message has to be complete before lys_process can see it.
+    __sync_synchronize();
+    m_tx_head = (head + len);
+}
+
+
+// Queues the message in m_buf or drops it if there isn't room.
+static lys_error_t msg_queue(void)
+{
+    if (queue_free() < m_buf_index)
+    {
+        m_tx_dropped++;
+        return LYS_ERROR_BUSY;
+    }
+    queue_push(m_buf);
+    return LYS_ERROR_SUCCESS;
+}
+
+
+// Checks for the ACK of the last queued message and then sends the next one
+// without blocking. Returns LYS_ERROR_BUSY if it has to wait for the ACK or
+// for room in the RTT buffer.
+static lys_error_t tx_step(void)
+{
+    uint32_t channel = LYS_RTT_CHANNEL;
+    uint32_t tail;
+    uint32_t len;
+
+    if (m_tx_ack_pending)
+    {
+        m_rx_ack_len += SEGGER_RTT_Read(LYS_RTT_CHANNEL,
+            &m_rx_ack[m_rx_ack_len],
+            (LYS_MSG_NO_PARAM_LEN - m_rx_ack_len));
+        if (LYS_MSG_NO_PARAM_LEN > m_rx_ack_len)
+        {
+            return LYS_ERROR_BUSY;
+        }
+
+        m_rx_ack_len = 0;
+        if (0 != memcmp(m_rx_ack, m_ack_buf, LYS_MSG_NO_PARAM_LEN))
+        {
+            error();
+            return LYS_ERROR_INVALID_STATE;
+        }
+        m_tx_ack_pending = false;
+    }
+
+    tail = m_tx_tail;
+    if (tail == m_tx_head)
+    {
+        return LYS_ERROR_SUCCESS;
+    }
+    __sync_synchronize();
+
+    len = m_tx_queue[tail & (LYS_TX_QUEUE_SIZE - 1)];
+    for (uint32_t i=0; i < len; i++)
+    {
+        m_tx_msg[i] = m_tx_queue[(tail + i) & (LYS_TX_QUEUE_SIZE - 1)];
+    }
+
+#ifdef LYS_BULK_RTT_CHANNEL
+    if ((LYS_OP_LOG == m_tx_msg[LYS_OP_INDEX]) ||
+        (LYS_OP_LOG_FMT == m_tx_msg[LYS_OP_INDEX]))
+    {
+        channel = LYS_BULK_RTT_CHANNEL;
+    }
+#endif
+
+    // The message is written whole or not at all (the RTT buffers use
+    // SEGGER_RTT_MODE_NO_BLOCK_SKIP) so it can't be split by telemetry.
+    if (0 == SEGGER_RTT_Write(channel, m_tx_msg, len))
+    {
+        return LYS_ERROR_BUSY;
+    }
+    m_tx_tail        = (tail + len);
+    m_tx_ack_pending = (LYS_RTT_CHANNEL == channel);
+    return LYS_ERROR_SUCCESS;
+}
+
+
+// Sends everything in the queue, blocking until it has all been ACK'd.
+static lys_error_t tx_flush(void)
+{
+    lys_error_t err;
+
+    while ((m_tx_tail != m_tx_head) || m_tx_ack_pending)
+    {
+        err = tx_step();
+        if ((LYS_ERROR_SUCCESS != err) && (LYS_ERROR_BUSY != err))
+        {
+            return err;
+        }
+    }
+    return LYS_ERROR_SUCCESS;
+}
+
+
+// Blocking messages take the channel over from lys_process (until their ACK
+// has been received) and are sent after everything that was queued. Nothing
+// is sent if a queued message wasn't ACK'd.
+static lys_error_t msg_send(uint32_t channel)
+{
+    uint32_t    bytes_written = 0;
+    lys_error_t err;
+
+    m_channel_owned = true;
+    err = tx_flush();
+    if (LYS_ERROR_SUCCESS != err)
+    {
+        // tx_step has already called error().
+        m_channel_owned = false;
+        return err;
+    }
 
     while (bytes_written < m_buf_index)
     {
-        bytes_written += SEGGER_RTT_Write(LYS_RTT_CHANNEL,
+        bytes_written += SEGGER_RTT_Write(channel,
             &m_buf[bytes_written],
             (m_buf_index - bytes_written));
     }
+    return LYS_ERROR_SUCCESS;
 }
 
 
@@ -214,19 +694,31 @@ static void ack_msg_send(void)
 }
 
 
-static lys_error_t param_parse(void)
+// Parses the [lys_param_type_t][data] that starts at p_data and is len bytes
+// long into m_param.
+static lys_error_t param_parse(uint8_t *p_data, uint32_t len)
 {
     lys_error_t err;
     uint32_t    param_len;
     uint32_t    data_len;
 
-    if (LYS_PARAM_TYPE_ARRAY == m_buf[LYS_PARAM_TYPE_INDEX])
+    if (0 == len)
+    {
+        return LYS_ERROR_INVALID_PARAM;
+    }
+
+    if (LYS_PARAM_TYPE_ARRAY == p_data[0])
     {
+        if (2 > len)
+        {
+            return LYS_ERROR_INVALID_PARAM;
+        }
+
         m_param.param_type   = LYS_PARAM_TYPE_ARRAY;
         m_param.data.p_array = &m_array;
-        m_array.param_type   = m_buf[LYS_ARRAY_PARAM_TYPE_INDEX];
+        m_array.param_type   = p_data[1];
 
-        data_len = (m_buf[LYS_LEN_INDEX] - LYS_ARRAY_DATA_INDEX);
+        data_len = (len - 2);
 
         err = lys_param_len_lookup(m_array.param_type, &param_len);
         if (LYS_ERROR_SUCCESS != err)
@@ -234,30 +726,49 @@ static lys_error_t param_parse(void)
             return err;
         }
 
-        if (0 != (data_len % param_len))
+        if ((LYS_PARAM_VARIABLE_SIZE == param_len) ||
+            (0 != (data_len % param_len)))
         {
             return LYS_ERROR_INVALID_PARAM;
         }
 
         m_array.item_count   = (data_len / param_len);
-        m_array.data.p_uint8 = &m_buf[LYS_ARRAY_DATA_INDEX];
+        m_array.data.p_uint8 = &p_data[2];
+    }
+    else if (LYS_PARAM_TYPE_DELTA_ARRAY == p_data[0])
+    {
+        if (2 > len)
+        {
+            return LYS_ERROR_INVALID_PARAM;
+        }
+
+        // Delta arrays are decoded so they look like any other array.
+        m_param.param_type   = LYS_PARAM_TYPE_ARRAY;
+        m_param.data.p_array = &m_array;
+
+        err = delta_decode(p_data[1], &p_data[2], (len - 2));
+        if (LYS_ERROR_SUCCESS != err)
+        {
+            return err;
+        }
     }
     else
     {
-        data_len = (m_buf[LYS_LEN_INDEX] - LYS_DATA_INDEX);
+        data_len = (len - 1);
 
-        if (LYS_PARAM_TYPE_STRING == m_buf[LYS_PARAM_TYPE_INDEX])
+        if ((LYS_PARAM_TYPE_STRING == p_data[0]) ||
+            (LYS_PARAM_TYPE_BYTES == p_data[0]))
         {
-            m_param.param_type = LYS_PARAM_TYPE_STRING;
+            m_param.param_type = p_data[0];
             m_param.data.p_str = &m_str;
 
             m_str.len    = data_len;
-            m_str.p_data = &m_buf[LYS_DATA_INDEX];
+            m_str.p_data = &p_data[1];
         }
         else
         {
-            m_param.param_type   = m_buf[LYS_PARAM_TYPE_INDEX];
-            m_param.data.p_uint8 = &m_buf[LYS_DATA_INDEX];
+            m_param.param_type   = p_data[0];
+            m_param.data.p_uint8 = &p_data[1];
 
             err = lys_param_len_lookup(m_param.param_type, &param_len);
             if (LYS_ERROR_SUCCESS != err)
@@ -275,6 +786,172 @@ static lys_error_t param_parse(void)
 }
 
 
+// Returns the 32-bit FNV-1a hash of len bytes.
+static uint32_t hash_calc(const uint8_t *p_data, uint32_t len)
+{
+    uint32_t hash = LYS_HASH_OFFSET_BASIS;
+
+    for (uint32_t i=0; i < len; i++)
+    {
+        hash ^= p_data[i];
+        hash *= LYS_HASH_PRIME;
+    }
+    return hash;
+}
+
+
+// Invalidates the cache unless its records match its hash. The contents of
+// retained RAM are unknown after a power cycle.
+static void cache_check(void)
+{
+    if ((LYS_CACHE_MAGIC != m_cache.magic)                      ||
+        (sizeof(m_cache.data) < m_cache.len)                    ||
+        (hash_calc(m_cache.data, m_cache.len) != m_cache.hash))
+    {
+        m_cache.magic = 0;
+    }
+}
+
+
+// Stores the hash of the cached records so that cache_check accepts them.
+static void cache_seal(void)
+{
+    m_cache.hash  = hash_calc(m_cache.data, m_cache.len);
+    m_cache.magic = LYS_CACHE_MAGIC;
+}
+
+
+// Adds the [lys_param_type_t][data] of a received param to the cache. The
+// first param of a session replaces the cached ones.
+static void cache_append(const uint8_t *p_data, uint32_t len)
+{
+    if (CACHE_MODE_FULL != m_cache_mode)
+    {
+        m_cache_mode     = CACHE_MODE_FULL;
+        m_cache_overflow = false;
+        m_cache.magic    = 0;
+        m_cache.len      = 0;
+    }
+
+    if (m_cache_overflow || (sizeof(m_cache.data) < (m_cache.len + 1 + len)))
+    {
+        m_cache_overflow = true;
+        return;
+    }
+    m_cache.data[m_cache.len++] = (len + 1);
+    memcpy(&m_cache.data[m_cache.len], p_data, len);
+    m_cache.len += len;
+}
+
+
+// Applies the [PLEN][INDEX][lys_param_type_t][data] records of the
+// LYS_OP_CACHE message in m_buf.
+static lys_error_t cache_patch(void)
+{
+    uint32_t index = LYS_CACHE_INDEX;
+    uint32_t offset;
+    uint8_t  plen;
+
+    if ((CACHE_MODE_FULL == m_cache_mode) ||
+        ((CACHE_MODE_NONE == m_cache_mode) && (LYS_CACHE_MAGIC != m_cache.magic)))
+    {
+        // There are no cached params to patch.
+        return LYS_ERROR_INVALID_STATE;
+    }
+    m_cache_mode  = CACHE_MODE_PATCH;
+    m_cache.magic = 0;
+
+    while (index < m_buf[LYS_LEN_INDEX])
+    {
+        plen = m_buf[index];
+        if ((3 > plen) || (m_buf[LYS_LEN_INDEX] < (index + plen)))
+        {
+            return LYS_ERROR_INVALID_PARAM;
+        }
+
+        offset = 0;
+        for (uint32_t i=0; i < m_buf[index + 1]; i++)
+        {
+            if (m_cache.len <= offset)
+            {
+                return LYS_ERROR_INVALID_PARAM;
+            }
+            offset += m_cache.data[offset];
+        }
+        if ((m_cache.len <= offset) || ((plen - 1) != m_cache.data[offset]))
+        {
+            // Patched params have to keep their length.
+            return LYS_ERROR_INVALID_PARAM;
+        }
+        memcpy(&m_cache.data[offset + 1], &m_buf[index + 2], (plen - 2));
+        index += plen;
+    }
+    return LYS_ERROR_SUCCESS;
+}
+
+
+// Parses the next cached param into m_param. Leaves the replay and enters
+// LYS_STATE_RUNNING when there are none left.
+static lys_error_t cache_param_next(lys_param_t **p_param, bool *p_param_set)
+{
+    lys_error_t err;
+    uint8_t     plen;
+
+    *p_param_set = false;
+    if (m_cache.len <= m_cache_offset)
+    {
+        m_cache_mode = CACHE_MODE_NONE;
+        m_state      = LYS_STATE_RUNNING;
+        return LYS_ERROR_SUCCESS;
+    }
+
+    plen = m_cache.data[m_cache_offset];
+    if ((2 > plen) || (m_cache.len < (m_cache_offset + plen)))
+    {
+        return LYS_ERROR_INVALID_PARAM;
+    }
+
+    err = param_parse(&m_cache.data[m_cache_offset + 1], (plen - 1));
+    if (LYS_ERROR_SUCCESS != err)
+    {
+        return err;
+    }
+    m_cache_offset += plen;
+    *p_param       = &m_param;
+    *p_param_set   = true;
+    return LYS_ERROR_SUCCESS;
+}
+
+
+// Parses the next param of the LYS_OP_PARAMS message in m_buf.
+static lys_error_t packed_param_next(lys_param_t **p_param)
+{
+    lys_error_t err;
+    uint8_t     plen  = m_buf[m_params_index];
+    uint8_t     index = m_params_index;
+
+    m_params_index = 0;
+    if ((2 > plen) || (m_buf[LYS_LEN_INDEX] < (index + plen)))
+    {
+        return LYS_ERROR_INVALID_PARAM;
+    }
+
+    err = param_parse(&m_buf[index + 1], (plen - 1));
+    if (LYS_ERROR_SUCCESS != err)
+    {
+        return err;
+    }
+    cache_append(&m_buf[index + 1], (plen - 1));
+
+    if (m_buf[LYS_LEN_INDEX] > (index + plen))
+    {
+        m_params_index = (index + plen);
+    }
+    *p_param = &m_param;
+    return LYS_ERROR_SUCCESS;
+}
+
+
 static lys_error_t msg_parse(lys_op_t *p_op, lys_param_t **p_param)
 {
     lys_error_t err;
@@ -290,10 +967,14 @@ static lys_error_t msg_parse(lys_op_t *p_op, lys_param_t **p_param)
     case LYS_OP_RESULT:
     case LYS_OP_FINISHED:
     case LYS_OP_ACK:
+    case LYS_OP_PARAMS:
+    case LYS_OP_CACHE:
         break;
     case LYS_OP_PARAM:
     case LYS_OP_LOG:
-        if (LYS_ERROR_SUCCESS != (err=param_parse()))
+        err = param_parse(&m_buf[LYS_PARAM_TYPE_INDEX],
+            (m_buf[LYS_LEN_INDEX] - LYS_PARAM_TYPE_INDEX));
+        if (LYS_ERROR_SUCCESS != err)
         {
             return err;
         }
@@ -338,6 +1019,7 @@ static lys_error_t wait_for_ack()
     lys_param_t *p_param;
 
     err = msg_receive(&op, &p_param);
+    m_channel_owned = false;
     if (LYS_ERROR_SUCCESS != err)
     {
         return err;
@@ -358,30 +1040,70 @@ static lys_error_t msg_send_and_ack(lys_op_t op, const lys_param_t *p_param)
     {
         return err;
     }
-    msg_send();
-    return wait_for_ack();
-}
+    err = msg_send(LYS_RTT_CHANNEL);
+    if (LYS_ERROR_SUCCESS != err)
+    {
+        return err;
+    }
+    return wait_for_ack();
+}
+
+
+// Sends the LOG or LOG_FMT message that is in m_buf. Log messages are only
+// ACK'd if they share the control channel; the bulk channel is flow-controlled
+// by the size of its RTT buffer instead.
+static lys_error_t log_msg_send(void)
+{
+    lys_error_t err = msg_send(LYS_LOG_RTT_CHANNEL);
+    if (LYS_ERROR_SUCCESS != err)
+    {
+        return err;
+    }
+#ifdef LYS_BULK_RTT_CHANNEL
+    m_channel_owned = false;
+    return LYS_ERROR_SUCCESS;
+#else
+    return wait_for_ack();
+#endif
+}
+
+
+static lys_error_t msg_receive_and_ack(lys_op_t *p_op, lys_param_t **p_param)
+{
+    lys_error_t err = msg_receive(p_op, p_param);
+    if (LYS_ERROR_SUCCESS != err)
+    {
+        return err;
+    }
+    ack_msg_send();
+    return LYS_ERROR_SUCCESS;
+}
+
+
+// Sends LYS_OP_RESULT if the results haven't been started yet.
+static lys_error_t result_state_enter(void)
+{
+    lys_error_t err;
+
+    if (LYS_STATE_RUNNING == m_state)
+    {
+        err = msg_send_and_ack(LYS_OP_RESULT, NULL);
+        if (LYS_ERROR_SUCCESS != err)
+        {
+            error();
+            return err;
+        }
+        m_state = LYS_STATE_RESULT;
+    }
 
-
-static lys_error_t msg_receive_and_ack(lys_op_t *p_op, lys_param_t **p_param)
-{
-    lys_error_t err = msg_receive(p_op, p_param);
-    if (LYS_ERROR_SUCCESS != err)
+    if (LYS_STATE_RESULT != m_state)
     {
-        return err;
+        return LYS_ERROR_INVALID_STATE;
     }
-    ack_msg_send();
     return LYS_ERROR_SUCCESS;
 }
 
 
-static void error(void)
-{
-    m_error = true;
-    m_state = LYS_STATE_UNKNOWN;
-}
-
-
 static lys_error_t str_copy(lys_str_t *lhs, const lys_str_t *rhs)
 {
     if ((rhs->len > LYS_MAX_STR_LEN) || (0 == rhs->len))
@@ -427,9 +1149,31 @@ static lys_error_t array_copy(lys_array_t *lhs, const lys_array_t *rhs)
 
 void lys_init(void)
 {
-    m_buf_index = 0;
-    m_state     = LYS_STATE_UNKNOWN;
-    m_error     = false;
+    m_buf_index     = 0;
+    m_state         = LYS_STATE_UNKNOWN;
+    m_error         = false;
+    m_telemetry_seq = 0;
+    m_params_index  = 0;
+
+    m_tx_head        = 0;
+    m_tx_tail        = 0;
+    m_tx_ack_pending = false;
+    m_channel_owned  = false;
+    m_rx_ack_len     = 0;
+    m_tx_dropped     = 0;
+
+    m_cache_mode     = CACHE_MODE_NONE;
+    m_cache_offset   = 0;
+    m_cache_overflow = false;
+    cache_check();
+
+#ifdef LYS_BULK_RTT_CHANNEL
+    SEGGER_RTT_ConfigUpBuffer(LYS_BULK_RTT_CHANNEL,
+        "LysBulk",
+        m_bulk_rtt_buf,
+        sizeof(m_bulk_rtt_buf),
+        SEGGER_RTT_MODE_NO_BLOCK_SKIP);
+#endif
 }
 
 
@@ -466,25 +1210,96 @@ lys_error_t lys_param_wait(lys_param_t **p_param, bool *p_param_set)
         return LYS_ERROR_INVALID_STATE;
     }
 
-    err = msg_receive_and_ack(&op, p_param);
-    if (LYS_ERROR_SUCCESS != err)
+    if (CACHE_MODE_REPLAY == m_cache_mode)
     {
-        error();
+        err = cache_param_next(p_param, p_param_set);
+        if (LYS_ERROR_SUCCESS != err)
+        {
+            error();
+        }
         return err;
     }
 
+    if (0 != m_params_index)
+    {
+        // The rest of a LYS_OP_PARAMS message is used before reading again.
+        op = LYS_OP_PARAMS;
+    }
+    else
+    {
+        err = msg_receive_and_ack(&op, p_param);
+        if (LYS_ERROR_SUCCESS != err)
+        {
+            error();
+            return err;
+        }
+        if (LYS_OP_PARAMS == op)
+        {
+            m_params_index = LYS_PARAMS_INDEX;
+        }
+    }
+
+    if ((CACHE_MODE_PATCH == m_cache_mode) &&
+        ((LYS_OP_PARAM == op) || (LYS_OP_PARAMS == op)))
+    {
+        // Params can't be mixed with patches.
+        op = LYS_OP_UNKNOWN;
+    }
+
     switch (op)
     {
     case LYS_OP_START:
+        if (CACHE_MODE_PATCH == m_cache_mode)
+        {
+            // The cached params are passed on before entering RUNNING.
+            cache_seal();
+            m_cache_mode   = CACHE_MODE_REPLAY;
+            m_cache_offset = 0;
+            return lys_param_wait(p_param, p_param_set);
+        }
+        if (CACHE_MODE_NONE == m_cache_mode)
+        {
+            // The session had no params.
+            m_cache.len      = 0;
+            m_cache_overflow = false;
+        }
+        if (!m_cache_overflow)
+        {
+            cache_seal();
+        }
+        m_cache_mode = CACHE_MODE_NONE;
         *p_param_set = false;
         m_state      = LYS_STATE_RUNNING;
         break;
     case LYS_OP_PARAM:
+        cache_append(&m_buf[LYS_PARAM_TYPE_INDEX],
+            (m_buf[LYS_LEN_INDEX] - LYS_PARAM_TYPE_INDEX));
+        *p_param_set = true;
+        break;
+    case LYS_OP_CACHE:
+        err = cache_patch();
+        if (LYS_ERROR_SUCCESS != err)
+        {
+            *p_param_set = false;
+            error();
+            return err;
+        }
+        return lys_param_wait(p_param, p_param_set);
+    case LYS_OP_PARAMS:
+        err = packed_param_next(p_param);
+        if (LYS_ERROR_SUCCESS != err)
+        {
+            *p_param_set = false;
+            error();
+            return err;
+        }
         *p_param_set = true;
         break;
     case LYS_OP_UNKNOWN:
     case LYS_OP_INIT:
     case LYS_OP_LOG:    
+    case LYS_OP_LOG_FMT:
+    case LYS_OP_TELEMETRY:
     case LYS_OP_RESULT:
     case LYS_OP_FINISHED:
     case LYS_OP_ACK:
@@ -526,8 +1341,13 @@ lys_error_t lys_params_receive(const lys_param_t *p_params, uint32_t param_count
         {
         case LYS_PARAM_TYPE_UINT32:
         case LYS_PARAM_TYPE_INT32:
+        case LYS_PARAM_TYPE_UINT16:
+        case LYS_PARAM_TYPE_INT16:
         case LYS_PARAM_TYPE_UINT8:
         case LYS_PARAM_TYPE_INT8:
+        case LYS_PARAM_TYPE_UINT64:
+        case LYS_PARAM_TYPE_INT64:
+        case LYS_PARAM_TYPE_FLOAT32:
         case LYS_PARAM_TYPE_BOOL:
             err = lys_param_len_lookup(expected_type, &param_len);
             if (LYS_ERROR_SUCCESS != err)
@@ -543,6 +1363,7 @@ lys_error_t lys_params_receive(const lys_param_t *p_params, uint32_t param_count
             memcpy(p_local_data, p_received_param->data.p_uint8, param_len);
             break;
         case LYS_PARAM_TYPE_STRING:
+        case LYS_PARAM_TYPE_BYTES:
             err = str_copy(p_params[i].data.p_str,
                 p_received_param->data.p_str);
             if (LYS_ERROR_SUCCESS != err)
@@ -585,20 +1406,9 @@ lys_error_t lys_param_send(const lys_param_t *p_param)
 {
     lys_error_t err;
 
-    if (LYS_STATE_RUNNING == m_state)
-    {
-        err = msg_send_and_ack(LYS_OP_RESULT, NULL);
-        if (LYS_ERROR_SUCCESS != err)
-        {
-            error();
-            return err;
-        }
-        m_state = LYS_STATE_RESULT;
-    }
-
-    if (LYS_STATE_RESULT != m_state)
+    if (LYS_ERROR_SUCCESS != (err=result_state_enter()))
     {
-        return LYS_ERROR_INVALID_STATE;
+        return err;
     }
 
     err = msg_send_and_ack(LYS_OP_PARAM, p_param);
@@ -614,14 +1424,56 @@ lys_error_t lys_param_send(const lys_param_t *p_param)
 lys_error_t lys_results_send(const lys_param_t *params, uint32_t param_count)
 {
     lys_error_t  err;
+    uint32_t     i = 0;
 
-    for (uint32_t i=0; i < param_count; i++)
+    while (i < param_count)
     {
-        err = lys_param_send(&params[i]);
+        uint32_t msg_len = LYS_PARAMS_INDEX;
+        uint32_t count   = 0;
+        uint32_t param_len;
+
+        // Take as many params as fit in one message.
+        while (((i + count) < param_count) &&
+            (LYS_ERROR_SUCCESS == param_len_get(&params[i + count], &param_len)) &&
+            (LYS_MAX_MSG_LEN >= (msg_len + 1 + param_len)))
+        {
+            msg_len += (1 + param_len);
+            count++;
+        }
+
+        if (2 > count)
+        {
+            // A lone param (or an invalid one) is sent on its own.
+            err = lys_param_send(&params[i]);
+            if (LYS_ERROR_SUCCESS != err)
+            {
+                return err;
+            }
+            i++;
+            continue;
+        }
+
+        if (LYS_ERROR_SUCCESS != (err=result_state_enter()))
+        {
+            return err;
+        }
+
+        err = params_msg_create(&params[i], count);
+        if (LYS_ERROR_SUCCESS != err)
+        {
+            return err;
+        }
+        err = msg_send(LYS_RTT_CHANNEL);
+        if (LYS_ERROR_SUCCESS == err)
+        {
+            err = wait_for_ack();
+        }
         if (LYS_ERROR_SUCCESS != err)
         {
+            error();
             return err;
         }
+        i += count;
     }
     return lys_finish();
 }
@@ -631,20 +1483,9 @@ lys_error_t lys_finish(void)
 {
     lys_error_t err;
 
-    if (LYS_STATE_RUNNING == m_state)
-    {
-        err = msg_send_and_ack(LYS_OP_RESULT, NULL);
-        if (LYS_ERROR_SUCCESS != err)
-        {
-            error();
-            return err;
-        }
-        m_state = LYS_STATE_RESULT;
-    }
-
-    if (LYS_STATE_RESULT != m_state)
+    if (LYS_ERROR_SUCCESS != (err=result_state_enter()))
     {
-        return LYS_ERROR_INVALID_STATE;
+        return err;
     }
 
     err = msg_send_and_ack(LYS_OP_FINISHED, NULL);
@@ -667,7 +1508,11 @@ lys_error_t lys_error_send()
     {
         return err;
     }
-    msg_send();
+    err = msg_send(LYS_RTT_CHANNEL);
+    if (LYS_ERROR_SUCCESS != err)
+    {
+        return err;
+    }
 
     return wait_for_ack();
 }
@@ -685,7 +1530,40 @@ lys_error_t lys_log_send(const lys_str_t *p_str)
     m_param.param_type = LYS_PARAM_TYPE_STRING;
     m_param.data.p_str = (lys_str_t*) p_str;
 
-    err = msg_send_and_ack(LYS_OP_LOG, &m_param);
+    err = msg_create(LYS_OP_LOG, &m_param);
+    if (LYS_ERROR_SUCCESS != err)
+    {
+        return err;
+    }
+
+    err = log_msg_send();
+    if (LYS_ERROR_SUCCESS != err)
+    {
+        error();
+        return err;
+    }
+    return LYS_ERROR_SUCCESS;
+}
+
+
+lys_error_t lys_log_fmt_send(uint16_t fmt_id,
+    const uint32_t *p_args,
+    uint32_t arg_count)
+{
+    lys_error_t err;
+
+    if ((LYS_STATE_WAIT_FOR_START == m_state) || (LYS_STATE_RESULT == m_state))
+    {
+        return LYS_ERROR_INVALID_STATE;
+    }
+
+    err = fmt_msg_create(fmt_id, p_args, arg_count);
+    if (LYS_ERROR_SUCCESS != err)
+    {
+        return err;
+    }
+
+    err = log_msg_send();
     if (LYS_ERROR_SUCCESS != err)
     {
         error();
@@ -695,6 +1573,170 @@ lys_error_t lys_log_send(const lys_str_t *p_str)
 }
 
 
+lys_error_t lys_telemetry_send(const lys_array_t *p_array, uint32_t timestamp)
+{
+    lys_error_t err;
+    uint32_t    item_len;
+    uint32_t    data_len;
+    uint16_t    seq;
+
+    if ((LYS_STATE_WAIT_FOR_START == m_state) || (LYS_STATE_RESULT == m_state))
+    {
+        return LYS_ERROR_INVALID_STATE;
+    }
+
+    if ((NULL == p_array) || (0 == p_array->item_count))
+    {
+        return LYS_ERROR_INVALID_PARAM;
+    }
+
+    err = lys_param_len_lookup(p_array->param_type, &item_len);
+    if (LYS_ERROR_SUCCESS != err)
+    {
+        return err;
+    }
+    else if (LYS_PARAM_VARIABLE_SIZE == item_len)
+    {
+        return LYS_ERROR_INVALID_PARAM;
+    }
+
+    data_len = (item_len * p_array->item_count);
+    if (LYS_MAX_TELEMETRY_DATA_LEN < data_len)
+    {
+        return LYS_ERROR_INVALID_PARAM;
+    }
+
+    seq = m_telemetry_seq++;
+
+    m_buf[LYS_LEN_INDEX]        = (LYS_TELEMETRY_DATA_INDEX + data_len);
+    m_buf[LYS_OP_INDEX]         = LYS_OP_TELEMETRY;
+    m_buf[LYS_PARAM_TYPE_INDEX] = p_array->param_type;
+    memcpy(&m_buf[LYS_TELEMETRY_SEQ_INDEX], &seq, sizeof(seq));
+    memcpy(&m_buf[LYS_TELEMETRY_TS_INDEX], &timestamp, sizeof(timestamp));
+    memcpy(&m_buf[LYS_TELEMETRY_DATA_INDEX], p_array->data.p_uint8, data_len);
+
+    // A single write is used so the message is either sent whole or dropped.
+    if (0 == SEGGER_RTT_Write(LYS_LOG_RTT_CHANNEL, m_buf, m_buf[LYS_LEN_INDEX]))
+    {
+        return LYS_ERROR_BUSY;
+    }
+    return LYS_ERROR_SUCCESS;
+}
+
+
+lys_error_t lys_log_queue(const lys_str_t *p_str)
+{
+    lys_error_t err;
+
+    if ((LYS_STATE_WAIT_FOR_START == m_state) || (LYS_STATE_RESULT == m_state))
+    {
+        return LYS_ERROR_INVALID_STATE;
+    }
+
+    m_param.param_type = LYS_PARAM_TYPE_STRING;
+    m_param.data.p_str = (lys_str_t*) p_str;
+
+    err = msg_create(LYS_OP_LOG, &m_param);
+    if (LYS_ERROR_SUCCESS != err)
+    {
+        return err;
+    }
+    return msg_queue();
+}
+
+
+lys_error_t lys_log_fmt_queue(uint16_t fmt_id,
+    const uint32_t *p_args,
+    uint32_t arg_count)
+{
+    lys_error_t err;
+
+    if ((LYS_STATE_WAIT_FOR_START == m_state) || (LYS_STATE_RESULT == m_state))
+    {
+        return LYS_ERROR_INVALID_STATE;
+    }
+
+    err = fmt_msg_create(fmt_id, p_args, arg_count);
+    if (LYS_ERROR_SUCCESS != err)
+    {
+        return err;
+    }
+    return msg_queue();
+}
+
+
+lys_error_t lys_param_queue(const lys_param_t *p_param)
+{
+    lys_error_t err;
+    uint32_t    result_len = 0;
+
+    if ((LYS_STATE_RUNNING != m_state) && (LYS_STATE_RESULT != m_state))
+    {
+        return LYS_ERROR_INVALID_STATE;
+    }
+
+    err = msg_create(LYS_OP_PARAM, p_param);
+    if (LYS_ERROR_SUCCESS != err)
+    {
+        return err;
+    }
+
+    if (LYS_STATE_RUNNING == m_state)
+    {
+        // The RESULT op is queued along with the first param.
+        result_len = LYS_MSG_NO_PARAM_LEN;
+    }
+
+    if (queue_free() < (result_len + m_buf_index))
+    {
+        m_tx_dropped++;
+        return LYS_ERROR_BUSY;
+    }
+
+    if (0 != result_len)
+    {
+        queue_push(m_result_buf);
+        m_state = LYS_STATE_RESULT;
+    }
+    queue_push(m_buf);
+    return LYS_ERROR_SUCCESS;
+}
+
+
+lys_error_t lys_process(void)
+{
+    lys_error_t err;
+
+    if (m_channel_owned)
+    {
+        return LYS_ERROR_BUSY;
+    }
+
+    do
+    {
+        err = tx_step();
+    } while ((LYS_ERROR_SUCCESS == err) && (m_tx_tail != m_tx_head));
+
+    if ((LYS_ERROR_SUCCESS == err) && m_tx_ack_pending)
+    {
+        return LYS_ERROR_BUSY;
+    }
+    return err;
+}
+
+
+uint32_t lys_queue_len(void)
+{
+    return (m_tx_head - m_tx_tail);
+}
+
+
+uint32_t lys_queue_dropped_count(void)
+{
+    return m_tx_dropped;
+}
+
+
 lys_error_t lys_param_len_lookup(lys_param_type_t param_type, uint32_t *p_len)
 {
     switch (param_type) {
@@ -704,17 +1746,34 @@ lys_error_t lys_param_len_lookup(lys_param_type_t param_type, uint32_t *p_len)
     case LYS_PARAM_TYPE_INT32:
         *p_len = sizeof(int32_t);
         break;
+    case LYS_PARAM_TYPE_UINT16:
+        *p_len = sizeof(uint16_t);
+        break;
+    case LYS_PARAM_TYPE_INT16:
+        *p_len = sizeof(int16_t);
+        break;
     case LYS_PARAM_TYPE_UINT8:
         *p_len = sizeof(uint8_t);
         break;
     case LYS_PARAM_TYPE_INT8:
         *p_len = sizeof(int8_t);
         break;
+    case LYS_PARAM_TYPE_UINT64:
+        *p_len = sizeof(uint64_t);
+        break;
+    case LYS_PARAM_TYPE_INT64:
+        *p_len = sizeof(int64_t);
+        break;
+    case LYS_PARAM_TYPE_FLOAT32:
+        *p_len = sizeof(float);
+        break;
     case LYS_PARAM_TYPE_BOOL:
         *p_len = sizeof(bool);
         break;
     case LYS_PARAM_TYPE_STRING:
     case LYS_PARAM_TYPE_ARRAY:
+    case LYS_PARAM_TYPE_BYTES:
+    case LYS_PARAM_TYPE_DELTA_ARRAY:
         *p_len = LYS_PARAM_VARIABLE_SIZE;
         break;
     default:
@@ -9,14 +9,55 @@
  *
  * LYS_OP_PARAM and LYS_OP_LOG messages are in the form:
  *     [LEN (1)][OP (1)][lys_param_type_t (1)][data (p)]
- *     where p is the length of the specified lys_param_type_t. NOTE: Strings of
- *     length zero are not allowed.
+ *     where p is the length of the specified lys_param_type_t. NOTE: Strings and
+ *     byte strings of length zero are not allowed.
  *
  * LYS_PARAM_TYPE_ARRAY messages are in the form:
  *     [LEN (1)][OP (1)][LYS_PARAM_TYPE_ARRAY (1)][lys_param_type_t (1)][data (n * p)]
  *     where n is the length of the array and p is the length of the specified
  *     lys_param_type_t. NOTE: Nested arrays, arrays of strings, and arrays of length
  *     zero are not allowed.
+ *
+ * LYS_PARAM_TYPE_DELTA_ARRAY messages are in the form:
+ *     [LEN (1)][OP (1)][LYS_PARAM_TYPE_DELTA_ARRAY (1)][lys_param_type_t (1)][varints]
+ *     where each item is sent as its difference from the previous item (the
+ *     first item's is from zero), zigzag-encoded and then split into 7-bit
+ *     groups, least significant first, with the high bit set on every byte but
+ *     the last. Only integer and bool items are allowed. Received delta arrays
+ *     are decoded and reported as LYS_PARAM_TYPE_ARRAY params.
+ *
+ * LYS_OP_LOG_FMT messages are in the form:
+ *     [LEN (1)][OP (1)][FMT_ID (2)][args (n * 4)]
+ *     where FMT_ID identifies a format string that is stored in the ELF file
+ *     instead of the device's flash and each arg is a 32-bit value. Use the
+ *     LYS_LOG_FMT macro to create them.
+ *
+ * LYS_OP_TELEMETRY messages are in the form:
+ *     [LEN (1)][OP (1)][lys_param_type_t (1)][SEQ (2)][TIMESTAMP (4)][data (n * p)]
+ *     where SEQ is incremented for every message and TIMESTAMP is an arbitrary
+ *     application-defined time. These messages are not ACK'd.
+ *
+ * LYS_OP_PARAMS messages pack several params into one message (and one ACK):
+ *     [LEN (1)][OP (1)][PLEN (1)][lys_param_type_t (1)][data (p)][PLEN (1)]...
+ *     where each PLEN is the length of one param including PLEN itself and the
+ *     rest of the param is the same as in a LYS_OP_PARAM message.
+ *
+ * LYS_OP_INIT messages have a flags byte:
+ *     [LEN (1)][OP (1)][FLAGS (1)][HASH (4)]
+ *     where LYS_INIT_FLAG_PARAMS tells the PC that LYS_OP_PARAMS messages can
+ *     be used for the init params. The flags byte is optional for the PC. The
+ *     HASH is only sent with LYS_INIT_FLAG_CACHE, which tells the PC that the
+ *     device still has the last params that it accepted (see
+ *     LYS_PARAM_CACHE_SIZE). The HASH is the 32-bit FNV-1a hash of those
+ *     params as [PLEN][lys_param_type_t][data] records.
+ *
+ * LYS_OP_CACHE messages tell a device that reported a HASH to use its cached
+ * params instead of receiving them again:
+ *     [LEN (1)][OP (1)][PLEN (1)][INDEX (1)][lys_param_type_t (1)][data (p)][PLEN (1)]...
+ *     where each record replaces the cached param at INDEX with one that has
+ *     the same length. A message without records changes nothing. After the
+ *     final LYS_OP_CACHE message the PC sends LYS_OP_START and the cached
+ *     params are passed on by lys_param_wait as if they had been received.
  */
 #ifndef LYS_H__
 #define LYS_H__
@@ -32,6 +73,38 @@ extern "C" {
 #if LYS_MAX_MSG_LEN > 255
     #error This library assumes that Lys message lengths will fit in a uint8_t.
 #endif
+#define LYS_MAX_FMT_ARGS  ((LYS_MAX_MSG_LEN - 4UL) / sizeof(uint32_t))
+#define LYS_MAX_TELEMETRY_DATA_LEN (LYS_MAX_MSG_LEN - 9UL)
+
+// Define LYS_BULK_RTT_CHANNEL (e.g. -DLYS_BULK_RTT_CHANNEL=1) to send LOG,
+// LOG_FMT, and TELEMETRY messages on their own RTT up buffer so that they can't
+// delay the control messages on channel 0. Log messages on the bulk channel
+// are not ACK'd. SEGGER_RTT_MAX_NUM_UP_BUFFERS must be large enough to include
+// the channel and the PC must be told to read it (see lcli.py's -b option).
+#ifdef LYS_BULK_RTT_CHANNEL
+    #ifndef LYS_BULK_RTT_BUF_SIZE
+        #define LYS_BULK_RTT_BUF_SIZE (1024UL)
+    #endif
+#endif
+
+// The size of the RAM ring buffer that holds the messages of the *_queue
+// functions until lys_process sends them. Must be a power of two that is at
+// least LYS_MAX_MSG_LEN.
+#ifndef LYS_TX_QUEUE_SIZE
+    #define LYS_TX_QUEUE_SIZE (256UL)
+#endif
+#if (LYS_TX_QUEUE_SIZE < LYS_MAX_MSG_LEN) || (LYS_TX_QUEUE_SIZE & (LYS_TX_QUEUE_SIZE - 1))
+    #error LYS_TX_QUEUE_SIZE must be a power of two that is at least LYS_MAX_MSG_LEN.
+#endif
+
+// The number of bytes of retained RAM that hold the last accepted init params
+// so that the PC only has to send the params that changed. The cache is in the
+// .lys_retained section, which the linker script must place in RAM with the
+// NOLOAD type so that it isn't cleared at startup. Params that don't fit
+// aren't cached and are always sent in full.
+#ifndef LYS_PARAM_CACHE_SIZE
+    #define LYS_PARAM_CACHE_SIZE (256UL)
+#endif
 
 
 // NOTE: These error codes are used by this C library and aren't part of the
@@ -41,6 +114,7 @@ typedef enum
     LYS_ERROR_SUCCESS = 0,
     LYS_ERROR_INVALID_STATE,
     LYS_ERROR_INVALID_PARAM,
+    LYS_ERROR_BUSY,
     LYS_ERROR_COUNT
 } lys_error_t;
 
@@ -68,6 +142,10 @@ typedef enum
     LYS_OP_PARAM,
     LYS_OP_ACK,
     LYS_OP_LOG,
+    LYS_OP_LOG_FMT,
+    LYS_OP_TELEMETRY,
+    LYS_OP_PARAMS,
+    LYS_OP_CACHE,
     LYS_OP_COUNT
 } lys_op_t;
 
@@ -81,6 +159,13 @@ typedef enum
     LYS_PARAM_TYPE_BOOL,
     LYS_PARAM_TYPE_STRING,
     LYS_PARAM_TYPE_ARRAY,
+    LYS_PARAM_TYPE_UINT16,
+    LYS_PARAM_TYPE_INT16,
+    LYS_PARAM_TYPE_UINT64,
+    LYS_PARAM_TYPE_INT64,
+    LYS_PARAM_TYPE_FLOAT32,
+    LYS_PARAM_TYPE_BYTES,
+    LYS_PARAM_TYPE_DELTA_ARRAY,
     LYS_PARAM_TYPE_COUNT
 } lys_param_type_t;
 
@@ -93,7 +178,12 @@ typedef struct
 } lys_str_t;
 
 
-// NOTE: Strings and nested arrays are not allowed.
+// LYS_PARAM_TYPE_BYTES is sent like a string but holds arbitrary data.
+typedef lys_str_t lys_bytes_t;
+
+
+// NOTE: Strings, byte strings, and nested arrays are not allowed. A
+//       LYS_PARAM_TYPE_DELTA_ARRAY param also uses this struct.
 typedef struct
 {
     lys_param_type_t param_type;
@@ -102,8 +192,13 @@ typedef struct
     {
         uint32_t *p_uint32;
         int32_t  *p_int32;
+        uint16_t *p_uint16;
+        int16_t  *p_int16;
         uint8_t  *p_uint8;
         int8_t   *p_int8;
+        uint64_t *p_uint64;
+        int64_t  *p_int64;
+        float    *p_float32;
         bool     *p_bool;
     } data;
 } lys_array_t;
@@ -116,10 +211,16 @@ typedef struct
     {
         uint32_t    *p_uint32;
         int32_t     *p_int32;
+        uint16_t    *p_uint16;
+        int16_t     *p_int16;
         uint8_t     *p_uint8;
         int8_t      *p_int8;
+        uint64_t    *p_uint64;
+        int64_t     *p_int64;
+        float       *p_float32;
         bool        *p_bool;
         lys_str_t   *p_str;
+        lys_bytes_t *p_bytes;
         lys_array_t *p_array;
     } data;
 } lys_param_t;
@@ -127,6 +228,9 @@ typedef struct
 
 #define LYS_PARAM_VARIABLE_SIZE    (0UL)
 
+#define LYS_INIT_FLAG_PARAMS       (0x01UL)
+#define LYS_INIT_FLAG_CACHE        (0x02UL)
+
 
 // Must be called first. Can be called multiple times.
 void lys_init(void);
@@ -141,6 +245,7 @@ bool lys_has_error(void);
 // Blocks until the next param is received. If there are no more params to
 // receive then p_param_set will be set to false. If the current state is not
 // LYS_STATE_WAIT_FOR_START then LYS_ERROR_INVALID_STATE will be returned.
+// When the PC uses the param cache the params are read from it after START.
 lys_error_t lys_param_wait(lys_param_t **p_param, bool *p_param_set);
 
 // Convenience function for receiving an array of params. Params are read from
@@ -153,7 +258,8 @@ lys_error_t lys_params_receive(const lys_param_t *p_params, uint32_t param_count
 lys_error_t lys_param_send(const lys_param_t *p_param);
 
 // Convenience function for sending an array of params. Params are sent from
-// the list in order. Sends the LYS_OP_FINISHED op when it's complete.
+// the list in order, packed into as few LYS_OP_PARAMS messages as possible.
+// Sends the LYS_OP_FINISHED op when it's complete.
 lys_error_t lys_results_send(const lys_param_t *params, uint32_t param_count);
 
 // Notifies the PC that there are no more result params to send.
@@ -165,11 +271,93 @@ lys_error_t lys_error_send(void);
 // Sends the specified string for logging purposes. Returns
 // LYS_ERROR_INVALID_STATE during the LYS_STATE_WAIT_FOR_START and
 // LYS_STATE_RESULT states. NOTE: If the PC has closed its RTT session then
-// this function will block indefinitely.
+// this function will block indefinitely. If LYS_BULK_RTT_CHANNEL is defined
+// then this function only blocks until there is room in the bulk RTT buffer.
 lys_error_t lys_log_send(const lys_str_t *p_str);
 
+// Sends a log message in compact form. The fmt_id is the offset of a format
+// string in the '.lys_fmt' section, which must be linked at address zero with
+// the INFO type so that it doesn't take up space on the device. Each arg is sent
+// as a 32-bit value and at most LYS_MAX_FMT_ARGS can be used. Has the same
+// state restrictions as lys_log_send. Use the LYS_LOG_FMT macro instead of
+// calling this function directly.
+lys_error_t lys_log_fmt_send(uint16_t fmt_id,
+    const uint32_t *p_args,
+    uint32_t arg_count);
+
+// Logs a printf-style message without sending the format string itself. The
+// PC resolves the string from the ELF file. Arguments are cast to uint32_t so
+// %s is not supported and floats must be passed via a union or memcpy.
+#define LYS_LOG_FMT(FMT, ...)                                                  \
+    do {                                                                       \
+        static const char m_lys_fmt[]                                          \
+            __attribute__((section(".lys_fmt"), used)) = FMT;                  \
+        const uint32_t m_lys_fmt_args[] = {__VA_ARGS__};                       \
+        lys_log_fmt_send((uint16_t)(uint32_t)m_lys_fmt,                        \
+            m_lys_fmt_args,                                                    \
+            (sizeof(m_lys_fmt_args) / sizeof(uint32_t)));                      \
+    } while (0)
+
+// Sends a batch of samples without waiting for an ACK. The array's items must
+// have a fixed size and fit in LYS_MAX_TELEMETRY_DATA_LEN bytes. If the RTT
+// buffer doesn't have room for the whole message then it is dropped and
+// LYS_ERROR_BUSY is returned; the sequence number is incremented either way so
+// the PC can count the dropped batches. This requires the RTT up buffer to use
+// the default SEGGER_RTT_MODE_NO_BLOCK_SKIP mode. Has the same state
+// restrictions as lys_log_send.
+lys_error_t lys_telemetry_send(const lys_array_t *p_array, uint32_t timestamp);
+
+// The *_queue functions below are non-blocking versions of the *_send
+// functions. The message is copied into a RAM ring buffer and sent later by
+// lys_process so the caller isn't stalled by a round trip to the PC. If the
+// ring buffer doesn't have room then the message is dropped, counted (see
+// lys_queue_dropped_count), and LYS_ERROR_BUSY is returned. Queued messages
+// are always sent before the next message of a blocking function, which
+// waits for the queue to empty first. The *_queue functions must be called
+// from the same context as the blocking functions, not from an interrupt
+// that can preempt them.
+
+// Queues a log string. Has the same state restrictions as lys_log_send.
+lys_error_t lys_log_queue(const lys_str_t *p_str);
+
+// Queues a compact log message. Has the same state restrictions as
+// lys_log_send. Use the LYS_LOG_FMT_QUEUE macro instead of calling this
+// function directly.
+lys_error_t lys_log_fmt_queue(uint16_t fmt_id,
+    const uint32_t *p_args,
+    uint32_t arg_count);
+
+// The non-blocking version of LYS_LOG_FMT.
+#define LYS_LOG_FMT_QUEUE(FMT, ...)                                            \
+    do {                                                                       \
+        static const char m_lys_fmt[]                                          \
+            __attribute__((section(".lys_fmt"), used)) = FMT;                  \
+        const uint32_t m_lys_fmt_args[] = {__VA_ARGS__};                       \
+        lys_log_fmt_queue((uint16_t)(uint32_t)m_lys_fmt,                       \
+            m_lys_fmt_args,                                                    \
+            (sizeof(m_lys_fmt_args) / sizeof(uint32_t)));                      \
+    } while (0)
+
+// Queues a result param. The LYS_OP_RESULT op is queued first if it hasn't
+// been sent yet. Has the same state restrictions as lys_param_send. Call
+// lys_finish (which waits for the queue to empty) when all of the results
+// have been queued.
+lys_error_t lys_param_queue(const lys_param_t *p_param);
+
+// Sends queued messages and handles their ACKs without blocking. Call it
+// regularly from the idle loop or from a low priority interrupt. It returns
+// immediately while a blocking function is using the RTT channel. Returns
+// LYS_ERROR_BUSY if messages are still queued.
+lys_error_t lys_process(void);
+
+// Returns the number of bytes that are waiting in the queue.
+uint32_t lys_queue_len(void);
+
+// Returns the number of messages that were dropped because the queue was full.
+uint32_t lys_queue_dropped_count(void);
+
 // Returns the param's expected len or LYS_PARAM_VARIABLE_SIZE if it's an
-// array or str.
+// array, delta array, str, or byte str.
 lys_error_t lys_param_len_lookup(lys_param_type_t param_type, uint32_t *p_len);
 
 #ifdef __cplusplus